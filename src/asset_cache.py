@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+# coding: utf-8
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from urllib import request as urllibrary
+from urllib.error import HTTPError
+
+__doc__ = """Keeps one local copy of every asset downloaded from the CDN.
+
+Downloaded files are stored once by the SHA-1 of their contents. Each URL
+also gets a small metadata file holding its ETag, Last-Modified date, size
+and the digest of its contents. The next request for the URL is sent as a
+conditional GET, so the server only sends the file again if it changed.
+
+Output files are hard links to the stored copy, so the same image in
+dl/ and ../asset_dl/upload is only stored once. Files that are changed in
+place after downloading, like icons that get framed, must be copied
+instead. Otherwise, the change would also change the stored copy.
+"""
+
+DEFAULT_CACHE_FOLDER = '../asset_dl/cache'
+
+# Results of AssetCache.fetch().
+(FETCH_FAIL, # The asset could not be downloaded.
+FETCH_NEW,   # The asset was downloaded because it is new or changed.
+FETCH_SAME,  # The server said that the stored asset is up to date.
+) = range(3)
+
+def urllib_get(url, headers={}):
+	"""Does an HTTP GET with urllib.
+
+	@param url: String. The URL to request.
+	@param headers: A dict of extra request headers.
+	@returns A tuple of (status code, content bytes, response headers dict).
+	"""
+
+	agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
+	headers = dict(headers, **{'user-agent': agent})
+	try:
+		with urllibrary.urlopen(urllibrary.Request(url, headers=headers)) as response:
+			return response.status, response.read(), dict(response.headers)
+	except HTTPError as error:
+		# urllib treats 304 Not Modified as an error.
+		return error.code, b'', dict(error.headers or {})
+
+class AssetCache(object):
+	"""A content-addressed store of downloaded assets."""
+
+	def __init__(my, folder=DEFAULT_CACHE_FOLDER):
+		my.folder = folder
+		my.blob_folder = os.path.join(folder, 'blobs')
+		my.meta_folder = os.path.join(folder, 'meta')
+
+	def _get_meta_path(my, url):
+		"""Gets the metadata filename of a URL."""
+		name = hashlib.md5(url.encode('utf-8')).hexdigest()
+		return os.path.join(my.meta_folder, name[:2], name + '.json')
+
+	def _get_blob_path(my, digest):
+		"""Gets the filename of stored contents by their digest."""
+		return os.path.join(my.blob_folder, digest[:2], digest)
+
+	def _write_atomic(my, path, data):
+		"""Writes a file so that it is never seen half-written."""
+		folder = os.path.dirname(path)
+		if not os.path.exists(folder):
+			os.makedirs(folder, exist_ok=True)
+		handle, temp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+		with os.fdopen(handle, 'wb') as outfile:
+			outfile.write(data)
+		os.replace(temp_path, path)
+
+	def get_meta(my, url):
+		"""Gets the stored metadata of a URL.
+
+		@returns A dict with the keys etag, last_modified, size and digest,
+			or None if the URL was never stored or its contents are missing.
+		"""
+
+		try:
+			with open(my._get_meta_path(url), 'r', encoding='utf-8') as infile:
+				meta = json.load(infile)
+		except (IOError, ValueError):
+			return None
+		blob_path = my._get_blob_path(meta['digest'])
+		if not os.path.isfile(blob_path) or \
+			os.path.getsize(blob_path) != meta['size']:
+			return None
+		return meta
+
+	def get_blob_path(my, url):
+		"""Gets the filename of the stored contents of a URL.
+
+		@returns A filename, or None if the URL is not stored.
+		"""
+
+		meta = my.get_meta(url)
+		return my._get_blob_path(meta['digest']) if meta else None
+
+	def get_conditional_headers(my, url):
+		"""Gets the request headers that ask for the URL only if it changed.
+
+		@returns A dict. It is empty if the URL is not stored.
+		"""
+
+		meta = my.get_meta(url)
+		headers = {}
+		if meta is None:
+			return headers
+		if meta['etag']:
+			headers['If-None-Match'] = meta['etag']
+		if meta['last_modified']:
+			headers['If-Modified-Since'] = meta['last_modified']
+		return headers
+
+	def store(my, url, content, headers={}):
+		"""Stores the contents of a URL.
+
+		@param url: String. The URL that the contents came from.
+		@param content: Bytes. The contents to store.
+		@param headers: A dict-like of the response headers.
+		@returns The digest of the contents.
+		"""
+
+		digest = hashlib.sha1(content).hexdigest()
+		blob_path = my._get_blob_path(digest)
+		if not os.path.isfile(blob_path):
+			my._write_atomic(blob_path, content)
+		meta = {
+			'url': url,
+			'etag': headers.get('ETag') or headers.get('etag'),
+			# Only the server's own validators are sent back to it.
+			'last_modified': headers.get('Last-Modified') or \
+				headers.get('last-modified'),
+			'size': len(content),
+			'digest': digest,
+		}
+		my._write_atomic(my._get_meta_path(url),
+			json.dumps(meta, sort_keys=True).encode('utf-8'))
+		return digest
+
+	def link(my, url, output_path, copy=False):
+		"""Puts the stored contents of a URL at a path.
+
+		@param url: String. A URL that was stored.
+		@param output_path: String. The file to make or replace.
+		@param copy: Bool. If True, the file is copied instead of linked.
+			Use this for files that will be changed in place.
+		@returns True on success, or False if the URL is not stored.
+		"""
+
+		blob_path = my.get_blob_path(url)
+		if blob_path is None:
+			return False
+		folder = os.path.dirname(output_path)
+		if folder and not os.path.exists(folder):
+			os.makedirs(folder, exist_ok=True)
+		if not copy and os.path.exists(output_path) and \
+			os.path.samefile(blob_path, output_path):
+			return True
+		temp_path = output_path + '.part'
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+		try:
+			if copy:
+				raise OSError('Copying was requested.')
+			os.link(blob_path, temp_path)
+		except OSError:
+			# Hard links can fail across drives. Fall back to a copy.
+			shutil.copyfile(blob_path, temp_path)
+		os.replace(temp_path, output_path)
+		return True
+
+	def fetch(my, url, output_path=None, transform=None, copy=False,
+		get=urllib_get):
+		"""Downloads a URL only if it changed, then puts it at a path.
+
+		@param url: String. The URL to download.
+		@param output_path: String. Where to put the file. If None, the
+			file is only stored in the cache.
+		@param transform: A function that takes and returns bytes. It is
+			applied to new downloads before storing, e.g. zlib.decompress.
+		@param copy: Bool. See link().
+		@param get: A function like urllib_get().
+		@returns FETCH_NEW, FETCH_SAME or FETCH_FAIL.
+		"""
+
+		try:
+			status, content, headers = get(url,
+				my.get_conditional_headers(url))
+			if status == 304:
+				result = FETCH_SAME
+			elif 200 <= status < 300:
+				if transform:
+					content = transform(content)
+				my.store(url, content, headers)
+				result = FETCH_NEW
+			else:
+				return FETCH_FAIL
+		except KeyboardInterrupt:
+			raise
+		except Exception as error:
+			print('Warning: Unable to fetch {0}: {1}'.format(url, error))
+			return FETCH_FAIL
+		if output_path and not my.link(url, output_path, copy):
+			return FETCH_FAIL
+		return result
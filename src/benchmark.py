@@ -0,0 +1,377 @@
+#!/usr/bin/python3
+# coding: utf-8
+import os
+import gc
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+from collections import OrderedDict
+from entry import *
+from getmaster_loader import MasterDataLoader, OUTPUT_FOLDER
+import parse_master
+
+__doc__ = """Benchmarks the getMaster to Lua module pipeline.
+
+A synthetic getMaster is generated from the _CSV_NAMES of the Entry
+classes, so it has the same sections and columns as the real data.
+Its size is set with --scale, which is the number of flower knights.
+
+Each stage of the pipeline is timed on its own:
+load: Loading and decoding every getMaster section.
+parse_*: Each MasterData._parse_* function.
+get_lua: FlowerKnight.get_lua() for every knight.
+page_*: Each MasterDataOutputter page.
+page_*_cached: Pages made again from the Lua texts that entries keep.
+
+Every stage runs --repeat times and the fastest time is kept. The Lua texts
+kept by the entries are dropped before each run, except in *_cached stages. Then each
+stage runs once more under tracemalloc for its peak memory and the
+number of memory blocks it left allocated. Tracing is slow, so it is not
+done while timing.
+
+Results are saved as JSON with the current git commit. Pass an older
+result file with --compare to print the change of every stage.
+
+Usage from the src folder:
+python benchmark.py --scale 1000 --repeat 3
+python benchmark.py --compare outputs/benchmarks/old.json
+"""
+
+BENCHMARK_FOLDER = os.path.join(OUTPUT_FOLDER, 'benchmarks')
+
+def _row(cls, values, names=None):
+	"""Makes a line of CSV for an Entry class.
+
+	@param cls: The Entry class whose _CSV_NAMES give the column order.
+	@param values: A dict of CSV names to strings. Other columns are '0'.
+	@param names: Overrides the column names. Defaults to cls._CSV_NAMES.
+	"""
+
+	names = names or cls._CSV_NAMES
+	return ','.join([values.get(name, '0') for name in names]) + ','
+
+def generate_getmaster(scale, seed=1):
+	"""Makes the sections of a synthetic getMaster.
+
+	@param scale: Integer. The number of flower knights. The number of
+		other entries grows with it.
+	@param seed: The random seed. The same seed makes the same data.
+	@returns A dict of section names to CSV text, like getMaster's JSON.
+	"""
+
+	rng = random.Random(seed)
+	sections = OrderedDict((name, []) for name in [
+		'masterCharacter', 'masterCharacterSkill',
+		'masterCharacterLeaderSkill', 'masterCharacterLeaderSkillDescription',
+		'masterCharacterEquipment', 'masterCharacterSkin',
+		'masterCharacterCategory', 'masterCharacterBook',
+		'masterFlowerMemory', 'masterFlowerMemorysAbilitys',
+		'masterAbility', 'masterCharacterSamePerson'])
+	for k in range(scale):
+		base = 100001 + k * 2
+		name = '"キャラ{0}"'.format(k)
+		can_bloom = k % 3 != 0
+		tiers = [(1, base), (2, base + 1)]
+		if can_bloom:
+			tiers.append((3, base + 300000))
+		for tier, char_id in tiers:
+			sections['masterCharacter'].append(_row(CharacterEntry, {
+				'id0': str(char_id), 'id1': str(char_id),
+				'charID1': str(k + 1), 'charID2': str(k + 1),
+				'libraryID': str(k + 1), 'baseName0': '"キャラ"',
+				'fullName': name, 'reading': '"きゃら"', 'variant': '""',
+				'family': str(k % 40), 'nation': str(k % 5 + 1),
+				'rarity': str(rng.choice((2, 3, 4, 5, 6))),
+				'type': str(k % 4 + 1), 'gift': str(k % 4 + 1),
+				'evolutionTier': str(tier),
+				'isFlowerKnight1': '0' if k % 17 == 0 else '1',
+				'skill1ID': str(500 + k),
+				'ability1ID': str(1000 + k), 'ability2ID': str(2000 + k),
+				'lvlOneHP': str(rng.randint(100, 999)),
+				'lvlMaxHP': str(rng.randint(1000, 9999)),
+				'lvlOneAtk': str(rng.randint(100, 999)),
+				'lvlMaxAtk': str(rng.randint(1000, 9999)),
+				'lvlOneDef': str(rng.randint(100, 999)),
+				'lvlMaxDef': str(rng.randint(1000, 9999)),
+				'lvlOneSpd': str(rng.randint(300, 600)),
+				'aff1MultHP': '120',
+				'date0': '"2020-01-{0:02} 00:00:00"'.format(k % 28 + 1),
+				'gameVersionWhenAdded': '"1.{0}.0"'.format(k % 50),
+				'isBloomedPowersOnly': str(k % 2),
+				'bloomingEnableFlag': '1', 'maxEvolutionFlag': '0',
+				}))
+		sections['masterCharacterSkill'].append(_row(SkillEntry, {
+			'uniqueID': str(500 + k), 'nameJapanese': '"スキル{0}"'.format(k),
+			'typeID': '1', 'descJapanese': '"説明{0}"'.format(k),
+			'date00': '"2020-01-01"'}))
+		sections['masterCharacterLeaderSkill'].append(_row(AbilityEntry, {
+			'uniqueID': str(1000 + k), 'ability1ID': str(k),
+			'ability2ID': str(k % 3)}))
+		sections['masterCharacterLeaderSkill'].append(_row(AbilityEntry, {
+			'uniqueID': str(2000 + k), 'ability1ID': str(k)}))
+		sections['masterCharacterLeaderSkillDescription'].append(
+			_row(AbilityDescEntry, {'id0': str(k), 'id1': str(k),
+			'ability1desc': '"効果{0}"'.format(k)}))
+		# Every 4th equipment is shared by two knights.
+		owners = str(k + 1) if k % 4 else '{0}|{1}'.format(k, k + 1)
+		sections['masterCharacterEquipment'].append(_row(EquipmentEntry, {
+			'id0': str(k), 'name': '"装備{0}"'.format(k),
+			'equipID': str(380000 + k) if k % 5 else str(1000000 + k),
+			'owners': owners, 'classification2': ('21', '30', '10')[k % 3],
+			'desc': '"説明"', 'isPersonalEquip': '1'}))
+		sections['masterCharacterSkin'].append(_row(SkinEntry, {
+			'uniqueID': str(base * 1000 + 1), 'libraryID': str(k + 1),
+			'replaceID': str(base), 'isSkin': str(k % 3),
+			'isDiffVer': str(k % 2), 'isExclusive': str((k + 1) % 2),
+			'skinName': '"別バージョン"'}))
+		# The last two columns of a flower memory are made by the parser.
+		sections['masterFlowerMemory'].append(_row(FlowerMemoryEntry, {
+			'id': str(k), 'flowerMemoryID': str(1000000 + k),
+			'name': '"メモリー{0}"'.format(k), 'readingName': '"めもりー"',
+			'rarity': str(k % 4 + 3), 'orderNum': str(k),
+			'growthType': '"normal"', 'desc': '"desc"'},
+			FlowerMemoryEntry._CSV_NAMES[:-2]))
+		for limit_break, ability_id in (('0', 100 + k), ('4', 200 + k)):
+			sections['masterFlowerMemorysAbilitys'].append(_row(
+				FlowerMemoryAbilityLookup, {'id': str(k), 'flowerMemoryID': str(k),
+				'limitBreakVal': limit_break, 'abilityId': str(ability_id)}))
+		sections['masterAbility'].append(_row(FlowerMemoryAbilityEntry, {
+			'id': str(100 + k), 'name': '"名"', 'effectID': '1',
+			'desc': '"d"'}))
+		sections['masterCharacterSamePerson'].append(_row(BlessedOathLookup, {
+			'sameCharacterID': str(k + 1), 'name': '"名{0}"'.format(k),
+			'marriageBlessingFlag': str(k % 2)}))
+	for k in range(1, 41):
+		sections['masterCharacterCategory'].append(
+			'{0},"科{0}",'.format(k))
+	sections['masterCharacterBook'].append('1,2,3,4,5,"花言葉",')
+	return OrderedDict((name, '\n'.join(lines) + '\n') \
+		for name, lines in sections.items())
+
+def write_getmaster(sections, folder):
+	"""Saves the sections as zlib compressed getMaster JSON.
+
+	@param folder: The folder to put the inputs folder into.
+	"""
+
+	inputs = os.path.join(folder, 'inputs')
+	os.makedirs(inputs, exist_ok=True)
+	with open(os.path.join(inputs, 'getMaster'), 'wb') as outfile:
+		outfile.write(zlib.compress(json.dumps(sections,
+			ensure_ascii=False).encode('utf-8')))
+
+def get_git_commit():
+	"""Gets the current git commit and whether there are local changes.
+
+	@returns A tuple of (commit hash or None, Boolean).
+	"""
+
+	src_dir = os.path.dirname(os.path.abspath(__file__))
+	try:
+		commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+			cwd=src_dir, stderr=subprocess.DEVNULL).decode().strip()
+		dirty = subprocess.check_output(['git', 'status', '--porcelain',
+			'--untracked-files=no'], cwd=src_dir,
+			stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None, False
+	return commit, bool(dirty)
+
+class Benchmark(object):
+	"""Runs the pipeline stages and stores their measurements."""
+
+	def __init__(my, repeat=3):
+		my.repeat = max(1, repeat)
+		my.results = OrderedDict()
+
+	def measure(my, name, func, setup=None):
+		"""Measures one stage.
+
+		@param name: String. The name of the stage in the results.
+		@param func: A function without arguments that runs the stage.
+			It must be safe to call repeatedly.
+		@param setup: An optional function without arguments that is run
+			before every call to func. It is not measured.
+		@returns The result of the last call to func.
+		"""
+
+		seconds = []
+		for i in range(my.repeat):
+			if setup:
+				setup()
+			gc.collect()
+			start = time.perf_counter()
+			result = func()
+			seconds.append(time.perf_counter() - start)
+			del result
+		if setup:
+			setup()
+		gc.collect()
+		blocks = sys.getallocatedblocks()
+		tracemalloc.start()
+		result = func()
+		current, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		my.results[name] = OrderedDict([
+			('seconds', min(seconds)),
+			('mean_seconds', sum(seconds) / len(seconds)),
+			('peak_bytes', peak),
+			('retained_bytes', current),
+			('retained_blocks', sys.getallocatedblocks() - blocks),
+			])
+		print('{0:<36} {1:9.4f} s  peak {2:10.1f} KiB'.format(
+			name, min(seconds), peak / 1024.0))
+		return result
+
+def _clear_lua_caches(master_data):
+	"""Drops the Lua texts that the entries and knights keep.
+
+	Otherwise every run of a page after the first only reads the texts
+	that the first run made.
+	"""
+
+	md = master_data
+	for collection in [md.knights, md.characters, md.skills, md.abilities,
+		md.ability_descs, md.equipment, md.skins, md.flower_memories,
+		md.memory_abilities, md.bless_oath]:
+		if hasattr(collection, 'values'):
+			collection = collection.values()
+		for item in collection:
+			getattr(item, '_lua', {}).clear()
+
+def run_pipeline(bench):
+	"""Runs every stage of the pipeline in the current folder.
+
+	The current folder must have the inputs folder of a getMaster.
+	"""
+
+	def load():
+		loader = MasterDataLoader()
+		return {name: loader.master_json[name] \
+			for name in loader.master_json}
+	api_data = bench.measure('load', load)
+	lines = {name: [line for line in api_data[name].split('\n') if line] \
+		for name in api_data if type(api_data[name]) is str}
+
+	master_data = parse_master.MasterData(use_cache=False)
+	def parse(method, *sections):
+		def run():
+			if method == '_parse_flower_memories':
+				master_data.flower_memories = []
+			getattr(master_data, method)(*[lines[s] for s in sections])
+		return run
+	for method, sections in [
+		('_parse_skill_entries', ['masterCharacterSkill']),
+		('_parse_ability_entries', ['masterCharacterLeaderSkill']),
+		('_parse_ability_desc_entries',
+			['masterCharacterLeaderSkillDescription']),
+		('_parse_equipment_entries', ['masterCharacterEquipment']),
+		('_parse_skin_entries', ['masterCharacterSkin']),
+		('_parse_character_entries', ['masterCharacter']),
+		('_parse_flower_memories',
+			['masterFlowerMemory', 'masterFlowerMemorysAbilitys']),
+		('_parse_memory_abilities', ['masterAbility']),
+		('_parse_blessed_oath_flag', ['masterCharacterSamePerson']),
+		]:
+		bench.measure(method.replace('_parse_', 'parse_', 1),
+			parse(method, *sections))
+	# Parsing again made new entries. Drop tables built from the old ones.
+	master_data.tables = {}
+
+	def reset():
+		_clear_lua_caches(master_data)
+	bench.measure('get_lua', lambda: [knight.get_lua() \
+		for knight in master_data.knights.values()], reset)
+
+	outputter = master_data.outputter
+	for page in ['get_skill_list_page', 'get_bundled_ability_list_page',
+		'get_master_char_data_page', 'get_equipment_list_page',
+		'get_equipment_stats_list_page', 'get_user_equip_list_page',
+		'get_personal_equip_list_page', 'get_flower_memories_list_page',
+		'get_flower_memories_abilities_page', 'get_eternal_oath_page',
+		'get_skin_info_page', 'get_char_list_page']:
+		bench.measure(page.replace('get_', 'page_', 1),
+			getattr(outputter, page), reset)
+	bench.measure('page_master_char_data_nations', lambda: [
+		outputter.get_master_char_data_nation_page(nation) \
+		for nation in range(1, 6)], reset)
+	# The same pages again, reusing the Lua texts of the runs above.
+	bench.measure('page_master_char_data_cached',
+		outputter.get_master_char_data_page)
+	bench.measure('page_master_char_data_nations_cached', lambda: [
+		outputter.get_master_char_data_nation_page(nation) \
+		for nation in range(1, 6)])
+
+def compare(results, old_results):
+	"""Prints how much every stage changed against older results."""
+	print('\n{0:<36} {1:>10} {2:>10} {3:>8}'.format(
+		'stage', 'old s', 'new s', 'change'))
+	old_stages = old_results['stages']
+	for name, stage in results['stages'].items():
+		if name not in old_stages:
+			continue
+		old_seconds = old_stages[name]['seconds']
+		change = stage['seconds'] / old_seconds if old_seconds else 0.0
+		print('{0:<36} {1:10.4f} {2:10.4f} {3:7.2f}x'.format(
+			name, old_seconds, stage['seconds'], change))
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=
+		'Benchmarks the getMaster to Lua module pipeline.')
+	parser.add_argument('-n', '--scale', type=int, default=1000,
+		help='The number of flower knights to generate.')
+	parser.add_argument('-r', '--repeat', type=int, default=3,
+		help='The number of timed runs of each stage.')
+	parser.add_argument('-o', '--output',
+		help='The JSON file to save the results to.')
+	parser.add_argument('-c', '--compare',
+		help='An older JSON result file to compare against.')
+	args = parser.parse_args(argv)
+
+	commit, dirty = get_git_commit()
+	output = args.output or os.path.join(BENCHMARK_FOLDER,
+		'{0}-{1}.json'.format(datetime.now().strftime('%Y%m%d-%H%M%S'),
+		(commit or 'unknown')[:10]))
+	output = os.path.abspath(output)
+
+	bench = Benchmark(args.repeat)
+	old_cwd = os.getcwd()
+	with tempfile.TemporaryDirectory() as folder:
+		start = time.perf_counter()
+		write_getmaster(generate_getmaster(args.scale), folder)
+		print('Generated {0} flower knights in {1:.2f} s.'.format(
+			args.scale, time.perf_counter() - start))
+		os.chdir(folder)
+		try:
+			run_pipeline(bench)
+		finally:
+			os.chdir(old_cwd)
+
+	results = OrderedDict([
+		('commit', commit),
+		('dirty', dirty),
+		('date', datetime.now().isoformat()),
+		('python', platform.python_version()),
+		('scale', args.scale),
+		('repeat', bench.repeat),
+		('stages', bench.results),
+		])
+	os.makedirs(os.path.dirname(output), exist_ok=True)
+	with open(output, 'w', encoding='utf-8') as outfile:
+		json.dump(results, outfile, indent=1)
+	print('Wrote the results to ' + output)
+
+	if args.compare:
+		with open(args.compare, 'r', encoding='utf-8') as infile:
+			compare(results, json.load(infile))
+
+if __name__ == '__main__':
+	main()
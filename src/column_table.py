@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+# coding: utf-8
+from array import array
+from collections import OrderedDict
+
+__doc__ = """Stores a section of the master data by column.
+
+A ColumnTable holds one list per name in an Entry class's _CSV_NAMES.
+Columns where every value is a plain integer are also converted to ints
+once and kept in an array next to the strings. Filters always see the
+strings, so they do not depend on which columns happen to be numeric in
+a given getMaster.
+
+Filtering and grouping are done one column at a time, so an outputter can
+ask for "every row whose classification2 is 21 or 30" or "every row
+grouped by owner" in a single pass over the data instead of rescanning
+the list of entries for every key it is interested in.
+
+Rows are referred to by their index. The index of a row is the same as
+the index of its Entry in the list that the table was made from.
+"""
+
+def _to_int_column(values):
+	"""Converts a column of strings into an array of ints.
+
+	@param values: A list of strings.
+	@returns An array of ints, or None if any value would not convert back
+		into the exact same string.
+	"""
+
+	try:
+		ints = array('q', [int(val) for val in values])
+	except (ValueError, OverflowError):
+		return None
+	# Strings like "007" or "+7" have to stay as they are.
+	for val, num in zip(values, ints):
+		if str(num) != val:
+			return None
+	return ints
+
+class ColumnTable(object):
+	"""A section of the master data stored as one array per column."""
+
+	def __init__(my, entries, names=None):
+		"""Constructor.
+
+		@param entries: A list of Entry instances of the same class.
+		@param names: A list of CSV names to store. Defaults to every name in
+			the entries' _CSV_NAMES. When there are no entries, names must be
+			given for the table to have any columns.
+		"""
+
+		my.entries = list(entries)
+		if names is None:
+			names = my.entries[0]._CSV_NAMES if my.entries else []
+		my.columns = OrderedDict()
+		my.int_columns = {}
+		for name in names:
+			values = [getattr(entry, name) for entry in my.entries]
+			my.columns[name] = values
+			ints = _to_int_column(values) if values else None
+			if ints is not None:
+				my.int_columns[name] = ints
+
+	def __len__(my):
+		return len(my.entries)
+
+	def __getitem__(my, name):
+		"""Gets a whole column of strings by its CSV name."""
+		return my.columns[name]
+
+	def get_ints(my, name):
+		"""Gets a whole column as ints.
+
+		@returns An array of ints, or None if the column is not numeric.
+		"""
+
+		return my.int_columns.get(name)
+
+	def where(my, rows=None, **conditions):
+		"""Finds the rows matching every condition.
+
+		Each keyword is a column name. Its value is the condition.
+		A callable is called with the column value and must return a bool.
+		A set, frozenset, list or tuple matches any of its members.
+		Anything else must be equal to the column value.
+		Column values are always strings.
+
+		Example: table.where(classification2=set(['21', '30']))
+
+		@param rows: A list of row indices to narrow down. Defaults to all.
+		@returns A list of row indices in ascending order.
+		"""
+
+		if rows is None:
+			rows = range(len(my.entries))
+		rows = list(rows)
+		for name, cond in conditions.items():
+			column = my.columns[name]
+			if callable(cond):
+				rows = [i for i in rows if cond(column[i])]
+			elif isinstance(cond, (set, frozenset, list, tuple)):
+				cond = frozenset(cond)
+				rows = [i for i in rows if column[i] in cond]
+			else:
+				rows = [i for i in rows if column[i] == cond]
+		return rows
+
+	def group_by(my, name, rows=None, sep=None):
+		"""Groups rows by the value of one column.
+
+		@param name: The column to group by.
+		@param rows: A list of row indices to group. Defaults to all.
+		@param sep: A string. When given, each value is split by it and the
+			row is put into the group of each distinct piece. Empty pieces
+			are skipped. For example, use sep='|' to group equipment by owner.
+		@returns An OrderedDict of column values to lists of row indices.
+			Groups are ordered by first appearance. Each list of rows is in
+			ascending order.
+		"""
+
+		if rows is None:
+			rows = range(len(my.entries))
+		column = my.columns[name]
+		groups = OrderedDict()
+		if sep is None:
+			for i in rows:
+				groups.setdefault(column[i], []).append(i)
+		else:
+			for i in rows:
+				# A row joins each group only once.
+				for key in set(column[i].split(sep)):
+					if key:
+						groups.setdefault(key, []).append(i)
+		return groups
+
+	def take(my, name, rows):
+		"""Gets the values of one column at the given rows."""
+		column = my.columns[name]
+		return [column[i] for i in rows]
+
+	def get_entries(my, rows):
+		"""Gets the Entry instances at the given rows."""
+		return [my.entries[i] for i in rows]
@@ -3,13 +3,18 @@
 import os
 import re
 import sys
+import json
 import math
 import zlib
+import threading
 import parse_master
 from hashlib import md5
 from base64 import b64decode
 from collections import OrderedDict
 from urllib import request as urllibrary
+from concurrent.futures import ThreadPoolExecutor
+from asset_cache import AssetCache, FETCH_FAIL, FETCH_SAME, urllib_get
+from tracing import traced
 
 try:
 	import imaging
@@ -18,17 +23,33 @@ except ImportError:
 	_HAS_LIB = False
 	print('Imaging script is unavailable. The generated icon would be frameless.\n')
 
+try:
+	# Keeps connections alive and rate limits each host.
+	from networking import DownloadEngine
+except ImportError:
+	DownloadEngine = None
+
 IMAGE_ASSET_DIRECTORY = "../asset_dl/upload"
 VOICE_ASSET_DIRECTORY = "../asset_dl/mp3"
 IMAGE_DOWNLOAD = True
 VOICE_DOWNLOAD = True
 DOWNLOAD_TEST = False
+# The number of voice lines that are downloaded at the same time.
+VOICE_WORKERS = 8
+# The number of voice requests per second sent to the CDN.
+VOICE_RATE = 4.0
+# Lists the voice lines finished so far. It only exists while a run is
+# unfinished, so that the next run can resume where it stopped.
+VOICE_JOURNAL_FILENAME = os.path.join(VOICE_ASSET_DIRECTORY, 'voiceJournal.jsonl')
+# Lists the voice lines that failed in the last run. See retryFailedVoice().
+VOICE_FAILURE_FILENAME = os.path.join(VOICE_ASSET_DIRECTORY, 'voiceFailures.json')
 
 (IMG_ICON,IMG_PORTRAIT,IMG_FULLCG) = range(3)
 
 class DownloadImage(object):
 	def __init__(my,dryRun=False):
 		my.dryRun = dryRun
+		my.cache = AssetCache()
 		my.getCharaURL = "http://dugrqaqinbtcq.cloudfront.net/product/ynnFQcGDLfaUcGhp/assets/ultra/images/character/dmm/{0}/{1}.bin"
 		my.getEquipURL = "http://dugrqaqinbtcq.cloudfront.net/product/ynnFQcGDLfaUcGhp/assets/ultra/images/item/100x100/{0}.png"
 		my.imgDirLink  = { IMG_FULLCG:'stand',  IMG_PORTRAIT:'stand_m'  , IMG_ICON:'i' }
@@ -75,31 +96,42 @@ class DownloadImage(object):
 		
 		return my.getDownloadImage(ImgFileLink,ImgFileName)
 		
+	@traced
 	def getDownloadImage(my,inputLink,outputImageName,getBinary=False,decFlag=False):
+		"""Downloads an image through the asset cache.
+
+		The image is only transferred if it is new or changed on the server.
+		With getBinary, the filename of the cached image is returned and
+		nothing is written to the upload folder.
+		"""
+
 		if not os.path.exists(IMAGE_ASSET_DIRECTORY): os.makedirs(IMAGE_ASSET_DIRECTORY)
 		outputFile = os.path.join(IMAGE_ASSET_DIRECTORY, outputImageName)
 		downloadText = "Downloaded "
 
+		# Dry runs and binary requests only fill the cache.
+		linkPath = None if my.dryRun or getBinary else outputFile
 		try:
-			imgBuffer = urllibrary.urlopen(inputLink).read()
-			if decFlag: imgBuffer = zlib.decompress(imgBuffer)
+			result = my.cache.fetch(inputLink, linkPath,
+				zlib.decompress if decFlag else None)
 		except KeyboardInterrupt:
 			print("Download interrupted by user")
-		except:
+			return
+		if result == FETCH_FAIL:
 			print("Unable to download " + outputImageName)
-		else:
-			if my.dryRun:
-				downloadText = "Test d" + downloadText[1:-3]+ " "
-			elif not getBinary:
-				with open(outputFile,'wb') as imgFile:
-					imgFile.write(imgBuffer)
-			elif getBinary:
-				return imgBuffer
-				outputImageName += " to memory, framing..."
-			print(downloadText + outputImageName)
+			return
+		if my.dryRun:
+			downloadText = "Test d" + downloadText[1:-3]+ " "
+		elif getBinary:
+			return my.cache.get_blob_path(inputLink)
+		elif result == FETCH_SAME:
+			downloadText = "Unchanged, linked "
+		print(downloadText + outputImageName)
 
+	@traced
 	def iconFrame(my,inputID,rarity,atk_type):
 		filepath = os.path.join(IMAGE_ASSET_DIRECTORY, "icon_{0}.png".format(inputID))
+		# This is the cached file. The framed icon is saved separately.
 		filedata = my.downloadCharaImage(inputID,IMG_ICON,True)
 
 		if not my.dryRun:
@@ -112,6 +144,65 @@ class DownloadImage(object):
 				print("Successfully framed {0}.png".format(inputID))
 
 
+class VoiceJournal(object):
+	"""Records finished voice downloads so an interrupted run can resume.
+
+	Each finished download is appended as one line of JSON and flushed
+	right away, so the journal survives a crash or Ctrl+C.
+	"""
+
+	def __init__(my, filename=VOICE_JOURNAL_FILENAME):
+		my.filename = filename
+		my._file = None
+		my._lock = threading.Lock()
+
+	def load(my):
+		"""Reads which downloads of an unfinished run are done.
+
+		@returns A set of (remote link, local file) tuples.
+		"""
+
+		done = set()
+		if not os.path.exists(my.filename):
+			return done
+		with open(my.filename, 'r', encoding='utf-8') as infile:
+			for line in infile:
+				try:
+					job = json.loads(line)
+				except ValueError:
+					# The last line may be cut short by a crash.
+					continue
+				if job.get('done'):
+					done.add((job['remotelink'], job['localfile']))
+		return done
+
+	def record(my, queue, done):
+		"""Adds a finished download to the journal. It is thread safe.
+
+		@param queue: A voice link dict. See DownloadAudio.addVoiceLink().
+		@param done: Bool. False if the download failed.
+		"""
+
+		line = json.dumps({'remotelink': queue['remotelink'],
+			'localfile': queue['localfile'], 'done': done})
+		with my._lock:
+			if my._file is None:
+				my._file = open(my.filename, 'a', encoding='utf-8')
+			my._file.write(line + '\n')
+			my._file.flush()
+
+	def close(my):
+		with my._lock:
+			if my._file is not None:
+				my._file.close()
+				my._file = None
+
+	def clear(my):
+		"""Deletes the journal after a finished run."""
+		my.close()
+		if os.path.exists(my.filename):
+			os.remove(my.filename)
+
 class DownloadAudio(object):
 	def __init__(my,dryRun=False):
 		my.dryRun = dryRun
@@ -247,6 +338,7 @@ class DownloadAudio(object):
 			#if "mariageFlag" in VoiceEntry: https://dugrqaqinbtcq.cloudfront.net/product/ynnFQcGDLfaUcGhp/assets/voice/f/{libid}/return fkg_00{charaID}_{voiceline}_forever
 		]
 		my.voiceBatchList = []
+		my.cache = AssetCache()
 		my.rootURL_voice = "http://dugrqaqinbtcq.cloudfront.net/product/ynnFQcGDLfaUcGhp/assets/voice/{0}/{1}/{2}.mp3"
 		#my.rootURL_voice_mariage = https://dugrqaqinbtcq.cloudfront.net/product/ynnFQcGDLfaUcGhp/assets/voice/f/000261/11b2b969f92a7654e469e385d4a09f0c.mp3
 		#my.rootURL_voice_mariage = https://dugrqaqinbtcq.cloudfront.net/product/ynnFQcGDLfaUcGhp/assets/voice/f/{libid}/{fkg_000261_kscene001_forever}.mp3
@@ -302,25 +394,121 @@ class DownloadAudio(object):
 			if "mariageFlag" in voiceLine:
 				my.addVoiceLink(voiceLine,charaID,True)
 	
-	def downloadAllVoice(my):
+	@traced
+	def _downloadVoice(my, queue, get):
+		"""Downloads one voice line. This runs inside of the worker threads.
+
+		@param queue: A voice link dict. See addVoiceLink().
+		@param get: A function like asset_cache.urllib_get().
+		@returns True if the line was downloaded or was already up to date.
+		"""
+
+		downloadText = "Test downloaded " if my.dryRun else "Downloaded "
+		voiceFilePath = os.path.join(VOICE_ASSET_DIRECTORY, queue["localfile"])
+		existed = os.path.isfile(voiceFilePath)
+		# Existing files are revalidated so that changed lines are updated.
+		#voiceBinary = zlib.decompress(voiceRawBinary) No longer zlib decompressed
+		result = my.cache.fetch(queue["remotelink"],
+			None if my.dryRun else voiceFilePath, get=get)
+		if result == FETCH_FAIL:
+			print("Couldn't download " + queue["localfile"] + " " + queue["remotelink"])
+			return False
+		elif result == FETCH_SAME and existed:
+			print("{0} has been downloaded, skipped".format(queue["localfile"]))
+		else:
+			print(downloadText + queue["localfile"])
+		return True
+
+	def downloadAllVoice(my, workers=VOICE_WORKERS):
+		"""Downloads every voice line in voiceBatchList at the same time.
+
+		Finished lines are written to a journal as they complete. If the run
+		is interrupted, running it again skips the lines that were done.
+		Lines that failed are written to VOICE_FAILURE_FILENAME.
+		See retryFailedVoice().
+
+		@param workers: Integer. The number of downloads at the same time.
+		@returns A list of the voice link dicts that failed.
+		"""
+
 		if not os.path.exists(VOICE_ASSET_DIRECTORY): os.makedirs(VOICE_ASSET_DIRECTORY)
-		downloadText = "Downloaded "
-		if my.dryRun: downloadText = "Test d" + downloadText[1:]
+		# Dry runs do not make files, so they do not resume either.
+		journal = None if my.dryRun else VoiceJournal()
+		done = journal.load() if journal else set()
+		queues = []
+		seen = set(done)
 		for queue in my.voiceBatchList:
-			voiceFilePath = os.path.join(VOICE_ASSET_DIRECTORY, queue["localfile"])
-			if os.path.isfile(voiceFilePath):
-				print("{0} has been downloaded, skipped".format(queue["localfile"]))
+			key = (queue["remotelink"], queue["localfile"])
+			if key in done:
+				print("{0} was done before the last run stopped, skipped".format(queue["localfile"]))
+			if key not in seen:
+				seen.add(key)
+				queues.append(queue)
+
+		if DownloadEngine is not None:
+			engine = DownloadEngine(workers, VOICE_RATE, workers,
+				cache=my.cache)
+			run, get = engine.run, engine.get_for_cache
+		else:
+			engine = ThreadPoolExecutor(max_workers=workers)
+			run, get = engine.submit, urllib_get
+
+		def download(queue):
+			ok = my._downloadVoice(queue, get)
+			if journal:
+				journal.record(queue, ok)
+			return ok
+
+		failures = []
+		futures = []
+		try:
+			for queue in queues:
+				futures.append(run(download, queue))
+			for queue, future in zip(queues, futures):
+				if not future.result():
+					failures.append(queue)
+		except KeyboardInterrupt:
+			for future in futures:
+				future.cancel()
+			if journal:
+				journal.close()
+				print("Stopped. Run again to resume the voice downloads.")
+			raise
+		finally:
+			if DownloadEngine is not None:
+				engine.close()
 			else:
-				try:
-					voiceBinary = urllibrary.urlopen(queue["remotelink"]).read()
-					#voiceBinary = zlib.decompress(voiceRawBinary) No longer zlib decompressed
-				except:
-					print("Couldn't download " + queue["localfile"] + " " + queue["remotelink"])
-				else:
-					if not my.dryRun:
-						with open(voiceFilePath, 'wb') as outfile:
-							outfile.write(voiceBinary)
-					print(downloadText + queue["localfile"])
+				engine.shutdown(wait=True)
+
+		if journal:
+			journal.clear()
+			my.writeVoiceFailures(failures)
+		if failures:
+			print("{0} of {1} voice lines failed.".format(len(failures), len(queues)))
+		return failures
+
+	def writeVoiceFailures(my, failures, filename=VOICE_FAILURE_FILENAME):
+		"""Saves the voice links that failed. No failures removes the file."""
+		if not failures:
+			if os.path.exists(filename):
+				os.remove(filename)
+			return
+		with open(filename, 'w', encoding='utf-8') as outfile:
+			json.dump(failures, outfile, indent=1)
+		print("The failed voice lines are listed in " + filename)
+
+	def retryFailedVoice(my, filename=VOICE_FAILURE_FILENAME):
+		"""Downloads only the voice lines that failed in the last run.
+
+		@returns A list of the voice link dicts that failed again.
+		"""
+
+		if not os.path.exists(filename):
+			print("No voice lines failed in the last run.")
+			return []
+		with open(filename, 'r', encoding='utf-8') as infile:
+			my.voiceBatchList = json.load(infile)
+		return my.downloadAllVoice()
 
 
 class GetLuaModuleData(object):
@@ -373,8 +561,11 @@ class CompareData(object):
 	def compareMasterData(my):
 		character_entries_dict = {int(entry):my.master_data.characters[entry] for entry in my.master_data.characters if my.master_data.characters[entry].isFlowerKnight1 == '1'}
 		character_module_data = my.module_data.lua_charalist
-		my.equipment_id_lookup = [entry[2] for entry in my.master_data.equipment_entries if entry[2] not in my.module_data.lua_equiplist and int(entry[2]) >= 380000]
-		my.mariage_id_lookup = [entry.sameCharacterID for entry in my.master_data.bless_oath if entry.sameCharacterID not in my.module_data.lua_oathlist]
+		# Use sets so each lookup is constant time.
+		lua_equipset = set(my.module_data.lua_equiplist)
+		lua_oathset = set(my.module_data.lua_oathlist)
+		my.equipment_id_lookup = [entry[2] for entry in my.master_data.equipment_entries if entry[2] not in lua_equipset and int(entry[2]) >= 380000]
+		my.mariage_id_lookup = [entry.sameCharacterID for entry in my.master_data.bless_oath if entry.sameCharacterID not in lua_oathset]
 		
 		for key in character_entries_dict:
 			entry = character_entries_dict[key]
@@ -406,9 +597,12 @@ class CompareData(object):
 		if VOICE_DOWNLOAD: my.downloadAudio.downloadAllVoice()
 		
 
-def main():
+def main(argv=[]):
+	if '--retry-voice' in argv:
+		DownloadAudio(DOWNLOAD_TEST).retryFailedVoice()
+		return
 	compareData = CompareData()
 	compareData.compareMasterData()
 
 if __name__ == '__main__':
-	main()
+	main(sys.argv)
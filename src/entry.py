@@ -1,35 +1,69 @@
 #!/usr/bin/python
 # coding=utf-8
 from __future__ import print_function
+import re
+from functools import wraps
+from operator import itemgetter
 from common import *
+from lua_serializer import add_quotes, is_number, serialize_rows
 
 __doc__ = """Stores classes for parsing CSV entries in the master data.
 
 Do NOT make instances of BaseEntry. It is an abstract parent class.
 Children of BaseEntry are called Entry classes in this project's source code.
 Each instance of an Entry stores a single CSV line from the master data.
+
+Entries are compact. The CSV values of one line live in a single tuple and
+every name in _CSV_NAMES is a class-level accessor into that tuple, so an
+instance has neither a __dict__ nor a second copy of its values.
+
+Entries never change after they are made. So each Lua text of an entry is
+only made once and then kept. See cached_lua().
+
+Pages with many entries of one class should use get_lua_texts(). It makes
+the texts of getlua() in bulk with a function generated for the class's
+Lua template. See lua_serializer.
 """
 
-def add_quotes(text):
-	"""Surrounds the passed text to make it a valid Lua string.
+def _get_lua_cache(obj):
+	"""Gets the dict of Lua texts that an instance keeps."""
+	try:
+		return obj._lua
+	except AttributeError:
+		obj._lua = {}
+		return obj._lua
 
-	The result is ALWAYS encapsulated even if it was
-	already a valid Lua string.
+def cached_lua(func):
+	"""Decorates a method that makes Lua text so that it only runs once.
 
-	@example foo			---> returns "foo"
-	@example "foo"			---> returns '"foo"'
-	@example "foo's bar"	---> returns [["foo's bar"]]
-	@example 'foo'			---> returns "'foo'"
+	The text is kept in the instance's _lua dict, keyed by the method and
+	its arguments. Later calls with the same arguments return it.
+	Classes whose instances can change must clear _lua when they do.
 	"""
 
-	if '"' in text:
-		# Cannot encapsulate in double-quotes.
-		if "'" in text:
-			# Cannot encapsulate in quotes or double-quotes.
-			# Gotta waste bytes and use double square-brackets.
-			return '[[' + text + ']]'
-		return "'" + text + "'"
-	return '"' + text + '"'
+	name = func.__qualname__
+
+	@wraps(func)
+	def get_cached_lua(my, *args, **kwargs):
+		key = (name, args, tuple(sorted(kwargs.items())))
+		cache = _get_lua_cache(my)
+		try:
+			return cache[key]
+		except KeyError:
+			text = cache[key] = func(my, *args, **kwargs)
+			return text
+	return get_cached_lua
+
+def get_lua_texts(entries, quoted=False):
+	"""Gets getlua(quoted) of every entry in a list.
+
+	@param entries: A list of instances of one Entry class.
+	@returns A list of strings.
+	"""
+
+	if not entries:
+		return []
+	return type(entries[0]).getlua_all(entries, quoted)
 
 def get_float(val):
 	"""Checks if a value is a floating point number or not."""
@@ -54,11 +88,9 @@ def quotify_non_number(text):
 	@returns: String. The value which gets double quotes if it is a string.
 	"""
 
-	try:
-		float(text)
-	except ValueError:
-		return add_quotes(text)
-	return text
+	if is_number(text):
+		return text
+	return add_quotes(text)
 
 def get_quotify_or_do_nothing_func(quoted):
 	"""Gets a function that double-quotes strings or does nothing.
@@ -153,6 +185,84 @@ def split_and_check_count(data_entry_csv, expected_count):
 
 	return (entries, expected_count == actual_count, actual_count)
 
+# A CSV value that remove_quotes() would change, with the comma before it:
+# One that starts and ends with a double-quote. A lone double-quote counts too.
+# Starting with a literal lets the regex engine skip ahead quickly.
+_QUOTED_CSV_VALUE = re.compile(r',"(?:([^,\n]*)")?(?![^,\n])')
+# A quoted CSV value without any other double-quotes in it. This is how
+# almost all strings in the master data look.
+_SIMPLE_QUOTED_CSV_VALUE = re.compile(r',"[^",\n]*"(?![^,\n])')
+
+def _unquote_csv_value(match):
+	return u',' + (match.group(1) or u'')
+
+def split_csv_lines(lines, expected_count):
+	"""Splits many lines of CSV at once and checks their number of entries.
+
+	Each line is split the same way as split_and_check_count() splits it.
+	Instead of handling each value in Python, the lines are joined into one
+	string with a comma before every line. Then the quotes of every value
+	are removed from all of it at once, and it is split into rows.
+
+	@param lines: A list of CSV strings without newlines.
+	@param expected_count: Integer. How many entries to expect per line.
+	@returns A tuple: (rows, wrong_sizes) such that "rows" has a list of
+		exactly expected_count strings for each line, and "wrong_sizes"
+		lists (row index, actual count) for each line that had a different
+		number of entries.
+	"""
+
+	if not lines:
+		return [], []
+	stripped = [line.rstrip() for line in lines]
+	# Accomodate for the SOMETIMES trailing comma
+	stripped = [line[:-1] if line.endswith(',') else line \
+		for line in stripped]
+	text = u',' + u'\n,'.join(stripped)
+	if text.count(u'\n') != len(lines) - 1:
+		# A line has a newline in it, so the rows cannot be told apart.
+		# Split the lines one by one instead.
+		results = [split_and_check_count(line, expected_count) \
+			for line in lines]
+		return [entries for entries, success, actual_count in results], \
+			[(index, actual_count) for index, (entries, success, \
+			actual_count) in enumerate(results) if not success]
+
+	if len(_SIMPLE_QUOTED_CSV_VALUE.findall(text)) * 2 == text.count(u'"'):
+		# Every double-quote encloses a whole value, so removing them all
+		# is the same as removing them value by value.
+		text = text.replace(u'"', u'')
+	else:
+		text = _QUOTED_CSV_VALUE.sub(_unquote_csv_value, text)
+	rows = [line.split(u',') for line in text[1:].split(u'\n,')]
+	wrong_sizes = [(index, len(row)) for index, row in enumerate(rows) \
+		if len(row) != expected_count]
+	for index, actual_count in wrong_sizes:
+		if actual_count < expected_count:
+			# Add empty strings to fill in the blanks.
+			rows[index] += [''] * (expected_count - actual_count)
+		else:
+			# Crop off the excess entries.
+			rows[index] = rows[index][:expected_count]
+	return rows, wrong_sizes
+
+class _CSVField(object):
+	"""Reads one CSV value of an Entry out of its values tuple.
+
+	BaseEntry makes one of these for each name in a child's _CSV_NAMES.
+	This is what lets entry.fullName work without a per-instance __dict__.
+	"""
+
+	__slots__ = ('index',)
+
+	def __init__(my, index):
+		my.index = index
+
+	def __get__(my, instance, owner):
+		if instance is None:
+			return my
+		return instance._values[my.index]
+
 class BaseEntry(object):
 	"""Base class for deriving Entry classes.
 
@@ -162,13 +272,19 @@ class BaseEntry(object):
 	the child class is getting its data from. It is only for diagnostics.
 	_CSV_NAMES is a list of strings. It gives names to each CSV entry in
 	a section of the master data. The names need to be valid variable names
-	or else the setattr() function in the ctor will fail.
+	and must not clash with any method names of the class.
+
+	Child classes must also define __slots__, usually as an empty tuple.
+	Otherwise, every instance gets a __dict__ again.
 
 	Note: The CSV entries in the master data are stored such that
 	numerical values are strings, and
 	string values are strings enclosed in double-quotes.
 	"""
 
+	# _lua holds the texts made by methods with @cached_lua.
+	__slots__ = ('_values', '_values_dict', '_lua')
+
 	INVALID_ENTRY_TYPE = 'invalid'
 	# Used to track which entries to enclose in double-quotes.
 	_string_valued_indices = {}
@@ -176,6 +292,14 @@ class BaseEntry(object):
 	# the corresponding entry type to True. Only state the warning once.
 	_WARN_WRONG_SIZE = {}
 
+	def __init_subclass__(cls, **kwargs):
+		"""Makes an attribute accessor for each CSV name of a child class."""
+		super(BaseEntry, cls).__init_subclass__(**kwargs)
+		if '_CSV_NAMES' not in vars(cls):
+			return
+		for idx, name in enumerate(cls._CSV_NAMES):
+			setattr(cls, name, _CSVField(idx))
+
 	def __init__(my, data_entry_csv):
 		"""Ctor. To be overrridden and called by child classes."""
 		if not len(my._CSV_NAMES) or not my._MASTER_DATA_TYPE:
@@ -185,39 +309,16 @@ class BaseEntry(object):
 		# Turn the CSV into a list.
 		values, success, actual_count = split_and_check_count(
 			data_entry_csv, len(my._CSV_NAMES))
-		# Add this type of master data section to the list of checked sections.
-		if my._MASTER_DATA_TYPE not in BaseEntry._WARN_WRONG_SIZE:
-			BaseEntry._WARN_WRONG_SIZE[my._MASTER_DATA_TYPE] = False
 
 		# Store the values.
-		my.values_dict = dict(zip(my._CSV_NAMES, values))
-
-		# Assign the CSV entries to member variables of this instance.
+		# The CSV entries are readable as member variables of this instance.
 		# For example, if you have a CharacterEntry with _CVS_NAMES as
 		# ['id0', 'id1', 'fullName']
 		# then this lets you access the fields like so.
 		# my_character_csv_instance.id0
 		# my_character_csv_instance.fullName
-		temp = dict(zip(range(len(my._CSV_NAMES)),
-			my._CSV_NAMES))
-		[setattr(my, temp[i], values[i]) for i in range(len(values))]
-
-		# If the CSV parsing failed and there has not been a message given
-		# about that, print an warning report.
-		if not success and not BaseEntry._WARN_WRONG_SIZE[my._MASTER_DATA_TYPE]:
-			print('WARNING: There are {0} values in a/an {1} entry instead of {2}.'.format(
-				actual_count, my._MASTER_DATA_TYPE, len(my._CSV_NAMES)))
-			print('The offending CSV was this:')
-			# Remove any trailing newlines.
-			print(data_entry_csv.rstrip())
-			if actual_count <= 1:
-				print('This is probably a parsing bug.')
-			else:
-				print('The format of getMaster may have changed. ' \
-					'This is the current interpretation:')
-				print(repr(my))
-			# Don't state the warning again.
-			BaseEntry._WARN_WRONG_SIZE[my._MASTER_DATA_TYPE] = True
+		my._values = tuple(values)
+		my._check_size(data_entry_csv, actual_count)
 
 		# Determine which values are strings.
 		# It helps to store this because strings need enclosed in double-quotes
@@ -239,6 +340,80 @@ class BaseEntry(object):
 				[i for i in range(len(values)) if \
 				get_float(values[i]) is None]
 
+	def _check_size(my, data_entry_csv, actual_count):
+		"""Warns once per Entry class about CSV with the wrong size.
+
+		@param data_entry_csv: String. The CSV line of this entry.
+		@param actual_count: Integer. How many values the line had.
+		"""
+
+		# Add this type of master data section to the list of checked sections.
+		if my._MASTER_DATA_TYPE not in BaseEntry._WARN_WRONG_SIZE:
+			BaseEntry._WARN_WRONG_SIZE[my._MASTER_DATA_TYPE] = False
+
+		# If the CSV parsing failed and there has not been a message given
+		# about that, print an warning report.
+		if actual_count != len(my._CSV_NAMES) and \
+			not BaseEntry._WARN_WRONG_SIZE[my._MASTER_DATA_TYPE]:
+			print('WARNING: There are {0} values in a/an {1} entry instead of {2}.'.format(
+				actual_count, my._MASTER_DATA_TYPE, len(my._CSV_NAMES)))
+			print('The offending CSV was this:')
+			# Remove any trailing newlines.
+			print(data_entry_csv.rstrip())
+			if actual_count <= 1:
+				print('This is probably a parsing bug.')
+			else:
+				print('The format of getMaster may have changed. ' \
+					'This is the current interpretation:')
+				print(repr(my))
+			# Don't state the warning again.
+			BaseEntry._WARN_WRONG_SIZE[my._MASTER_DATA_TYPE] = True
+
+	@classmethod
+	def make_entries(cls, lines):
+		"""Makes one entry per CSV line, splitting all of the lines at once.
+
+		The entries are the same as calling the class on every line, and the
+		same warnings are given. Child classes must not need more setup in
+		their constructor than BaseEntry does.
+
+		@param lines: A list of CSV strings for this class.
+		@returns A list of instances of this class.
+		"""
+
+		if not len(cls._CSV_NAMES) or not cls._MASTER_DATA_TYPE:
+			raise Exception(
+			'Error: Instantiating BaseEntry class instead of a child class.')
+
+		rows, wrong_sizes = split_csv_lines(lines, len(cls._CSV_NAMES))
+		new = cls.__new__
+		entries = []
+		for values in rows:
+			entry = new(cls)
+			entry._values = tuple(values)
+			entries.append(entry)
+		if entries:
+			# Register the section even if every line was fine.
+			index, actual_count = wrong_sizes[0] if wrong_sizes else \
+				(0, len(cls._CSV_NAMES))
+			entries[index]._check_size(lines[index], actual_count)
+		return entries
+
+	@property
+	def values_dict(my):
+		"""The CSV values in a dict keyed by their names.
+
+		The dict is only made on first use. Modifying it does not change
+		the values that are read as member variables.
+		"""
+
+		try:
+			return my._values_dict
+		except AttributeError:
+			my._values_dict = dict(zip(my._CSV_NAMES, my._values))
+			return my._values_dict
+
+	@cached_lua
 	def getlua(my, quoted=False):
 		"""Returns the stored data as a Lua list.
 
@@ -248,16 +423,77 @@ class BaseEntry(object):
 		@returns: String. All variables of the class in Lua table format.
 		"""
 
+		return my._make_lua(quoted)
+
+	def _make_lua(my, quoted=False):
+		"""Makes the text of BaseEntry.getlua() without keeping it.
+
+		Child classes that wrap this text call it instead of getlua(),
+		so that only their own text is kept.
+		"""
+
 		string_transformer = get_quotify_or_do_nothing_func(quoted)
+		# The text is kept, so it is made from the values themselves
+		# instead of the values_dict, which can be modified.
+		values = dict(zip(my._CSV_NAMES, my._values))
 
 		# Generate the Lua table.
 		lua_table = u', '.join([u'{0}={1}'.format(
-			name, string_transformer(my.values_dict[name])) \
+			name, string_transformer(values[name])) \
 			for name in sorted(my._CSV_NAMES)])
 
 		# Surround the Lua table in angle brackets.
 		return u'{{{0}}}'.format(lua_table)
 
+	@classmethod
+	def get_lua_template(cls):
+		"""Gets the Lua template that makes the same text as getlua(quoted).
+
+		See lua_serializer for the format. Classes whose getlua() cannot be
+		written as a template return None.
+		"""
+
+		return u'{{' + u', '.join([u'{0}={{{0}!q}}'.format(name) \
+			for name in sorted(cls._CSV_NAMES)]) + u'}}'
+
+	@classmethod
+	def _make_lua_all(cls, entries, quoted):
+		"""Makes getlua(quoted) of many entries. See getlua_all()."""
+		def get_owner(name):
+			return next(parent for parent in cls.__mro__ \
+				if name in vars(parent))
+		template = cls.get_lua_template()
+		# A class can override getlua() without a template to match it.
+		if template is None or not issubclass(get_owner('get_lua_template'),
+			get_owner('getlua')):
+			return [entry.getlua(quoted) for entry in entries]
+		return serialize_rows(template, cls._CSV_NAMES,
+			[entry._values for entry in entries], quoted)
+
+	@classmethod
+	def getlua_all(cls, entries, quoted=False):
+		"""Gets getlua(quoted) of many entries of this class at once.
+
+		The texts are kept and reused like the texts of getlua().
+
+		@param entries: A list of instances of this class.
+		@returns A list of strings.
+		"""
+
+		if any(type(entry) is not cls for entry in entries):
+			return [entry.getlua(quoted) for entry in entries]
+		# This is the key that getlua(quoted) keeps its text under.
+		key = (cls.getlua.__qualname__, (quoted,), ())
+		caches = [_get_lua_cache(entry) for entry in entries]
+		missing = [index for index, cache in enumerate(caches) \
+			if key not in cache]
+		if missing:
+			texts = cls._make_lua_all([entries[index] for index in missing],
+				quoted)
+			for index, text in zip(missing, texts):
+				caches[index][key] = text
+		return [cache[key] for cache in caches]
+
 	def __lt__(my, other):
 		return my.tiers[1]['id'] < other.tiers[1]['id']
 
@@ -265,8 +501,8 @@ class BaseEntry(object):
 		"""Gets a string stating nearly everything about this instance."""
 		return u'CSV fields by index, name, value:\n' + \
 			u'\n'.join([u'{0:02}: {1} = {2}'.format(
-				i, my._CSV_NAMES[i], my.values_dict[my._CSV_NAMES[i]]) \
-			for i in range(len(my.values_dict))])
+				i, my._CSV_NAMES[i], my._values[i]) \
+			for i in range(len(my._CSV_NAMES))])
 
 	def __str__(my):
 		"""Gets a succinct string describing this instance."""
@@ -274,6 +510,7 @@ class BaseEntry(object):
 
 class CharacterEntry(BaseEntry):
 	"""Stores one line of data from the masterCharacter section."""
+	__slots__ = ()
 	_CSV_NAMES = [
 		'id0',
 		'id1',
@@ -371,6 +608,7 @@ class CharacterEntry(BaseEntry):
 
 class SkillEntry(BaseEntry):
 	"""Stores one line of data from the masterCharacterSkill section."""
+	__slots__ = ()
 	_CSV_NAMES = [
 		'uniqueID',
 		'nameJapanese',
@@ -395,15 +633,26 @@ class SkillEntry(BaseEntry):
 	def __lt__(my, other):
 		return my.uniqueID < other.uniqueID
 
+	@cached_lua
 	def getlua(my, quoted=False):
 		return u'[{0}] = {1},'.format(my.uniqueID,
-			super(SkillEntry, my).getlua(quoted))
+			super(SkillEntry, my)._make_lua(quoted))
+
+	@classmethod
+	def get_lua_template(cls):
+		return u'[{uniqueID}] = ' + \
+			super(SkillEntry, cls).get_lua_template() + u','
 
 class AbilityEntry(BaseEntry):
 	"""Stores one line of data from the ability section.
 
 	In the master data, this section is named masterCharacterLeaderSkill.
 	"""
+	__slots__ = (
+		# Scratch values made by getlua().
+		'abilityList1', 'abilityList2', 'abilityList3',
+		'abilityFlag2', 'abilityFlag3',
+	)
 	_CSV_NAMES = [
 		'uniqueID',
 		'ability1ID',
@@ -439,6 +688,7 @@ class AbilityEntry(BaseEntry):
 	def __lt__(my, other):
 		return my.uniqueID < other.uniqueID
 
+	@cached_lua
 	def getlua(my, quoted=False):
 		"""Returns the stored data as a Lua list."""
 		#New CSV format
@@ -470,12 +720,41 @@ class AbilityEntry(BaseEntry):
 		# Relate the list of values to the unique ID.
 		return u'[{0}]={{{1}}},'.format(my.uniqueID, ",".join(lua_list))
 
+	@classmethod
+	def get_lua_template(cls):
+		# Which abilities are written depends on their values.
+		return None
+
+	@classmethod
+	def _make_lua_all(cls, entries, quoted):
+		"""Makes getlua(quoted) of many entries without the scratch values."""
+		names = ['ID', 'Val0', 'Val1', 'Val2', 'Val3', 'Val4', 'Val5', 'Val6']
+		get_lists = [itemgetter(*[cls._CSV_NAMES.index(
+			'ability{0}{1}'.format(ability, name)) for name in names]) \
+			for ability in (1, 2, 3)]
+		texts = []
+		for entry in entries:
+			values = entry._values
+			lists = [get_list(values) for get_list in get_lists]
+			#Flags used to prune unused abilities.
+			flag2 = sum(int(p) for p in lists[1]) != 0
+			flag3 = sum(int(p) for p in lists[2]) != 0
+			lua_list = [u'{{{0}}}'.format(",".join(lists[0]))]
+			if flag2 or flag3:
+				lua_list.append(u'{{{0}}}'.format(",".join(lists[1])))
+			if flag3:
+				lua_list.append(u'{{{0}}}'.format(",".join(lists[2])))
+			texts.append(u'[{0}]={{{1}}},'.format(entry.uniqueID,
+				",".join(lua_list)))
+		return texts
+
 class AbilityDescEntry(BaseEntry):
 	"""Stores one line of data from the ability description section.
 
 	In the master data, this section is named masterCharacterLeaderSkillDescription.
 	"""
 
+	__slots__ = ()
 	_CSV_NAMES = [
 		'id0',
 		'id1',
@@ -500,12 +779,19 @@ class AbilityDescEntry(BaseEntry):
 	def __lt__(my, other):
 		return my.id0 < other.id0
 
+	@cached_lua
 	def getlua(my, quoted=False):
 		"""Returns the stored data as a Lua list."""
 		return u'[{0}] = '.format(my.id0) + \
-			super(AbilityDescEntry, my).getlua(quoted)
+			super(AbilityDescEntry, my)._make_lua(quoted)
+
+	@classmethod
+	def get_lua_template(cls):
+		return u'[{id0}] = ' + \
+			super(AbilityDescEntry, cls).get_lua_template()
 
 class EquipmentEntry(BaseEntry):
+	__slots__ = ()
 	_CSV_NAMES = [
 		'id0',
 		'name',
@@ -624,17 +910,22 @@ class EquipmentEntry(BaseEntry):
 			return quotify_non_number("{{{0}}}".format(",".join(list)))
 		return "{{{0}}}".format(",".join(list))
 
-	def getlua(my, quoted=False):
-		#Removes unused variables.
-		my.values_dict.pop('desc')
-		my.values_dict.pop('equipID')
+	# These values are left out of the Lua tables.
+	_LUA_SKIPPED_NAMES = ('desc', 'equipID')
 
+	def _get_lua_items(my):
+		"""Gets the (name, value) pairs for the Lua tables in CSV order."""
+		return [(k, v) for k, v in zip(my._CSV_NAMES, my._values) \
+			if k not in my._LUA_SKIPPED_NAMES]
+
+	@cached_lua
+	def getlua(my, quoted=False):
 		# Generate the Lua table.
 		# Relate the named entries to their value.
 		# Example output: {name="Bob", type="cat", hairs=5},
 		lua_table = u'[{0}] = {{'.format(my.equipID)
 		pairs = []
-		for k, v in sorted(my.values_dict.items()):
+		for k, v in sorted(my._get_lua_items()):
 			v = my.string_transformer(k, v, quoted)
 			pairs.append([k, v])
 		lua_table += u', '.join([u'{0}={1}'.format(
@@ -642,16 +933,17 @@ class EquipmentEntry(BaseEntry):
 		lua_table += '}'
 		return lua_table
 		
+	@cached_lua
 	def getcompactlua(my, quoted=False):
 		"""Returns the stored data as a Lua list."""
 		#New CSV format
-		my.values_dict.pop('desc')
 		# Relate the list of values to the unique ID.
 		return "[{0}]={{{1}}}".format(
-			my.values_dict.pop("equipID"),
-			",".join([v for k, v in my.values_dict.items()])
+			my.equipID,
+			",".join([v for k, v in my._get_lua_items()])
 		)
 
+	@cached_lua
 	def getmodularlua(my, moduleType=False, quoted=False):
 		"""Returns the stored data as a Lua list."""
 		#New CSV format
@@ -710,7 +1002,7 @@ class EquipmentEntry(BaseEntry):
 				)
 			)
 		else:
-			outputEntry = ",".join([v for k,v, in my.values_dict.items()])
+			outputEntry = ",".join(my._values)
 
 		#lua_list = [u'{{{0}}}'.format(",".join(my.values_dict))]
 		# Relate the list of values to the unique ID.
@@ -718,6 +1010,7 @@ class EquipmentEntry(BaseEntry):
 
 class SkinEntry(BaseEntry):
 	"""Stores one line of data from the masterCharacterSkin section."""
+	__slots__ = ()
 	_CSV_NAMES = [
 		# This ID matches the character's unique ID
 		'uniqueID',
@@ -757,6 +1050,7 @@ class SkinEntry(BaseEntry):
 	def __lt__(my, other):
 		return my.uniqueID < other.uniqueID
 
+	@cached_lua
 	def getlua(my, quoted=False):
 		"""Returns the stored data as a Lua list.
 
@@ -770,14 +1064,20 @@ class SkinEntry(BaseEntry):
 
 		# Generate the Lua table.
 		lua_table = u', '.join([u'{0}={1}'.format(
-			name, string_transformer(my.values_dict[name])) \
+			name, string_transformer(getattr(my, name))) \
 			for name in my._LUA_ORDER])
 
 		# Surround the Lua table in angle brackets.
 		return u'{{{0}}}'.format(lua_table)
 
+	@classmethod
+	def get_lua_template(cls):
+		return u'{{' + u', '.join([u'{0}={{{0}!q}}'.format(name) \
+			for name in cls._LUA_ORDER]) + u'}}'
+
 class FlowerMemoryEntry(BaseEntry):
 	"""Stores one line of data from the masterFlowerMemory section."""
+	__slots__ = ()
 	_CSV_NAMES = [
 		'id',
 		'flowerMemoryID',
@@ -820,7 +1120,7 @@ class FlowerMemoryEntry(BaseEntry):
 
 	def getlua_debug(my, quoted=False):
 		return u'[{0}] = {1},'.format(my.id,
-			super(FlowerMemoryEntry, my).getlua(quoted))
+			super(FlowerMemoryEntry, my)._make_lua(quoted))
 			
 		lua_table = u'[{0}] = {{'.format(my.id)
 		pairs = []
@@ -832,21 +1132,30 @@ class FlowerMemoryEntry(BaseEntry):
 		lua_table += '}'
 		return lua_table
 
+	@cached_lua
 	def getlua(my, quoted=False):
 		"""Returns the stored data as a Lua list."""
-		# Removes unused data entries.
-		my.values_dict.pop('id')
-		my.values_dict.pop('desc')
+		# Leaves out unused data entries.
+		values = [v for k, v in zip(my._CSV_NAMES, my._values) \
+			if k not in ('id', 'desc', 'flowerMemoryID')]
 		# Relate the list of values to the unique ID.
 		return "[{0}]={{{1}}}".format(
-			my.values_dict.pop('flowerMemoryID'), ",".join([my.string_transformer(v, quoted) for k, v in my.values_dict.items()])
+			my.flowerMemoryID, ",".join([my.string_transformer(v, quoted) for v in values])
 		)
 
+	@classmethod
+	def get_lua_template(cls):
+		# string_transformer() is the !p conversion.
+		return u'[{flowerMemoryID}]={{' + u','.join([u'{{{0}!p}}'.format(name) \
+			for name in cls._CSV_NAMES \
+			if name not in ('id', 'desc', 'flowerMemoryID')]) + u'}}'
+
 class FlowerMemoryAbilityEntry(BaseEntry):
 	"""Stores one line of data from the masterAbility section.
 	
 	Used as ability reference for Flower Memories across Limit Breaks.
 	"""
+	__slots__ = ()
 	_CSV_NAMES = [
 		'id',
 		'name',
@@ -866,21 +1175,29 @@ class FlowerMemoryAbilityEntry(BaseEntry):
 	def __lt__(my, other):
 		return my.id0 < other.id0
 
+	@cached_lua
 	def getlua(my, quoted=False):
 		"""Returns the stored data as a Lua list."""
-		# Removes unused data entries.
-		my.values_dict.pop('name')
-		my.values_dict.pop('desc')
+		# Leaves out unused data entries.
+		values = [v for k, v in zip(my._CSV_NAMES, my._values) \
+			if k not in ('id', 'name', 'desc')]
 		# Relate the list of values to the unique ID.
 		return "[{0}]={{{1}}}".format(
-			my.values_dict.pop('id'), ",".join([v for k, v in my.values_dict.items()])
+			my.id, ",".join(values)
 		)
 
+	@classmethod
+	def get_lua_template(cls):
+		return u'[{id}]={{' + u','.join([u'{{{0}}}'.format(name) \
+			for name in cls._CSV_NAMES \
+			if name not in ('id', 'name', 'desc')]) + u'}}'
+
 class FlowerMemoryAbilityLookup(BaseEntry):
 	"""Stores one line of data from the masterFlowerMemorysAbilitys section.
 	
 	Used as ability reference for Flower Memories across Limit Breaks.
 	"""
+	__slots__ = ()
 	_CSV_NAMES = [
 		'id',
 		'flowerMemoryID',
@@ -897,6 +1214,7 @@ class BlessedOathLookup(BaseEntry):
 	
 	Used as character ID reference for Blessed Eternal Oath (in-game wedding) flags.
 	"""
+	__slots__ = ()
 	_CSV_NAMES = [
 		'sameCharacterID',
 		'name',
@@ -907,6 +1225,7 @@ class BlessedOathLookup(BaseEntry):
 	def __init__(my, data_entry_csv):
 		super(BlessedOathLookup, my).__init__(data_entry_csv)
 
+	@cached_lua
 	def getlua(my, quoted=False):
 		"""Returns the sameCharacterID as a Lua list."""
 		if my.marriageBlessingFlag == '1':
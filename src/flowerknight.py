@@ -55,6 +55,9 @@ class FlowerKnight(object):
 		# This will be only calculated once on the fly once
 		# get_latest_date is called.
 		my.latest_date = None
+		# The texts made by get_lua(). They are cleared when an entry is
+		# added, so each text is only made once per set of entries.
+		my._lua = {}
 		my.add_entries(entries)
 
 	def add_entries(my, entries):
@@ -67,6 +70,7 @@ class FlowerKnight(object):
 
 	def add_entry(my, entry):
 		"""Adds a CharacterEntry instance to this knight's data."""
+		my._lua.clear()
 		if int(entry.id0) >= 700000:
 			if entry.fullName == 'ツツジ' or entry.id0 in ['146603001']:
 			# This is either an NPC character or an alternate skin. Do not store their data.
@@ -256,33 +260,42 @@ class FlowerKnight(object):
 				my.tiers[4]['date0'],])
 		return my.latest_date
 
-	def has_id(my, id):
-		"""Checks if the passed ID is related to this flower knight.
+	def get_ids(my):
+		"""Gets every ID related to this flower knight.
 
-		@param id: String or integer. The ID to check.
+		These are the IDs of the evolution tiers that this flower knight can
+		reach. Tiers without a stored entry are skipped.
 
-		@returns: Boolean. True if the ID is related to this flower knight.
-			False if the id is 0, a blank string, or an unrelated number.
+		@returns: A list of stringly-typed IDs.
 		"""
 
-		id = str(id)
-		if not id:
-			return False
-		elif 'id' not in my.tiers[2]:
+		if 'id' not in my.tiers[2]:
 			# This flower knight is only a skin. It can't evolve.
-			return id == my.tiers[1]['id']
+			tiers = (1,)
 		elif my.bloomability == FlowerKnight.NO_BLOOM:
 			# This flower knight is evolvable, but not bloomable.
-			return id in (my.tiers[1]['id'], my.tiers[2]['id'])
+			tiers = (1, 2)
 		elif my.growability == FlowerKnight.NO_RARITY_GROWTH:
 			# This flower knight can bloom, but not rarity grow.
-			return id in (my.tiers[1]['id'], my.tiers[2]['id'],
-				my.tiers[3]['id'])
+			tiers = (1, 2, 3)
 		else:
 			# This flower knight can bloom and rarity grow.
-			return id in (my.tiers[1]['id'], my.tiers[2]['id'],
-				my.tiers[3]['id'], my.tiers[4]['id'])
+			tiers = (1, 2, 3, 4)
+		return [my.tiers[tier]['id'] for tier in tiers if 'id' in my.tiers[tier]]
+
+	def has_id(my, id):
+		"""Checks if the passed ID is related to this flower knight.
+
+		@param id: String or integer. The ID to check.
+
+		@returns: Boolean. True if the ID is related to this flower knight.
+			False if the id is 0, a blank string, or an unrelated number.
+		"""
+
+		id = str(id)
+		return bool(id) and id in my.get_ids()
 
+	@cached_lua
 	def get_lua(my, quoted=False):
 		"""Returns the stored data as a Lua list.
 
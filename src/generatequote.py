@@ -1,6 +1,7 @@
 ﻿#!/usr/bin/python3
 # coding: utf-8
-import os, sys, re, requests
+import os, sys, re
+from http_cache import http_cache
 
 #Retrieve the source text from japanese wiki
 flowerKnightList = ["アルストロメリア","フクジュソウ","アネモネ"]
@@ -123,11 +124,9 @@ class GenerateQuote(object):
 	
 	def downloadText(my, charaName):
 		notice = "Processing " + charaName
-		dltext = requests.get(wikiLink + charaName).text
+		dltext, redirect = http_cache.get_jp_wiki_page(wikiLink, charaName)
 
-		if dltext.find('<div class="ie5">') == -1 :
-			redirect = charaName.replace("(","（").replace(")","）")
-			dltext  = requests.get(wikiLink + redirect).text
+		if redirect:
 			notice  += ".redirected -> " + redirect
 		print(notice)
 		
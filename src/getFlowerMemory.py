@@ -13,6 +13,7 @@ from io import BytesIO
 from base64 import b64decode
 from datetime import date
 from collections import OrderedDict
+from parse_syncdata import SyncDataStore
 
 if sys.version_info.major < 3:
 	# The script is being run under Python 2.
@@ -71,24 +72,24 @@ class DownloadImage(object):
 		IMG_FM_IMAGE = ImageClass(["flower_memory/general/main_l","fm_main_l_","Fm_main_l_"])
 		IMG_FM_TITLE = ImageClass(["flower_memory/general/name_l","fm_name_l_","Fm_title_"])
 		
-		my.downloadCharaImage(flowerMemoryEntry['itemId'],IMG_FM_ICON)
-		my.downloadCharaImage(flowerMemoryEntry['itemId'],IMG_FM_ICON2)
-		my.downloadCharaImage(flowerMemoryEntry['itemId'],IMG_FM_IMAGE)
-		my.downloadCharaImage(flowerMemoryEntry['itemId'],IMG_FM_TITLE)
+		my.downloadCharaImage(flowerMemoryEntry.itemId,IMG_FM_ICON)
+		my.downloadCharaImage(flowerMemoryEntry.itemId,IMG_FM_ICON2)
+		my.downloadCharaImage(flowerMemoryEntry.itemId,IMG_FM_IMAGE)
+		my.downloadCharaImage(flowerMemoryEntry.itemId,IMG_FM_TITLE)
 
-		my.iconFrame(flowerMemoryEntry['itemId'], IMG_FM_ICON, flowerMemoryEntry['rarity'])
-		my.iconHalfFrame(flowerMemoryEntry['itemId'], IMG_FM_ICON2, flowerMemoryEntry['rarity'])
+		my.iconFrame(flowerMemoryEntry.itemId, IMG_FM_ICON, flowerMemoryEntry.rarity)
+		my.iconHalfFrame(flowerMemoryEntry.itemId, IMG_FM_ICON2, flowerMemoryEntry.rarity)
 
-		fm_image_filename = os.path.join(ASSET_DIRECTORY,"{0}{1}.png".format(IMG_FM_IMAGE.imgSaveName,flowerMemoryEntry['itemId']))
-		fm_image_output_filename = os.path.join(ASSET_DIRECTORY,"{0}{1}.png".format("Fm_wallpaper_",flowerMemoryEntry['itemId']))
-		fm_title_filename = os.path.join(ASSET_DIRECTORY,"{0}{1}.png".format(IMG_FM_TITLE.imgSaveName,flowerMemoryEntry['itemId']))
+		fm_image_filename = os.path.join(ASSET_DIRECTORY,"{0}{1}.png".format(IMG_FM_IMAGE.imgSaveName,flowerMemoryEntry.itemId))
+		fm_image_output_filename = os.path.join(ASSET_DIRECTORY,"{0}{1}.png".format("Fm_wallpaper_",flowerMemoryEntry.itemId))
+		fm_title_filename = os.path.join(ASSET_DIRECTORY,"{0}{1}.png".format(IMG_FM_TITLE.imgSaveName,flowerMemoryEntry.itemId))
 		if GET_WALLPAPER:
 			try:
-				IconMerger.get_framed_memory(fm_image_filename, fm_title_filename, fm_image_output_filename, int(flowerMemoryEntry['rarity']))
+				IconMerger.get_framed_memory(fm_image_filename, fm_title_filename, fm_image_output_filename, int(flowerMemoryEntry.rarity))
 			except Exception as e:
 				print(e)
 			else:
-				print("Successfully framed {0}{1}.png".format("Fm_wallpaper_",flowerMemoryEntry['itemId']))
+				print("Successfully framed {0}{1}.png".format("Fm_wallpaper_",flowerMemoryEntry.itemId))
 		
 	def getFilenameHash(my, predicate, inputID):
 		#Calculate the hashed filename of the Flower Memory images.
@@ -193,17 +194,31 @@ class compareData(object):
 		my.downloadImage = DownloadImage()
 		my.new_master_data = MasterData(RAWDATA_NEW)
 
-	def getFlowerMemory(my):
-		FlowerMemoryJSONData = [entry for entry in my.new_master_data.masterJSON['masterSyncData']]
-		FlowerMemoryData = OrderedDict()
+	def getFlowerMemory(my, itemIDs=[]):
+		"""Downloads the images of flower memories.
+
+		@param itemIDs: A list of item IDs. If empty, every flower memory
+			is downloaded.
+		"""
+
+		syncData = SyncDataStore(my.new_master_data.masterJSON.get('masterSyncData', []))
 		if not os.path.exists(ASSET_DIRECTORY): os.makedirs(ASSET_DIRECTORY)
-		
-		for entry in FlowerMemoryJSONData:
-			FlowerMemoryData.update({entry['tableName']: entry['data']})
 
-		for FlowerMemory in FlowerMemoryData['master_flower_memorys']:
+		if itemIDs:
+			FlowerMemoryList = []
+			for itemID in itemIDs:
+				FlowerMemory = syncData.flower_memories.get_by_item_id(itemID)
+				if FlowerMemory is None:
+					print("No flower memory has the item ID {0}.".format(itemID))
+				else:
+					FlowerMemoryList.append(FlowerMemory)
+		else:
+			FlowerMemoryList = syncData.flower_memories
+
+		for FlowerMemory in FlowerMemoryList:
 			my.downloadImage.getFlowerMemoryImage(FlowerMemory)
 		
 if __name__ == '__main__':
 	compareData = compareData()
-	compareData.getFlowerMemory()
+	# Item IDs can be given to only download those flower memories.
+	compareData.getFlowerMemory(sys.argv[1:])
@@ -1,11 +1,17 @@
 #!/usr/bin/python3
 # coding: utf-8
+import re
 import zlib
 import json
+import hashlib
+import tempfile
+import threading
 from datetime import date
 from collections import OrderedDict
+from collections.abc import Mapping
 from os import scandir, makedirs
 from os.path import isfile, dirname, normpath, exists, abspath, join as path_join
+from tracing import span, traced
 
 __doc__ = """Handles the initial loading of any getMaster files.
 
@@ -15,6 +21,11 @@ getmaster_outputter is for outputting the organized data for the Wikia.
 
 If there are multiple files to load, their data is blindly combined.
 
+Files are never decoded as a whole. Each one is decompressed in chunks
+into a temporary file while the top-level JSON object is scanned for the
+byte offsets of its sections. A section is only decoded when something
+asks for it, so memory use scales with the sections actually used.
+
 This class handles loading, but not parsing the data. The intention is
 that any parsers should expect the same data format no matter how
 the data was saved.
@@ -25,150 +36,337 @@ Simplistic data output is provided by this class.
 INPUT_FOLDER = 'inputs'
 OUTPUT_FOLDER = 'outputs'
 
+def get_default_inputs():
+    """Lists the getMaster files in the input folder."""
+    if not exists(INPUT_FOLDER):
+        raise FileNotFoundError('Please put the getMaster files into ' + \
+            abspath(INPUT_FOLDER))
+    return [fil for fil in scandir(INPUT_FOLDER) if fil.is_file()]
+
+def get_inputs_digest(datafile_list=[]):
+    """Hashes the names and contents of the getMaster files.
+
+    The digest changes whenever an input file is added, removed or edited.
+    It is used to decide whether previously parsed data is still valid.
+
+    @returns: String. A hex digest.
+    """
+
+    if not datafile_list:
+        datafile_list = get_default_inputs()
+    digest = hashlib.sha1()
+    for infilename in sorted(datafile_list, key=lambda fil: str(
+            getattr(fil, 'name', fil))):
+        digest.update(str(getattr(infilename, 'name', infilename)).encode(
+            'utf-8') + b'\0')
+        with open(infilename, 'rb') as infile:
+            for chunk in iter(lambda: infile.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+# Bytes that matter while scanning the top level of a JSON object.
+_JSON_STRUCTURE = re.compile(rb'[{}\[\],:"]')
+_JSON_STRING_END = re.compile(rb'["\\]')
+# Raw JSON values which count as sections without data.
+_EMPTY_JSON_VALUES = (b'""', b'[]', b'{}', b'null', b'false', b'0')
+
+# Matches a section name in the plain text format.
+_TEXT_SECTION_NAME = re.compile(r'master\w*')
+
+class MasterTextIndex(object):
+    """Indexes the sections of the deprecated plain text format in one pass.
+
+    The format is a "TimeStamp:" line followed by each section's name on its
+    own line and then its CSV lines. A section's data ends at the next
+    occurrence of "master", which is normally the next header. So only the
+    occurrences of "master" are visited, and each one either starts a
+    header line or ends the data of the section before it.
+
+    Only the text of a requested section is ever copied out.
+    """
+
+    @traced
+    def __init__(my, text):
+        my.text = text
+        # Maps section names to the (start, end) offsets of their data.
+        # Only the first header of a repeated name counts.
+        my.spans = OrderedDict()
+        pos = text.find('master')
+        while pos >= 0:
+            next_pos = text.find('master', pos + 1)
+            line_start = text.rfind('\n', 0, pos) + 1
+            line_end = text.find('\n', pos)
+            if line_end < 0:
+                line_end = len(text)
+            name = text[pos:line_end].rstrip()
+            if not text[line_start:pos].strip() and \
+                    _TEXT_SECTION_NAME.fullmatch(name) and \
+                    name not in my.spans:
+                my.spans[name] = (pos + len(name),
+                    next_pos if next_pos >= 0 else len(text))
+            pos = next_pos
+
+    def __contains__(my, name):
+        return name in my.spans
+
+    def get_lines(my, name):
+        """Gets the CSV lines of one section.
+
+        @returns A list of strings without line endings.
+        @raises KeyError if there is no such section.
+        """
+
+        start, end = my.spans[name]
+        return my.text[start:end].strip().split('\n')
+
+class MasterSectionIndex(object):
+    """Indexes the sections of one getMaster file without decoding them.
+
+    The file is decompressed chunk by chunk into a temporary file. While
+    that happens, the top-level JSON object is scanned for the byte offsets
+    of every section's value. Sections are only decoded by get().
+
+    Plain text files (the deprecated, pre-decoded master data) cannot be
+    indexed. Their contents are stored in the "text" member instead.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(my, pathlike):
+        my.name = getattr(pathlike, 'name', str(pathlike))
+        # Maps section names to the (start, end) byte offsets of their values.
+        my.offsets = OrderedDict()
+        # Only set when the file is in the deprecated plain text format.
+        my.text = None
+        my._store = None
+        my._size = 0
+        my._lock = threading.Lock()
+        # The scanner's state carries over from one chunk to the next.
+        my._spans = []
+        my._depth = 0
+        my._in_string = False
+        my._in_key = False
+        my._escaped = False
+        my._key_start = my._key_end = my._value_start = None
+        my._index(pathlike)
+
+    @traced
+    def _index(my, pathlike):
+        """Decompresses the file into the temporary store and indexes it."""
+        with open(pathlike, 'rb') as infile:
+            chunk = infile.read(my.CHUNK_SIZE)
+            decompressor = zlib.decompressobj()
+            try:
+                print('Loading {0} as zlib'.format(my.name))
+                data = decompressor.decompress(chunk)
+            except zlib.error:
+                print('Failed, so loading {0} as utf-8 encoded text'.format(
+                    my.name))
+                decompressor = None
+                data = chunk
+
+            if data.startswith(b'TimeStamp'):
+                print('This text file is the final, decoded master data. Deprecated!')
+                rest = infile.read()
+                if decompressor:
+                    rest = decompressor.decompress(rest) + decompressor.flush()
+                my.text = (data + rest).decode('utf-8')
+                return
+
+            my._store = tempfile.TemporaryFile()
+            my._feed(data)
+            for chunk in iter(lambda: infile.read(my.CHUNK_SIZE), b''):
+                if decompressor:
+                    chunk = decompressor.decompress(chunk)
+                my._feed(chunk)
+            if decompressor:
+                my._feed(decompressor.flush())
+
+        # Name the sections and drop the ones without data.
+        for key_start, key_end, value_start, value_end in my._spans:
+            name = json.loads(b'"' + my._read(key_start, key_end) + b'"')
+            if value_end - value_start <= 16 and my._read(
+                    value_start, value_end).strip() in _EMPTY_JSON_VALUES:
+                continue
+            my.offsets[name] = (value_start, value_end)
+        my._spans = []
+
+    def _feed(my, data):
+        """Stores one chunk of decompressed data and scans it."""
+        base = my._size
+        my._store.write(data)
+        my._size += len(data)
+        pos = 0
+        end = len(data)
+        if my._escaped and end:
+            # The previous chunk ended on a backslash inside of a string.
+            my._escaped = False
+            pos = 1
+        while pos < end:
+            if my._in_string:
+                match = _JSON_STRING_END.search(data, pos)
+                if not match:
+                    break
+                pos = match.end()
+                if match.group() == b'\\':
+                    # Skip over whatever is escaped.
+                    pos += 1
+                    my._escaped = pos > end
+                    continue
+                my._in_string = False
+                if my._in_key:
+                    my._in_key = False
+                    my._key_end = base + match.start()
+                continue
+
+            match = _JSON_STRUCTURE.search(data, pos)
+            if not match:
+                break
+            char = match.group()
+            pos = match.end()
+            if char == b'"':
+                my._in_string = True
+                if my._depth == 1 and my._value_start is None:
+                    my._in_key = True
+                    my._key_start = base + pos
+            elif char in (b'{', b'['):
+                my._depth += 1
+            elif char == b':':
+                if my._depth == 1:
+                    my._value_start = base + pos
+            else:
+                # The char is a comma or a closing bracket.
+                if my._depth == 1 and my._value_start is not None:
+                    my._spans.append((my._key_start, my._key_end,
+                        my._value_start, base + match.start()))
+                    my._value_start = None
+                if char != b',':
+                    my._depth -= 1
+
+    def _read(my, start, end):
+        with my._lock:
+            my._store.seek(start)
+            return my._store.read(end - start)
+
+    def get(my, name):
+        """Decodes one section of the file."""
+        start, end = my.offsets[name]
+        with span('MasterSectionIndex.get', section=name, file=my.name):
+            return json.loads(my._read(start, end))
+
+    def close(my):
+        if my._store:
+            my._store.close()
+            my._store = None
+
+class MasterSections(Mapping):
+    """A read-only dict of section names to data merged from many files.
+
+    Sections are decoded from the MasterSectionIndex instances when they are
+    first accessed and are kept afterwards. If a section exists in multiple
+    files, the data is concatenated in the order of the files.
+    """
+
+    def __init__(my, indexes):
+        """Constructor.
+
+        @param indexes: A list of MasterSectionIndex instances.
+        """
+
+        my.indexes = indexes
+        my._decoded = {}
+        my._names = OrderedDict()
+        for index in indexes:
+            for name in index.offsets:
+                my._names[name] = True
+
+    def decode(my, name):
+        """Decodes a section without keeping the result."""
+        if name in my._decoded:
+            return my._decoded[name]
+        merged = None
+        for index in my.indexes:
+            if name not in index.offsets:
+                continue
+            val = index.get(name)
+            merged = val if merged is None else merged + val
+        if merged is None:
+            raise KeyError(name)
+        return merged
+
+    def forget(my, name):
+        """Drops a decoded section so that its memory can be reclaimed."""
+        my._decoded.pop(name, None)
+
+    def __getitem__(my, name):
+        if name not in my._decoded:
+            my._decoded[name] = my.decode(name)
+        return my._decoded[name]
+
+    def __contains__(my, name):
+        return name in my._names
+
+    def __iter__(my):
+        return iter(my._names)
+
+    def __len__(my):
+        return len(my._names)
+
 class MasterDataLoader(object):
     """Loads all getMaster files and merges them into one data source."""
 
+    @traced
     def __init__(my):
         my.compat_mode = False
         my.master_json = None
         my.master_text = ''
+        my.master_text_index = None
 
         loaded = my.load_and_combine_getMasters()
         if type(loaded) is str:
             # For backwards compatibility, allow saving plain text
             my.master_text = loaded
+            my.master_text_index = MasterTextIndex(loaded)
             my.compat_mode = True
         else:
             my.master_json = loaded
 
     def _get_default_inputs(self):
-        if not exists(INPUT_FOLDER):
-            raise FileNotFoundError('Please put the getMaster files into ' + \
-                abspath(INPUT_FOLDER))
-        return [fil for fil in scandir(INPUT_FOLDER) if fil.is_file()]
-
-    def _append_dict_entry(self, the_dict, key, to_append):
-        if key not in the_dict:
-            if type(to_append) is str:
-                the_dict[key] = ''
-            else:
-                the_dict[key] = []
-        the_dict[key] += to_append
+        return get_default_inputs()
 
     def load_and_combine_getMasters(self, datafile_list=[]):
-        """Finds all getMaster files and merges them into a dict."""
+        """Finds all getMaster files and indexes them as one dict.
+
+        The returned MasterSections only decodes sections on demand.
+        """
         if not datafile_list:
             datafile_list = self._get_default_inputs()
 
-        master_json = {}
+        indexes = []
         for infilename in datafile_list:
-            latest_dict = self.parse_getMaster(infilename)
-            if type(latest_dict) is str:
+            latest = self.parse_getMaster(infilename)
+            if type(latest) is str:
                 # For backwards compatibility, plain text is loadable
-                return latest_dict
-            # Remove sections without data
-            for key, val in self._recursive_build_tree(latest_dict).items():
-                self._append_dict_entry(master_json, key, val)
-            # print('master_json is size ' + str(len(master_json)))
+                return latest
+            indexes.append(latest)
+        master_json = MasterSections(indexes)
         self.master_json = master_json
         return master_json
 
-    # This static vars and hidden fn are for debugging FM parsing
-    first_fm_output = True
-    listed = set()
-    def __debug_say_append(self, tosay):
-        if tosay not in self.listed:
-            # print('Appending key ' + tosay)
-            self.listed.add(tosay)
-
-    first_fm_output = True
-    def __debug_output_fm_decodes(self, val):
-        fname = path_join(OUTPUT_FOLDER, 'masterSyncDataDecoded.json')
-        # By default, we are APPENDING new data to the existing file
-        open_mode = 'a'
-        if self.first_fm_output:
-            self.first_fm_output = False
-            # Overwrite the old file with new contents
-            open_mode = 'w'
-        self._output_file(str(val), fname, open_mode)
-
-    def _parse_master_sync_list(self, val):
-        """Parses the split-up list of dicts that compose masterSyncData.
-
-        masterSyncData holds the FM data.
-        I don't know if I will be using this fn in the future.
-        """
-
-        # For debugging, output the whole thing to a file
-        self.__debug_output_fm_decodes(val)
-
-        # Remove empty entries
-        val = [i for i in val if i]
-        sub_merged = {}
-
-        # The rest of this function is unused
-        """
-        for inner_dict_or_list in val:
-            inner_tree = self._recursive_build_tree(inner_dict_or_list)
-            # Merge inner_tree into sub_merged
-            for inner_key, inner_val in inner_tree.items():
-                self.__debug_say_append(inner_key)
-                self._append_dict_entry(
-                    sub_merged, inner_key, inner_val)
-        # "val" is now reformated to be a dict
-        """
-
-        return sub_merged
-
-    def _recursive_build_tree(self, my_dict):
-        """Parses the whole tree of data stored in a master data file."""
-        merged = {}
-        assert type(my_dict) in (dict, OrderedDict), \
-            'Data type of param is wrong: ' + str(type(my_dict))
-        # Remove empty entries
-        my_dict = {k:v for k, v in my_dict.items() if v}
-        for key, val in my_dict.items():
-            if type(val) is list:
-                # We could assign "val" to the fn output.
-                # Currently, I'm not using this fn for anything
-                self._parse_master_sync_list(val)
-            # Merge sub_merged into merged
-            self._append_dict_entry(merged, key, val)
-            # print('merged is size ' + str(len(merged)))
-        return merged
-
     def parse_getMaster(my, pathlike):
-        """Loads and interprets one getMaster file.
+        """Loads and indexes one getMaster file.
         
         Expects zlib compressed JSON as the file contents.
         However, plain text is supported as for backwards compatibility.
 
-        Returns json if the the file was json, or text if it was plain text.
+        Returns a MasterSectionIndex if the file was json, or text if it was
+        plain text.
         """
-        
-        with open(pathlike, 'rb') as infile:
-            raw_string = infile.read()
-        
-        # Decode the data.
-        try:
-            print('Loading {0} as zlib'.format(pathlike.name))
-            raw_string = zlib.decompress(raw_string)
-        except zlib.error:
-            print('Failed, so loading {0} as utf-8 encoded text'.format(
-                pathlike.name))
-        
-        raw_string = raw_string.decode('utf-8')
-        pre_decoded = type(raw_string) is str and raw_string.startswith('TimeStamp')
-        if pre_decoded:
-            print('This text file is the final, decoded master data. Deprecated!')
-            return raw_string
-        
-        json_dict = json.loads(raw_string)
-        # Decoding done. Store the data in an understandable structure.
-        master_json = {}
-        for key, content in json_dict.items():
-            master_json[key] = content
-        return master_json
+
+        index = MasterSectionIndex(pathlike)
+        if index.text is not None:
+            return index.text
+        return index
 
     def output_getMaster_json(my, fname=''):
         if my.compat_mode:
@@ -178,7 +376,7 @@ class MasterDataLoader(object):
         if not fname:
             fname = path_join(OUTPUT_FOLDER, 'bigjson')
         with open(fname, 'w', encoding='utf-8') as outfile:
-            json.dump(my.master_json, outfile, indent=4, sort_keys=True,
+            json.dump(dict(my.master_json), outfile, indent=4, sort_keys=True,
                 ensure_ascii=False)
 
     # TODO: This method acts very differently from the rest. Refactor it.
@@ -204,20 +402,30 @@ class MasterDataLoader(object):
         return recompiled_data
 
     def output_getMaster_plaintext(my, fname=''):
-        master_texts = ''
-        if my.compat_mode:
-            print('WARNING: Outputting in compatibility mode')
-            master_texts = my.master_text
-        else:
-            master_texts = 'TimeStamp:{0}\n\n'.format(
-                date.today().strftime('%d-%m-%Y') ) + \
-                '\n'.join( ['{0}\n\n{1}'.format(key, value) \
-                for key, value in my.master_json.items()] )
+        """Writes all sections as plain text.
+
+        Sections are decoded and written one at a time, so the whole
+        master data is never in memory at once.
+        """
 
         if not fname:
             fname = path_join(OUTPUT_FOLDER, 'getMaster.txt')
-        my._output_file(master_texts, fname, 'w')
-        return master_texts
+        if my.compat_mode:
+            print('WARNING: Outputting in compatibility mode')
+            my._output_file(my.master_text, fname, 'w')
+            return fname
+
+        makedirs(dirname(fname), exist_ok=True)
+        with open(fname, 'w', encoding='utf-8') as outfile:
+            outfile.write('TimeStamp:{0}\n\n'.format(
+                date.today().strftime('%d-%m-%Y')))
+            for idx, key in enumerate(my.master_json):
+                if idx:
+                    outfile.write('\n')
+                outfile.write('{0}\n\n{1}'.format(
+                    key, my.master_json.decode(key)))
+        print('Wrote the output to {0}'.format(fname))
+        return fname
 
     def _output_file(my, data, outfilename, open_mode='wb'):
         encode = None
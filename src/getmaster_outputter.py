@@ -1,62 +1,150 @@
 #!/usr/bin/python
 # coding=utf-8
+import io
 import six
 from common import *
+from entry import get_lua_texts
 from textwrap import dedent
+from tracing import traced
 
 __doc__ = """Handles the output of the master data into Wikia pages.
 
 getmaster_loader is for decoding the data.
 parse_master is for interpreting and organizing the data.
 getmaster_outputter is for outputting the organized data for the Wikia.
+
+Pages are made as one string by the get_*_page methods. The biggest pages
+can also be made piece by piece by their iter_*_page methods. Use
+MasterDataOutputter.write_page() to write any page to a file or socket
+without keeping all of it in memory when possible.
 """
 
+def indent_lua(text, indent=u'\t'):
+	"""Indents every line of some Lua code except for the first one.
+
+	This is for code which is written right after an indentation.
+	"""
+
+	return text.replace(u'\n', u'\n' + indent)
+
+class LuaModuleWriter(object):
+	"""Writes the pieces of a Wikia module as soon as they are made.
+
+	The output can be a text file, a binary file or a socket.
+	"""
+
+	def __init__(self, outfile, encoding='utf-8'):
+		"""Constructor.
+
+		@param outfile: An object with write() or sendall(). Sockets and
+			files opened in binary mode get the text encoded.
+		@param encoding: String. The encoding for binary outputs.
+		"""
+
+		self.outfile = outfile
+		self.encoding = encoding
+		self.binary = not hasattr(outfile, 'write') or \
+			isinstance(outfile, (io.RawIOBase, io.BufferedIOBase)) or \
+			'b' in getattr(outfile, 'mode', '')
+		self._write = getattr(outfile, 'write', None) or outfile.sendall
+		# The number of characters written so far.
+		self.length = 0
+
+	def write(self, text):
+		"""Writes one piece of the module."""
+		self.length += len(text)
+		if self.binary:
+			text = text.encode(self.encoding)
+		self._write(text)
+
+	def write_all(self, chunks):
+		"""Writes every piece from an iterable of strings."""
+		for chunk in chunks:
+			self.write(chunk)
+
 class MasterDataOutputter(object):
 	def __init__(self, master_data=None):
 		self.md = master_data
 
+	@traced
+	def write_page(self, outfile, page, *args):
+		"""Writes a page to a file or socket.
+
+		Pages with an iter_*_page method are written piece by piece.
+		Other pages are made as one string first.
+
+		@param outfile: See LuaModuleWriter.
+		@param page: String. The name of a page's method, such as
+			get_master_char_data_page.
+		@param args: The arguments of the page's method.
+		@returns The number of characters written.
+		"""
+
+		writer = LuaModuleWriter(outfile)
+		chunks = getattr(self, page.replace('get_', 'iter_', 1), None)
+		if chunks:
+			writer.write_all(chunks(*args))
+		else:
+			writer.write(getattr(self, page)(*args))
+		return writer.length
+
+	@traced
 	def get_skill_list_page(self):
 		"""Outputs the table of skill IDs and their related skill info."""
+		return u''.join(self.iter_skill_list_page())
+
+	def iter_skill_list_page(self):
+		"""Makes the skill list page piece by piece."""
 		# Write the page header.
 		module_name = 'Module:SkillList'
 		def getid(entry):
 			return int(entry.uniqueID or 0)
-		output = u'\n'.join([
+		yield u'\n'.join([
 			'--[[Category:Flower Knight description modules]]',
 			'--[[Category:Automatically updated modules]]',
 			'-- Relates skill IDs with their accompanying data.\n',
 			'local p = {',
+			'\t'])
 
-			# Write the page body.
-			'\t' +  u'\n\t'.join([entry.getlua(True) for entry in
-				sorted(self.md.skills.values(), key=getid)]),
+		# Write the page body.
+		separator = u''
+		for text in get_lua_texts(sorted(self.md.skills.values(), key=getid),
+			True):
+			yield separator + text
+			separator = u'\n\t'
 
-			# Write the page footer.
-			'}\n',
-			'return p',
-			])
-		return output
+		# Write the page footer.
+		yield u'\n}\n\nreturn p'
 
+	@traced
 	def get_bundled_ability_list_page(self):
 		"""Outputs the table of bundled ability IDs and their related ability info."""
+		return u''.join(self.iter_bundled_ability_list_page())
+
+	def iter_bundled_ability_list_page(self):
+		"""Makes the bundled ability list page piece by piece."""
 		# Write the page header.
 		module_name = 'Module:BundledAbilityList'
 		def getid(entry):
 			return int(entry.uniqueID)
-		output = u'\n'.join([
+		yield u'\n'.join([
 			'--[[Category:Flower Knight description modules]]',
 			'--[[Category:Automatically updated modules]]',
 			'-- Relates ability IDs with their accompanying data.',
 			'return {',
+			''])
 
-			# Write the page body.
-			u'\n'.join([entry.getlua(True) for entry in
-				sorted(self.md.abilities.values(), key=getid)]),
-			# Write the page footer.
-			'}'
-			])
-		return output
+		# Write the page body.
+		separator = u''
+		for text in get_lua_texts(sorted(self.md.abilities.values(),
+			key=getid), True):
+			yield separator + text
+			separator = u'\n'
+
+		# Write the page footer.
+		yield u'\n}'
 
+	@traced
 	def get_equipment_list_page(self):
 		"""Outputs the table of equipment IDs and their related info."""
 		# Write the page header.
@@ -78,6 +166,7 @@ class MasterDataOutputter(object):
 			''').strip().format(equips).replace(', extra3=0','')
 		return output
 
+	@traced
 	def get_equipment_stats_list_page(self):
 		"""Outputs the table of equipment IDs and their related info."""
 		# Write the page header.
@@ -96,6 +185,7 @@ class MasterDataOutputter(object):
 			}}''').strip().format(equips)
 		return output
 
+	@traced
 	def get_user_equip_list_page(self): 
 		"""Outputs the table of equipment IDs and their related info."""
 		# Write the page header.
@@ -115,36 +205,36 @@ class MasterDataOutputter(object):
 			}}''').strip().format(equips)
 		return output
 
+	@traced
 	def get_personal_equip_list_page(self):
 		"""Outputs the reverse lookup of personal equipments."""
 		# Write the page header.
 		module_name = "Module:Equipment/LookupData"
 
-		personalEquipData = {
-			int(entry.owners): [entry.equipID]
-			for entry in self.md.equipment
-			if (entry.classification2 == "21" or entry.classification2 == "30") and entry.owners.find("|") == -1
-		}
-		ownerIDList = list(personalEquipData.keys())
-		personalEquipData = {i: personalEquipData[i] for i in sorted(ownerIDList)}
+		table = self.md.get_table('equipment')
+		# Group every equipment by each of its owners in one pass.
+		by_owner = table.group_by('owners', sep='|')
+
+		# Equipment with exactly one owner marks that owner as having
+		# personal equipment. A later entry replaces an earlier one.
+		personal = table.where(classification2=set(['21', '30']),
+			owners=lambda owners: owners.find('|') == -1)
+		personalEquipData = {}
+		for row in personal:
+			personalEquipData[int(table['owners'][row])] = \
+				[table['equipID'][row]]
+		personalEquipData = {key: personalEquipData[key]
+			for key in sorted(personalEquipData)}
 
 		for key in personalEquipData:
+			owned = by_owner.get(str(key), [])
 			# Find and append shared equipment for each character.
-			personalEquipData[key] += [
-				entry.equipID
-				for entry in self.md.equipment
-				if str(key) in entry.owners.split("|")
-				and entry.equipID.startswith("38")
-				and entry.classification2 == "30"
-			]
-			
+			personalEquipData[key] += table.take('equipID', table.where(owned,
+				equipID=lambda equip_id: equip_id.startswith('38'),
+				classification2='30'))
 			# Find and append rainbow equipment for each character.
-			personalEquipData[key] += [
-				entry.equipID
-				for entry in self.md.equipment
-				if str(key) in entry.owners.split("|")
-				and len(entry.equipID) == 7
-			]
+			personalEquipData[key] += table.take('equipID', table.where(owned,
+				equipID=lambda equip_id: len(equip_id) == 7))
 
 		equips = u',\n\t'.join(['[{0}]={{{1}}}'.format(key,','.join(personalEquipData[key])) for key in personalEquipData])
 		output = (
@@ -161,55 +251,52 @@ class MasterDataOutputter(object):
 		)
 		return output
 
+	@traced
 	def get_master_char_data_page(self):
 		"""Outputs the table of every char's data and their related names."""
-		module_name = 'Module:MasterCharacterData'
-		def getname(entry):
-			return entry.fullName
-		def getid(entry):
-			return int(entry.id0)
-		knights_str = u''
-		for name in sorted(self.md.knights):
-			knights_str += '["{0}"] =\n	{1},\n'.format(
-				self.md.knights[name].fullName,
-				'\n	'.join(self.md.knights[name].get_lua().split('\n')))
-		output = dedent(u'''
-			--[[Category:Flower Knight description modules]]
-			--[[Category:Automatically updated modules]]
-			-- Relates character data to their IDs.
+		return u''.join(self.iter_master_char_data_page())
 
-			return {{
-			{0}}}
-			''').strip().format(knights_str)
-		return output
+	def iter_master_char_data_page(self):
+		"""Makes the table of every char's data piece by piece."""
+		module_name = 'Module:MasterCharacterData'
+		return self._iter_master_char_data(self.md.knights)
 
+	@traced
 	def get_master_char_data_nation_page(self, nation):
 		"""Outputs the table of every char's data by nations."""
+		return u''.join(self.iter_master_char_data_nation_page(nation))
+
+	def iter_master_char_data_nation_page(self, nation):
+		"""Makes the table of every char's data by nations piece by piece."""
 		module_name = 'Module:MasterCharacterData/Nation'
 		if int(nation) == 6: nation = '7'
 		if type(nation) is int:
 			nation = str(nation)
 		
-		def getname(entry):
-			return entry.fullName
-		def getid(entry):
-			return int(entry.id0)
-		knights_str = u''
-		for name in sorted(self.md.knights):
-			if (len(self.md.knights[name].tiers[1]['id']) == 6
-			and self.md.knights[name].nation == nation):
-				knights_str += '["{0}"] =\n	{1},\n'.format(
-					self.md.knights[name].fullName,
-					'\n	'.join(self.md.knights[name].get_lua().split('\n')))
-		output = dedent(u'''
+		knights = self.md.knights
+		return self._iter_master_char_data(name for name in knights \
+			if len(knights[name].tiers[1]['id']) == 6 \
+			and knights[name].nation == nation)
+
+	def _iter_master_char_data(self, names):
+		"""Makes a MasterCharacterData module out of some FlowerKnights.
+
+		@param names: An iterable of keys of self.md.knights. They are
+			sorted before writing.
+		"""
+
+		yield dedent(u'''
 			--[[Category:Flower Knight description modules]]
 			--[[Category:Automatically updated modules]]
 			-- Relates character data to their IDs.
 
-			return {{
-			{0}}}
-			''').strip().format(knights_str)
-		return output
+			return {
+			''').lstrip()
+		for name in sorted(names):
+			knight = self.md.knights[name]
+			yield u'["{0}"] =\n\t{1},\n'.format(knight.fullName,
+				indent_lua(knight.get_lua()))
+		yield u'}'
 
 	EQUIPMENT_AFFIXES = [u'指輪', u'腕輪', u'首飾り', u'耳飾り',]
 	def __remove_equipment_affix(self, name):
@@ -282,6 +369,7 @@ class MasterDataOutputter(object):
 			names[jp_name] = en_name
 		return names
 
+	@traced
 	def get_new_equipment_names_page(self, page):
 		"""Outputs the table of equipment names.
 
@@ -360,6 +448,7 @@ class MasterDataOutputter(object):
 
 		return template_text
 
+	@traced
 	def get_skin_info_page(self):
 		"""Outputs the table of skin IDs and their related info."""
 		# Write the page header.
@@ -372,7 +461,8 @@ class MasterDataOutputter(object):
 
 		# Make the table that resembles the master data's info
 		full_info_strings = ["['{0}'] = {1},".format(
-			entry.uniqueID, entry.getlua(True)) for entry in entries]
+			entry.uniqueID, text) for entry, text in zip(entries,
+			get_lua_texts(entries, True))]
 		skin_id_to_info_as_str = '    ' + '\n    '.join(full_info_strings)
 
 		# Make the table relating character IDs back to the skin info
@@ -470,6 +560,7 @@ class MasterDataOutputter(object):
 			lib_ids_with_exclusive_skins, lib_ids_with_paid_skins, unique_char_ids_with_minor_skins)
 		return output
 
+	@traced
 	def get_char_list_page(self):
 		"""Outputs the table of knight IDs to names, and vice-versa."""
 		# Write the page header.
@@ -505,14 +596,15 @@ class MasterDataOutputter(object):
 			''').lstrip().format(ids_to_names, names_to_ids)
 		return output
 
+	@traced
 	def get_flower_memories_list_page(self):
 		"""Outputs the table of Flower Memory IDs and their related info."""
 		# Write the page header.
 		module_name = 'Module:FlowerMemories/Data'
 		def getid(entry):
 			return int(entry.flowerMemoryID)
-		memories = u',\n\t'.join([entry.getlua(True) for entry in
-			sorted(self.md.flower_memories, key=getid)])
+		memories = u',\n\t'.join(get_lua_texts(
+			sorted(self.md.flower_memories, key=getid), True))
 		output = dedent(u'''
 			--[[Category:Flower Memory modules]]
 			--[[Category:Automatically updated modules]]
@@ -524,14 +616,15 @@ class MasterDataOutputter(object):
 			''').strip().format(memories)
 		return output
 
+	@traced
 	def get_flower_memories_abilities_page(self):
 		"""Outputs the table of Memory Abilities IDs and their related info."""
 		# Write the page header.
 		module_name = 'Module:FlowerMemories/AbilityData'
 		def getid(entry):
 			return int(entry.id)
-		memories = u',\n\t'.join([entry.getlua(True) for entry in
-			sorted(self.md.memory_abilities.values(), key=getid)])
+		memories = u',\n\t'.join(get_lua_texts(
+			sorted(self.md.memory_abilities.values(), key=getid), True))
 		output = dedent(u'''
 			--[[Category:Flower Memory modules]]
 			--[[Category:Automatically updated modules]]
@@ -543,6 +636,7 @@ class MasterDataOutputter(object):
 			''').strip().format(memories)
 		return output
 
+	@traced
 	def get_eternal_oath_page(self):
 		"""Outputs the table of Memory Abilities IDs and their related info."""
 		# Write the page header.
@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+# coding: utf-8
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+from urllib.parse import urlsplit, urlunsplit, quote
+import requests
+from getmaster_loader import OUTPUT_FOLDER
+
+__doc__ = """Keeps downloaded web pages on disk so they are not downloaded again.
+
+The quote and seasonal scripts read the same Japanese wiki pages on every
+run. This cache stores each response under its normalized URL, along with
+its ETag and Last-Modified date. Stored pages are checked with a conditional
+GET, so the server only sends the page again if it changed. A caller may
+give a TTL. Then a page fetched less than the TTL ago is read straight from
+the disk, even if it changed since.
+
+If the server cannot be reached, the stored copy is used even if it is old.
+"""
+
+DEFAULT_CACHE_FOLDER = os.path.join(OUTPUT_FOLDER, 'httpCache')
+# The seconds a stored page is used without asking the server about it.
+# By default, the server is always asked.
+DEFAULT_TTL = 0
+# Japanese wiki pages of characters have this tag. Pages without it are
+# missing, usually because the title uses full-width parentheses.
+JP_WIKI_PAGE_TAG = '<div class="ie5">'
+
+_PERCENT_ESCAPE = re.compile(r'%[0-9a-fA-F]{2}')
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+# These are left as-is. Everything else, like Japanese text, is %-escaped.
+_SAFE_URL_CHARS = "%/:=&?~+!$,;'@()*[]"
+
+def normalize_url(url):
+	"""Makes one spelling of URLs that request the same page.
+
+	The scheme and host are lowercased, and the host is IDNA encoded.
+	Default ports and fragments are dropped. Non-ASCII characters are
+	%-escaped and existing escapes are uppercased. Queries that are all
+	key=value pairs are sorted.
+
+	@param url: String. The URL to normalize.
+	@returns A string.
+	"""
+
+	parts = urlsplit(url.strip())
+	scheme = parts.scheme.lower()
+	host = (parts.hostname or '').encode('idna').decode('ascii')
+	if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+		host += ':{0}'.format(parts.port)
+
+	def escape(text):
+		return _PERCENT_ESCAPE.sub(lambda match: match.group(0).upper(),
+			quote(text, safe=_SAFE_URL_CHARS))
+
+	path = escape(parts.path) or '/'
+	query = parts.query
+	pairs = query.split('&')
+	if query and all('=' in pair for pair in pairs):
+		query = '&'.join(sorted(pairs))
+	return urlunsplit((scheme, host, path, escape(query), ''))
+
+class CachedResponse(object):
+	"""The parts of a requests.Response that the scrapers use."""
+
+	def __init__(my, url, status_code, content, encoding, from_cache):
+		my.url = url
+		my.status_code = status_code
+		my.content = content
+		my.encoding = encoding
+		# True if the server was not sent a request or said 304.
+		my.from_cache = from_cache
+
+	@property
+	def text(my):
+		return my.content.decode(my.encoding or 'utf-8', 'replace')
+
+	@property
+	def ok(my):
+		return 200 <= my.status_code < 400
+
+class HttpCache(object):
+	"""An on-disk cache of web pages with TTL and ETag revalidation."""
+
+	# The seconds to wait on a server before giving up on a request.
+	# It matches DownloadEngine.TIMEOUT.
+	TIMEOUT = 30.0
+
+	def __init__(my, folder=DEFAULT_CACHE_FOLDER, ttl=DEFAULT_TTL):
+		"""Constructor.
+
+		@param folder: String. Where the pages are stored.
+		@param ttl: Number. See DEFAULT_TTL.
+		"""
+
+		my.folder = folder
+		my.ttl = ttl
+		# A session keeps the connection alive between pages.
+		my.session = requests.Session()
+		# The number of requests that went to the network.
+		my.requests = 0
+
+	def _get_paths(my, url):
+		"""Gets the metadata and content filenames of a normalized URL."""
+		name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+		return (os.path.join(my.folder, name + '.json'),
+			os.path.join(my.folder, name + '.bin'))
+
+	def _write_atomic(my, path, data):
+		"""Writes a file so that an interrupted write keeps the old file."""
+		os.makedirs(my.folder, exist_ok=True)
+		handle, temp_path = tempfile.mkstemp(dir=my.folder)
+		with os.fdopen(handle, 'wb') as outfile:
+			outfile.write(data)
+		os.replace(temp_path, path)
+
+	def _load(my, url):
+		"""Reads the stored metadata and content of a normalized URL.
+
+		@returns A tuple of (metadata dict, content bytes), or (None, None).
+		"""
+
+		meta_path, content_path = my._get_paths(url)
+		try:
+			with open(meta_path, 'r', encoding='utf-8') as infile:
+				meta = json.load(infile)
+			with open(content_path, 'rb') as infile:
+				return meta, infile.read()
+		except (IOError, ValueError):
+			return None, None
+
+	def _store(my, url, meta, content=None):
+		meta_path, content_path = my._get_paths(url)
+		if content is not None:
+			my._write_atomic(content_path, content)
+		my._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+	def get(my, url, ttl=None):
+		"""Gets a web page, from the disk if possible.
+
+		@param url: String. The URL to request.
+		@param ttl: Number or None. Overrides the cache's TTL.
+		@returns A CachedResponse.
+		@raises requests.RequestException if the server cannot be reached
+			and the page was never stored.
+		"""
+
+		url = normalize_url(url)
+		ttl = my.ttl if ttl is None else ttl
+		meta, content = my._load(url)
+		if meta and time.time() - meta['fetched'] < ttl:
+			return CachedResponse(url, meta['status'], content,
+				meta['encoding'], True)
+
+		headers = {}
+		if meta:
+			if meta.get('etag'):
+				headers['If-None-Match'] = meta['etag']
+			if meta.get('last_modified'):
+				headers['If-Modified-Since'] = meta['last_modified']
+		try:
+			my.requests += 1
+			response = my.session.get(url, headers=headers,
+				timeout=my.TIMEOUT)
+		except requests.RequestException as error:
+			if not meta:
+				raise
+			print('Warning: Using the stored copy of {0}: {1}'.format(url,
+				error))
+			return CachedResponse(url, meta['status'], content,
+				meta['encoding'], True)
+
+		if response.status_code == 304 and meta:
+			meta['fetched'] = time.time()
+			my._store(url, meta)
+			return CachedResponse(url, meta['status'], content,
+				meta['encoding'], True)
+		encoding = response.encoding or response.apparent_encoding
+		# Errors are not stored so that they are asked for again next time.
+		if response.ok:
+			my._store(url, {
+				'url': url,
+				'status': response.status_code,
+				'encoding': encoding,
+				'etag': response.headers.get('ETag'),
+				'last_modified': response.headers.get('Last-Modified'),
+				'fetched': time.time(),
+			}, response.content)
+		return CachedResponse(url, response.status_code, response.content,
+			encoding, False)
+
+	def get_text(my, url, ttl=None):
+		"""Gets the decoded text of a web page. See get()."""
+		return my.get(url, ttl).text
+
+	def get_jp_wiki_page(my, base_url, chara_name):
+		"""Gets a character's page from the Japanese wiki.
+
+		Some titles use full-width parentheses. If the page with normal
+		parentheses is missing, the full-width title is tried instead.
+
+		@param base_url: String. The wiki's URL that titles are added to.
+		@param chara_name: String. The character's Japanese name.
+		@returns A tuple of (page text, the full-width title or None).
+		"""
+
+		text = my.get_text(base_url + chara_name)
+		if text.find(JP_WIKI_PAGE_TAG) != -1:
+			return text, None
+		redirect = chara_name.replace("(", "（").replace(")", "）")
+		return my.get_text(base_url + redirect), redirect
+
+# The cache shared by every script.
+http_cache = HttpCache()
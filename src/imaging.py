@@ -2,6 +2,8 @@
 # coding=utf-8
 from __future__ import print_function
 import os
+from concurrent.futures import ProcessPoolExecutor
+from tracing import traced
 
 _HAS_LIB = False
 try:
@@ -18,6 +20,7 @@ class Imaging(object):
 	See: get_framed_icon()
 
 	It is only necessary to make one instance of this class and reuse it.
+	To frame many icons at once, use get_framed_icons().
 	"""
 
 	ICON_BACKGROUNDS = [
@@ -69,16 +72,19 @@ class Imaging(object):
 		my.icon_stages = [my.load_image(filename) for filename in Imaging.ICON_STAGES]
 		my.fm_frames = [my.load_image(filename) for filename in Imaging.MEMORY_FRAMES]
 		my.fm_plates = [my.load_image(filename) for filename in Imaging.MEMORY_PLATES]
+		# Icon layers above the character, merged ahead of time.
+		# Keys are (rarity, typing, stage) after the typing is normalized.
+		my._icon_overlays = {}
 
 	def load_image(my, filename):
 		"""Loads an image or returns the image as-is."""
 		if not _HAS_LIB:
 			return None
 		elif type(filename) is str:
-			if Image.open(filename).mode != 'RGBA':
-				return Image.open(filename).convert('RGBA')
-			else:
-				return Image.open(filename)
+			image = Image.open(filename)
+			if image.mode != 'RGBA':
+				return image.convert('RGBA')
+			return image
 		return filename
 
 	def _print_no_library_warning(my):
@@ -118,6 +124,7 @@ class Imaging(object):
 		result = my.apply_layer(result, bottom_image)
 		return result
 
+	@traced
 	def get_framed_icon(my, icon_filename, outfilename, rarity, typing=None, stage=None):
 		"""Produces the full icon for a character.
 
@@ -134,23 +141,59 @@ class Imaging(object):
 		if not char_icon:
 			return None
 		# Select the layers to use.
-		frame = my.icon_frames[rarity - 1]
 		bg = my.icon_bgs[rarity - 1]
-		# 5 has no attack icon frame, while 100 is Dream-type.
-		if typing == 5: typing = None
-		if typing :
-			if typing == 100: typing = 5
-			icon_typing = my.icon_types[typing - 1]
-		if stage  : stage_level = my.icon_stages[stage - 1]
-		# Apply the layers.
-		result = my.apply_layer(char_icon, bg)
-		result = my.apply_layer(frame, result)
-		if typing : result = my.apply_layer(icon_typing, result)
-		if stage  : result = my.apply_layer(stage_level, result)
+		overlay = my._get_icon_overlay(rarity, typing, stage)
+		# Apply the layers. The background goes under the character and
+		# everything else goes over it.
+		result = Image.alpha_composite(bg, char_icon)
+		result = Image.alpha_composite(result, overlay)
 		# Save and return the result.
 		result.save(outfilename, 'png')
 		return result
 
+	def _get_icon_overlay(my, rarity, typing=None, stage=None):
+		"""Gets the frame, type and stage layers of an icon as one image.
+
+		The result is cached, so each combination is only merged once.
+		"""
+
+		# 5 has no attack icon frame, while 100 is Dream-type.
+		if typing == 5: typing = None
+		if typing == 100: typing = 5
+		key = (rarity, typing, stage)
+		if key not in my._icon_overlays:
+			overlay = my.icon_frames[rarity - 1]
+			if typing : overlay = Image.alpha_composite(overlay, my.icon_types[typing - 1])
+			if stage  : overlay = Image.alpha_composite(overlay, my.icon_stages[stage - 1])
+			my._icon_overlays[key] = overlay
+		return my._icon_overlays[key]
+
+	@traced
+	def get_framed_icons(my, jobs, processes=None):
+		"""Produces the full icons for many characters.
+
+		The work is split across a pool of processes. Each process loads
+		the layer images once and reuses them for all of its icons.
+
+		@param jobs: A list of argument tuples for get_framed_icon().
+			Each is (icon_filename, outfilename, rarity, typing, stage).
+			The typing and stage may be left out.
+		@param processes: Integer. The number of processes to use.
+			Defaults to the number of CPUs. When 1, no pool is made.
+		@returns A list of booleans in the same order as the jobs.
+			Each is True if that icon was saved.
+		"""
+
+		if not _HAS_LIB: my._print_no_library_warning(); return [False] * len(jobs)
+		jobs = [tuple(job) for job in jobs]
+		processes = min(processes or os.cpu_count() or 1, len(jobs))
+		if processes <= 1:
+			return [_frame_icon_job(job, my) for job in jobs]
+		with ProcessPoolExecutor(processes) as pool:
+			return list(pool.map(_frame_icon_job, jobs,
+				chunksize=max(1, len(jobs) // (processes * 4))))
+
+	@traced
 	def get_framed_halficon(my, icon_filename, outfilename, rarity):
 		"""Produces the half-height icon for a character.
 
@@ -175,6 +218,7 @@ class Imaging(object):
 		result.save(outfilename, 'png')
 		return result
 
+	@traced
 	def get_framed_memory(my, fm_wallpaper, fm_title, outfilename, rarity):
 		"""Produces the fully framed for a Flower Memory wallpaper.
 		@param fm_wallpaper: An Image instance or filename.
@@ -199,3 +243,26 @@ class Imaging(object):
 		# Save and return the result.
 		result.save(outfilename, 'png')
 		return result
+
+# The Imaging instance of each worker process of get_framed_icons().
+_worker_imaging = None
+
+def _frame_icon_job(job, imaging=None):
+	"""Frames one icon for get_framed_icons().
+
+	@param job: An argument tuple for Imaging.get_framed_icon().
+	@param imaging: The Imaging instance to use. Worker processes make
+		their own instance on first use.
+	@returns True if the icon was saved.
+	"""
+
+	global _worker_imaging
+	if imaging is None:
+		if _worker_imaging is None:
+			_worker_imaging = Imaging()
+		imaging = _worker_imaging
+	try:
+		return imaging.get_framed_icon(*job) is not None
+	except Exception as error:
+		print('Unable to frame {0}: {1}'.format(job[1], error))
+		return False
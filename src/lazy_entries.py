@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+# coding: utf-8
+from collections.abc import MutableMapping, Sequence
+from common import remove_quotes
+
+__doc__ = """Containers that make Entry instances only when they are used.
+
+Making an Entry splits its whole CSV line and checks its size. Most actions
+only look at a few characters, so making every Entry of every section up
+front is wasted work. These containers keep the raw CSV lines instead and
+make each Entry the first time it is read. Iterating them makes every
+Entry, so whole-page outputters work the same as with plain lists and dicts.
+Entries that are made together are split in bulk by
+BaseEntry.make_entries().
+
+The lines are what gets pickled. Entries that were made from a line are
+dropped and made again on their next use. Entries that were put in
+directly, without a line, are pickled as they are.
+"""
+
+def get_csv_values(line, indices):
+	"""Reads a few CSV values of a line without splitting all of it.
+
+	The values are read the same way as split_and_check_count() reads them.
+
+	@param line: String. One line of CSV.
+	@param indices: A list of column indices.
+	@returns A list of strings, one per index. Missing values are ''.
+	"""
+
+	values = line.rstrip().split(',', max(indices) + 1)
+	return [remove_quotes(values[i]) if i < len(values) else '' \
+		for i in indices]
+
+class LazyDict(MutableMapping):
+	"""A dict whose values are made from a source on first use.
+
+	Each key has a source, such as a CSV line. The first time a key is read,
+	its value is made by passing its source to a function. The value is
+	kept for later reads. A key set directly has None as its source.
+	"""
+
+	def __init__(my, make, sources=None):
+		"""Constructor.
+
+		@param make: A function taking a source and returning a value.
+			It must be picklable, e.g. a class or module-level function.
+		@param sources: A dict of keys to sources. It is used as-is.
+		"""
+
+		my.make = make
+		my.sources = sources if sources is not None else {}
+		my.made = {}
+
+	def __getitem__(my, key):
+		try:
+			return my.made[key]
+		except KeyError:
+			pass
+		value = my.made[key] = my.make(my.sources[key])
+		return value
+
+	def __setitem__(my, key, value):
+		# Existing keys keep their place in the iteration order.
+		if key not in my.sources:
+			my.sources[key] = None
+		my.made[key] = value
+
+	def __delitem__(my, key):
+		del my.sources[key]
+		my.made.pop(key, None)
+
+	def __contains__(my, key):
+		return key in my.sources
+
+	def __iter__(my):
+		return iter(my.sources)
+
+	def __len__(my):
+		return len(my.sources)
+
+	def __repr__(my):
+		return '{0}({1} keys, {2} made)'.format(type(my).__name__,
+			len(my.sources), len(my.made))
+
+	def set_source(my, key, source):
+		"""Sets the source of a key. Its value is made again on next use."""
+		my.sources[key] = source
+		my.made.pop(key, None)
+
+	def is_made(my, key):
+		"""Says whether the value of a key was already made."""
+		return key in my.made
+
+	def __getstate__(my):
+		state = dict(vars(my))
+		state['made'] = {key: value for key, value in my.made.items() \
+			if my.sources.get(key) is None}
+		return state
+
+class LazyEntryDict(LazyDict):
+	"""A dict of Entry instances keyed by one of their CSV values.
+
+	Like a dict comprehension over the entries, a repeated key keeps the
+	last line with that key.
+	"""
+
+	def __init__(my, entry_class, lines=[], key_name='id0'):
+		"""Constructor.
+
+		@param entry_class: A child class of BaseEntry.
+		@param lines: A list of CSV lines for entry_class.
+		@param key_name: String. The name in entry_class._CSV_NAMES
+			whose value keys each entry.
+		"""
+
+		index = entry_class._CSV_NAMES.index(key_name)
+		sources = {}
+		for line in lines:
+			sources[get_csv_values(line, [index])[0]] = line
+		super(LazyEntryDict, my).__init__(entry_class, sources)
+
+	def make_all(my):
+		"""Makes every entry that was not made yet in one go.
+
+		See BaseEntry.make_entries(). It is much faster than making the
+		entries one by one.
+		"""
+
+		keys = [key for key, line in my.sources.items() \
+			if line is not None and key not in my.made]
+		if keys:
+			entries = my.make.make_entries([my.sources[key] for key in keys])
+			my.made.update(zip(keys, entries))
+
+	def values(my):
+		my.make_all()
+		return super(LazyEntryDict, my).values()
+
+	def items(my):
+		my.make_all()
+		return super(LazyEntryDict, my).items()
+
+class LazyEntryList(Sequence):
+	"""A list of Entry instances that are made from their CSV lines on use."""
+
+	def __init__(my, entry_class, lines=[]):
+		"""Constructor.
+
+		@param entry_class: A child class of BaseEntry.
+		@param lines: A list of CSV lines for entry_class.
+		"""
+
+		my.entry_class = entry_class
+		my.sources = list(lines)
+		my.made = [None] * len(my.sources)
+
+	def _get(my, index):
+		entry = my.made[index]
+		if entry is None:
+			entry = my.made[index] = my.entry_class(my.sources[index])
+		return entry
+
+	def __getitem__(my, index):
+		if type(index) is slice:
+			return [my._get(i) for i in range(*index.indices(len(my)))]
+		if index < 0:
+			index += len(my.sources)
+		if not 0 <= index < len(my.sources):
+			raise IndexError('LazyEntryList index out of range')
+		return my._get(index)
+
+	def __iter__(my):
+		# Make every entry first. Iterating the list of entries is much
+		# faster than reading them one by one.
+		my.make_all()
+		return iter(my.made)
+
+	def __len__(my):
+		return len(my.sources)
+
+	def make_all(my):
+		"""Makes every entry that was not made yet in one go.
+
+		See BaseEntry.make_entries(). It is much faster than making the
+		entries one by one.
+		"""
+
+		if None not in my.made:
+			return
+		indices = [index for index, entry in enumerate(my.made) \
+			if entry is None]
+		entries = my.entry_class.make_entries(
+			[my.sources[index] for index in indices])
+		for index, entry in zip(indices, entries):
+			my.made[index] = entry
+
+	def __repr__(my):
+		return 'LazyEntryList({0} rows of {1})'.format(len(my.sources),
+			my.entry_class.__name__)
+
+	def append(my, entry):
+		"""Adds an Entry instance that was made elsewhere."""
+		my.sources.append(None)
+		my.made.append(entry)
+
+	def __getstate__(my):
+		state = dict(vars(my))
+		state['made'] = [entry if line is None else None \
+			for entry, line in zip(my.made, my.sources)]
+		return state
@@ -1,7 +1,7 @@
 #!/usr/bin/python3
 # coding=utf-8
 from __future__ import print_function
-import os, sys, math, re, random, zlib, hashlib
+import os, sys, math, re, random, zlib, hashlib, time
 from textwrap import dedent
 import networking
 
@@ -20,8 +20,42 @@ elif sys.version_info.major < 3:
 
 from parse_master import *
 from common import *
+from getmaster_loader import OUTPUT_FOLDER
 
-__doc__ = """Checks the getMaster Data to generate the template data"""
+__doc__ = """Checks the getMaster Data to generate the template data
+
+Run it with no arguments to choose actions at a prompt.
+Run it with --batch to write module pages without a prompt, such as from
+a cron job. Each page goes to its own file in outputs/batch:
+python main.py --batch "skill list" "equip list" "master char list"
+python main.py --batch --workers 2
+Without any actions, every page in PAGE_ACTIONS is written.
+"""
+
+# The actions which write a module page, and the MasterDataOutputter method
+# and arguments of each page. They are every module that update_lists.py
+# updates. The slowest are first so that batches start them first.
+PAGE_ACTIONS = {
+	'master char list': ('get_master_char_data_page', ()),
+}
+# Each nation's part of the Master Character List.
+PAGE_ACTIONS.update({'master char list {0}'.format(name.lower()):
+	('get_master_char_data_nation_page', (nation,)) \
+	for nation, name in nationList.items()})
+PAGE_ACTIONS.update({
+	'char list': ('get_char_list_page', ()),
+	'skill list': ('get_skill_list_page', ()),
+	'ability list': ('get_bundled_ability_list_page', ()),
+	'blessed oath list': ('get_eternal_oath_page', ()),
+	'skin list': ('get_skin_info_page', ()),
+	'flower memory list': ('get_flower_memories_list_page', ()),
+	'flower memory ability list': ('get_flower_memories_abilities_page', ()),
+	'equip list': ('get_equipment_list_page', ()),
+	'equip stats list': ('get_equipment_stats_list_page', ()),
+	'equip owner list': ('get_user_equip_list_page', ()),
+	'equip lookup list': ('get_personal_equip_list_page', ()),
+})
+BATCH_FOLDER = os.path.join(OUTPUT_FOLDER, 'batch')
 
 def output_template(text, outfilename=DEFAULT_OUTFILENAME, append=True):
 	has_data = append and os.path.exists(outfilename) and os.path.getsize(outfilename) > 0
@@ -34,6 +68,19 @@ def output_template(text, outfilename=DEFAULT_OUTFILENAME, append=True):
 			print("Creating new file: " + outfilename)
 		outfile.write(text)
 
+def output_page(master_data, page, *args):
+	"""Writes a Wikia module page straight to the default output file.
+
+	Big pages are written piece by piece instead of as one string.
+
+	@param page: String. The name of a MasterDataOutputter page method,
+		such as get_master_char_data_page.
+	"""
+
+	with open(DEFAULT_OUTFILENAME, 'w', encoding='utf-8') as outfile:
+		master_data.outputter.write_page(outfile, page, *args)
+	print('Completed the processing.')
+
 #def UploadImage(Image):
 
 #def UploadData(dataKnight):
@@ -168,6 +215,8 @@ def action_prompt(master_data, input_name_or_id=None, english_name=''):
 		ACT_WRITE_SKIN_LIST:'Write the Skin list page (Skin ID:All Data)',
 		ACT_FRAME_ICONS:'Puts frames on all character icons in the "dl" folder.',
 	}
+	for action in PAGE_ACTIONS:
+		action_list.setdefault(action, 'Write the {0} page.'.format(action))
 	def list_actions():
 		for key, action in action_list.items():
 			print('{0}: {1}'.format(key, action))
@@ -193,24 +242,14 @@ def action_prompt(master_data, input_name_or_id=None, english_name=''):
 			list_actions()
 		elif user_input == ACT_UNIT_TEST:
 			UnitTest().run_tests()
-		elif user_input == ACT_WRITE_CHAR_NAME_LIST:
-			output_text = master_data.outputter.get_char_list_page()
+		elif user_input in PAGE_ACTIONS:
+			output_page(master_data, *PAGE_ACTIONS[user_input])
 		elif user_input == ACT_GET_CHAR_TEMPLATE:
 			output_text = get_char_template(master_data)
 		elif user_input == ACT_DL_CHAR_IMAGES:
 			output_text = download_character_images(master_data, networking)
 		elif user_input == ACT_DL_EQUIP_IMAGES:
 			networking.dl_equip_pics(master_data.equipment)
-		elif user_input == ACT_WRITE_SKILL_LIST:
-			output_text = master_data.get_skill_list_page()
-		elif user_input == ACT_WRITE_ABILITY_LIST:
-			output_text = master_data.get_bundled_ability_list_page()
-		elif user_input == ACT_WRITE_SKIN_LIST:
-			output_text = master_data.get_skin_info_page()
-		elif user_input == ACT_WRITE_MASTER_CHAR_LIST:
-			output_text = master_data.get_master_char_data_page()
-		elif user_input == ACT_WRITE_EQUIP_LIST:
-			output_text = master_data.get_equipment_list_page()
 		elif user_input == ACT_FIND_CHAR:
 			char_name_or_id = input("Input the character's Japanese name or ID: ")
 			print('\n\n'.join([entry.getlua() for entry in
@@ -227,6 +266,87 @@ def action_prompt(master_data, input_name_or_id=None, english_name=''):
 				outfile.write(output_text)
 			print('Completed the processing.')
 
+def get_batch_filename(action, folder=BATCH_FOLDER):
+	"""Gets the output file of a batch action, like skill_list.txt."""
+	return os.path.join(folder, action.replace(' ', '_') + '.txt')
+
+def run_batch(actions=None, folder=BATCH_FOLDER, workers=None,
+	master_data=None):
+	"""Does the page actions of the prompt without asking anything.
+
+	The master data is loaded once. Then the pages are written by a
+	RenderPool's worker processes at the same time. Making a page does not
+	change the master data, so a page is the same as when it is the only
+	action at the prompt.
+
+	@param actions: A list of keys of PAGE_ACTIONS. Defaults to all.
+	@param folder: String. Where the pages are written.
+	@param workers: Integer. The number of worker processes. Defaults to
+		the number of CPUs.
+	@param master_data: A loaded MasterData, or None to load it.
+	@returns A list of the actions that failed.
+	"""
+
+	from render_pool import RenderPool
+
+	actions = actions or list(PAGE_ACTIONS)
+	unknown = [action for action in actions if action not in PAGE_ACTIONS]
+	if unknown:
+		raise ValueError('These are not page actions: {0}. Use any of: {1}'.format(
+			', '.join(unknown), ', '.join(sorted(PAGE_ACTIONS))))
+	# RenderPool names each file after its key, like skill_list.txt.
+	pages = {action.replace(' ', '_'):action for action in actions}
+	pool = RenderPool(master_data or MasterData(), workers)
+
+	failed = []
+	start = time.time()
+	for key, text, error in pool.iter_results({key:PAGE_ACTIONS[action] \
+		for key, action in pages.items()}, folder):
+		if error:
+			print('Warning: Unable to do "{0}": {1}: {2}'.format(pages[key],
+				type(error).__name__, error))
+			failed.append(pages[key])
+		else:
+			print('Wrote {0} in {1:.2f} seconds.'.format(
+				get_batch_filename(pages[key], folder), pool.times[key]))
+	print('Completed {0} of {1} actions in {2:.2f} seconds.'.format(
+		len(pages) - len(failed), len(pages), time.time() - start))
+	return failed
+
+def run_batch_main(argv):
+	"""Runs the batch mode from command line arguments.
+
+	@param argv: A list of arguments after --batch. --workers N and
+		--folder PATH are options. The others are actions.
+	@returns The exit code. It is 1 if any action failed.
+	"""
+
+	workers = None
+	folder = BATCH_FOLDER
+	actions = []
+	args = iter(argv)
+	try:
+		for arg in args:
+			if arg == '--workers':
+				workers = int(next(args))
+				if workers < 1:
+					raise ValueError('--workers must be at least 1.')
+			elif arg == '--folder':
+				folder = next(args)
+			else:
+				actions.append(arg)
+	except (StopIteration, ValueError) as error:
+		print(str(error) or 'An option is missing its value.')
+		print('Usage: python main.py --batch [ACTION...] [--workers N] '
+			'[--folder PATH]')
+		return 1
+	try:
+		failed = run_batch(actions, folder, workers)
+	except ValueError as error:
+		print(error)
+		return 1
+	return 1 if failed else 0
+
 def run_standalone(input_name_or_id=None, english_name=''):
 	# Open and parse the master database
 	master_data = MasterData()
@@ -242,6 +362,8 @@ def run_standalone(input_name_or_id=None, english_name=''):
 	return master_data
 	
 if __name__ == '__main__':
+	if '--batch' in sys.argv:
+		sys.exit(run_batch_main(sys.argv[sys.argv.index('--batch') + 1:]))
 	if ((type(findID) is list) and (type(english_nameList) is list)):
 		li = 0
 		for ID in findID:
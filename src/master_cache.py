@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# coding: utf-8
+import pickle
+import hashlib
+from os import makedirs, replace
+from os.path import exists, dirname, abspath, join as path_join
+from getmaster_loader import OUTPUT_FOLDER, get_inputs_digest
+from tracing import traced
+
+__doc__ = """Caches the fully parsed master data between runs.
+
+Parsing getMaster means decompressing it, decoding the JSON, splitting
+every section's CSV and building thousands of Entry instances. The result
+only changes when the getMaster files change, so it is pickled to disk.
+
+The cache is keyed by a hash of the input files and of the source files
+that define the pickled classes. When either changes, the cache is ignored
+and overwritten after the next full parse.
+"""
+
+CACHE_FILENAME = path_join(OUTPUT_FOLDER, 'masterDataCache.pickle')
+# These source files define the classes stored inside of the cache.
+_CACHED_SOURCES = ['entry.py', 'flowerknight.py', 'parse_master.py',
+	'lazy_entries.py']
+
+def get_code_digest(filenames=_CACHED_SOURCES):
+	"""Hashes the source code of some modules in this folder.
+
+	@param filenames: A list of source filenames. Defaults to the modules
+		whose classes are cached.
+	@returns A hex string.
+	"""
+
+	digest = hashlib.sha1()
+	src_dir = dirname(abspath(__file__))
+	for filename in filenames:
+		with open(path_join(src_dir, filename), 'rb') as infile:
+			digest.update(infile.read())
+	return digest.hexdigest()
+
+class MasterDataCache(object):
+	"""Saves and loads the parsed state of a MasterData instance.
+
+	The file holds two pickles. The first is a small header with the key.
+	The second is the state itself. It is only unpickled when the key
+	in the header matches the current input files.
+	"""
+
+	def __init__(my, filename=CACHE_FILENAME, datafile_list=[]):
+		my.filename = filename
+		my.key = '{0}-{1}'.format(get_inputs_digest(datafile_list),
+			get_code_digest())
+
+	@traced
+	def load(my):
+		"""Loads the cached state.
+
+		@returns: A dict of MasterData members, or None if there is no
+			valid cache for the current input files.
+		"""
+
+		if not exists(my.filename):
+			return None
+		try:
+			with open(my.filename, 'rb') as infile:
+				if pickle.load(infile) != my.key:
+					return None
+				return pickle.load(infile)
+		except (pickle.UnpicklingError, EOFError, AttributeError,
+			ImportError) as error:
+			print('Ignoring the unreadable cache {0}: {1}'.format(
+				my.filename, error))
+			return None
+
+	@traced
+	def save(my, state):
+		"""Saves the state for the current input files.
+
+		The file is written under a temporary name and then renamed so
+		that an interrupted run never leaves a half-written cache behind.
+		"""
+
+		makedirs(dirname(my.filename), exist_ok=True)
+		temp_filename = my.filename + '.tmp'
+		with open(temp_filename, 'wb') as outfile:
+			pickle.dump(my.key, outfile, pickle.HIGHEST_PROTOCOL)
+			pickle.dump(state, outfile, pickle.HIGHEST_PROTOCOL)
+		replace(temp_filename, my.filename)
@@ -0,0 +1,395 @@
+#!/usr/bin/python3
+# coding: utf-8
+import os
+import sys
+import hmac
+import json
+import time
+import pickle
+import hashlib
+import socket
+import threading
+import socketserver
+import parse_master
+from getmaster_loader import get_default_inputs
+from getmaster_outputter import MasterDataOutputter
+
+__doc__ = """Keeps the master data loaded so that scripts get answers instantly.
+
+Loading MasterData takes seconds. The daemon loads it once and answers
+requests for it over a localhost socket. It watches the inputs folder and
+reloads the master data when the files change. The old data keeps answering
+until the new data is fully loaded, then they are swapped at once.
+
+Start it from the src folder:
+python master_daemon.py serve
+
+Then use MasterDataClient from any script:
+client = MasterDataClient()
+knight = client.get_knight('アマリリス')
+text = client.get_skill_list_page()
+
+Or from the command line:
+python master_daemon.py get_skill_list_page > skills.txt
+
+The protocol is one request per connection. The client sends one line of
+JSON: {"method": name, "args": [...], "nonce": random hex, "mac": hex}.
+The daemon answers with one line of JSON: {"ok": true, "kind": "text" or
+"pickle", "mac": hex} or {"ok": false, "error": message}. The rest of the
+connection is the UTF-8 text of a page or the pickle of an object.
+
+Any local user can connect to a localhost port, or listen on it while the
+daemon is down. So both sides prove that they know a secret key. The daemon
+makes the key in KEY_FILE, which only its user can read. The request's mac
+is an HMAC of the request, and the answer's mac is an HMAC of the nonce,
+the kind and the payload. The daemon refuses requests with a wrong mac, and
+the client refuses answers with a wrong mac before loading any pickle.
+"""
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 47891
+# The seconds between checks of the inputs folder.
+POLL_INTERVAL = 2.0
+# The secret key that the daemon and its clients share.
+KEY_FILE = os.path.join(os.path.expanduser('~'), '.fkg_master_daemon.key')
+
+# These MasterData methods return objects, which are sent as pickles.
+OBJECT_METHODS = ['get_knight', 'get_char_entries', 'get_personal_equipments']
+# These MasterDataOutputter methods return module pages, sent as text.
+# get_new_equipment_names_page is left out as it needs a pywikibot Page.
+PAGE_METHODS = sorted(name for name in vars(MasterDataOutputter) \
+	if name.startswith('get_') and name.endswith('_page') and \
+	name != 'get_new_equipment_names_page')
+
+def get_key(create=False):
+	"""Reads the secret key of the daemon.
+
+	@param create: Boolean. If True, a key is made if there is none.
+	@returns Bytes.
+	@raises IOError if there is no key and create is False.
+	"""
+
+	if create and not os.path.exists(KEY_FILE):
+		try:
+			# Only the user may read or write the file.
+			fd = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+		except FileExistsError:
+			pass
+		else:
+			with os.fdopen(fd, 'w') as outfile:
+				outfile.write(os.urandom(32).hex())
+	try:
+		with open(KEY_FILE, 'r') as infile:
+			return bytes.fromhex(infile.read().strip())
+	except (OSError, ValueError):
+		raise IOError('Unable to read the key in {0}. Start the daemon '
+			'first.'.format(KEY_FILE))
+
+def get_request_mac(key, method, args, nonce):
+	"""Signs a request."""
+	message = json.dumps([method, args, nonce], sort_keys=True)
+	return hmac.new(key, message.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def get_answer_hmac(key, nonce, kind):
+	"""Starts the signature of an answer. Update it with the payload."""
+	return hmac.new(key, '{0}\n{1}\n'.format(nonce, kind).encode('utf-8'),
+		hashlib.sha256)
+
+def get_inputs_signature():
+	"""Gets the names, sizes and change times of the getMaster files.
+
+	It is much cheaper than hashing them and changes whenever they do.
+	"""
+
+	return sorted((fil.name, fil.stat().st_size, fil.stat().st_mtime_ns) \
+		for fil in get_default_inputs())
+
+class MasterDataDaemon(object):
+	"""Holds the current MasterData and answers requests about it."""
+
+	def __init__(my, host=DEFAULT_HOST, port=DEFAULT_PORT,
+		poll_interval=POLL_INTERVAL):
+		my.host = host
+		my.port = port
+		my.poll_interval = poll_interval
+		my.master_data = None
+		# Rendered pages of the current master data, by (method, args).
+		# Each page is only made once per load.
+		my.pages = {}
+		# Counts the loads. Clients can use it to see that data changed.
+		my.generation = 0
+		my.signature = None
+		my.key = None
+		my._lock = threading.Lock()
+		my._server = None
+
+	def load(my):
+		"""Loads the master data and swaps it in for the old data."""
+		signature = get_inputs_signature()
+		start = time.time()
+		master_data = parse_master.MasterData()
+		with my._lock:
+			my.master_data = master_data
+			my.pages = {}
+			my.signature = signature
+			my.generation += 1
+		print('Loaded the master data in {0:.2f} seconds.'.format(
+			time.time() - start))
+
+	def _watch(my):
+		"""Reloads the master data whenever the input files change.
+
+		A change is only acted on once the files stop changing, so that
+		files that are still being copied are not loaded.
+		"""
+
+		while True:
+			time.sleep(my.poll_interval)
+			try:
+				signature = get_inputs_signature()
+				if signature == my.signature:
+					continue
+				time.sleep(my.poll_interval)
+				if signature != get_inputs_signature():
+					continue
+				print('The input files changed. Reloading.')
+				my.load()
+			except Exception as error:
+				# Keep serving the old data.
+				print('Warning: Unable to reload the master data: {0}'.format(
+					error))
+
+	def get_page(my, method, args):
+		"""Gets the text of a page, making it if necessary.
+
+		The page is made outside of the lock so that other requests are
+		answered meanwhile.
+		"""
+
+		key = (method, tuple(args))
+		with my._lock:
+			if key in my.pages:
+				return my.pages[key]
+			master_data, generation = my.master_data, my.generation
+		chunks = []
+		master_data.outputter.write_page(_ChunkList(chunks), method, *args)
+		page = ''.join(chunks).encode('utf-8')
+		with my._lock:
+			# Pages of data that was reloaded meanwhile are not kept.
+			if generation == my.generation:
+				my.pages[key] = page
+		return page
+
+	def call(my, method, args):
+		"""Answers a request.
+
+		@returns A tuple of (kind, payload bytes).
+		@raises ValueError if the method cannot be called remotely.
+		"""
+
+		if method in PAGE_METHODS:
+			return 'text', my.get_page(method, args)
+		if method in OBJECT_METHODS:
+			with my._lock:
+				master_data = my.master_data
+			if method == 'get_personal_equipments' and args and \
+				not str(args[0]).isdigit():
+				# The client sent a knight by name.
+				args = [master_data.get_knight(args[0])] + args[1:]
+			result = getattr(master_data, method)(*args)
+			return 'pickle', pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+		if method == 'status':
+			return 'pickle', pickle.dumps({'generation': my.generation,
+				'signature': my.signature})
+		if method == 'reload':
+			my.load()
+			return 'pickle', pickle.dumps(my.generation)
+		raise ValueError('{0} cannot be called through the daemon.'.format(
+			method))
+
+	def serve_forever(my):
+		"""Loads the master data and answers requests until stopped."""
+		my.key = get_key(True)
+		my.load()
+		watcher = threading.Thread(target=my._watch, name='InputWatcher')
+		watcher.daemon = True
+		watcher.start()
+		my._server = _Server((my.host, my.port), _RequestHandler)
+		my._server.master_daemon = my
+		print('Serving the master data on {0}:{1}'.format(my.host, my.port))
+		try:
+			my._server.serve_forever()
+		finally:
+			my._server.server_close()
+
+	def shutdown(my):
+		if my._server:
+			my._server.shutdown()
+
+class _ChunkList(object):
+	"""A text file for write_page that keeps the written pieces."""
+
+	def __init__(my, chunks):
+		my.chunks = chunks
+
+	def write(my, text):
+		my.chunks.append(text)
+
+class _Server(socketserver.ThreadingTCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+	def handle(my):
+		daemon = my.server.master_daemon
+		try:
+			request = json.loads(my.rfile.readline().decode('utf-8'))
+			method, args = request['method'], request.get('args', [])
+			nonce = str(request['nonce'])
+			if not hmac.compare_digest(str(request.get('mac', '')),
+				get_request_mac(daemon.key, method, args, nonce)):
+				raise PermissionError('The request is not signed with the key.')
+			kind, payload = daemon.call(method, args)
+		except Exception as error:
+			header = {'ok': False, 'error': '{0}: {1}'.format(
+				type(error).__name__, error)}
+			payload = b''
+		else:
+			mac = get_answer_hmac(daemon.key, nonce, kind)
+			mac.update(payload)
+			header = {'ok': True, 'kind': kind, 'mac': mac.hexdigest()}
+		try:
+			my.wfile.write(json.dumps(header).encode('utf-8') + b'\n')
+			my.wfile.write(payload)
+		except OSError:
+			# The client stopped listening.
+			pass
+
+class MasterDataClient(object):
+	"""Asks a running MasterDataDaemon for master data.
+
+	Each page method of MasterDataOutputter and each method in
+	OBJECT_METHODS can be called on the client like on MasterData.
+	"""
+
+	# The seconds to wait on the daemon.
+	TIMEOUT = 60.0
+	CHUNK_SIZE = 1 << 16
+
+	def __init__(my, host=DEFAULT_HOST, port=DEFAULT_PORT):
+		my.host = host
+		my.port = port
+
+	def _request(my, method, args):
+		"""Sends a request.
+
+		@returns A tuple of (kind, file-like object of the payload, an HMAC
+			object to update with the payload). Close the file when done.
+		@raises IOError if the daemon answers with an error.
+		"""
+
+		# FlowerKnight instances are sent as their names.
+		args = [arg.fullName if isinstance(arg, parse_master.FlowerKnight) \
+			else arg for arg in args]
+		key = get_key()
+		nonce = os.urandom(16).hex()
+		sock = socket.create_connection((my.host, my.port), my.TIMEOUT)
+		try:
+			sock.sendall(json.dumps({'method': method, 'args': args,
+				'nonce': nonce, 'mac': get_request_mac(key, method, args,
+				nonce)}).encode('utf-8') + b'\n')
+			infile = sock.makefile('rb')
+		finally:
+			# The file keeps the connection open until it is closed.
+			sock.close()
+		header = json.loads(infile.readline().decode('utf-8'))
+		if not header.get('ok'):
+			infile.close()
+			raise IOError('The daemon could not answer {0}: {1}'.format(
+				method, header.get('error')))
+		return header['kind'], infile, _AnswerCheck(key, nonce, header)
+
+	def call(my, method, *args):
+		"""Calls a method of the daemon's master data."""
+		kind, infile, check = my._request(method, args)
+		with infile:
+			payload = infile.read()
+		check.update(payload)
+		# Only a daemon that knows the key can make the pickle loaded here.
+		check.verify()
+		if kind == 'text':
+			return payload.decode('utf-8')
+		return pickle.loads(payload)
+
+	def write_page(my, outfile, page, *args):
+		"""Writes a page to a binary file as it is received.
+
+		@param outfile: A file opened in binary mode.
+		@param page: String. The name of a MasterDataOutputter page method.
+		@returns The number of bytes written.
+		@raises IOError if the page was not sent by the daemon. The bytes
+			are written by then.
+		"""
+
+		kind, infile, check = my._request(page, args)
+		if kind != 'text':
+			infile.close()
+			raise IOError('{0} is not a page.'.format(page))
+		length = 0
+		with infile:
+			for chunk in iter(lambda: infile.read(my.CHUNK_SIZE), b''):
+				check.update(chunk)
+				outfile.write(chunk)
+				length += len(chunk)
+		check.verify()
+		return length
+
+	def is_running(my):
+		"""Says whether the daemon is answering."""
+		try:
+			my.call('status')
+			return True
+		except (IOError, OSError):
+			return False
+
+	def __getattr__(my, name):
+		if name in PAGE_METHODS or name in OBJECT_METHODS or \
+			name in ('status', 'reload'):
+			return lambda *args: my.call(name, *args)
+		raise AttributeError(name)
+
+class _AnswerCheck(object):
+	"""Checks that an answer was signed by the daemon."""
+
+	def __init__(my, key, nonce, header):
+		my.mac = get_answer_hmac(key, nonce, header['kind'])
+		my.expected = str(header.get('mac', ''))
+
+	def update(my, payload):
+		my.mac.update(payload)
+
+	def verify(my):
+		"""@raises IOError if the answer is not from the daemon."""
+		if not hmac.compare_digest(my.mac.hexdigest(), my.expected):
+			raise IOError('The answer is not signed with the key in {0}. '
+				'Something other than the daemon may be listening.'.format(
+				KEY_FILE))
+
+def main(argv):
+	if len(argv) < 2 or argv[1] in ('-h', '--help'):
+		print('Usage:')
+		print('  master_daemon.py serve: Keeps the master data loaded.')
+		print('  master_daemon.py METHOD [ARGS...]: Asks the daemon for a page')
+		print('    or object and prints it.')
+		print('Methods: ' + ', '.join(PAGE_METHODS + OBJECT_METHODS))
+	elif argv[1] == 'serve':
+		MasterDataDaemon().serve_forever()
+	elif argv[1] in PAGE_METHODS:
+		out = sys.stdout.buffer
+		MasterDataClient().write_page(out, argv[1], *argv[2:])
+		out.flush()
+	else:
+		print(MasterDataClient().call(argv[1], *argv[2:]))
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+# coding: utf-8
+import json
+import hashlib
+from os import makedirs, replace
+from os.path import exists, dirname, join as path_join
+from getmaster_loader import OUTPUT_FOLDER
+from master_cache import get_code_digest
+from lazy_entries import LazyDict
+
+__doc__ = """Remembers what was last published so unchanged modules are skipped.
+
+A snapshot holds a hash of every row of the master data sections that the
+Wikia modules are made from. It also holds, for each module, the hash of
+the text that was published and the hashes of the sections it was made
+from at that time.
+
+A module only needs to be made again when one of its sections changed
+since it was published. If the new text hashes the same as the published
+text, the Wikia does not need to be asked for its current copy either.
+"""
+
+SNAPSHOT_FILENAME = path_join(OUTPUT_FOLDER, 'publishedSnapshot.json')
+
+# Sections of the master data that modules are made from.
+# Each maps to the MasterData member holding its entries.
+SECTIONS = {
+	'characters': 'characters',
+	'skills': 'skills',
+	'abilities': 'abilities',
+	'ability_descs': 'ability_descs',
+	'equipment': 'equipment',
+	'skins': 'skins',
+	'flower_memories': 'flower_memories',
+	'memory_abilities': 'memory_abilities',
+	'bless_oath': 'bless_oath',
+}
+# This pseudo-section changes when the code that writes modules changes.
+CODE_SECTION = 'code'
+_OUTPUT_SOURCES = ['getmaster_outputter.py', 'entry.py', 'flowerknight.py',
+	'column_table.py', 'lua_serializer.py', 'lazy_entries.py']
+
+def get_text_digest(text):
+	"""Hashes the text of a module."""
+	return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def _get_row_hashes(entries):
+	"""Hashes every row of a section.
+
+	@param entries: A dict or list of Entry instances.
+	@returns A dict of row keys to hex strings. Dicts keep their keys.
+		List rows are keyed by their first CSV value. Repeated values get
+		a #2, #3, etc. suffix.
+	"""
+
+	if isinstance(entries, (dict, LazyDict)):
+		rows = entries.items()
+	else:
+		rows = []
+		seen = {}
+		for entry in entries:
+			key = entry._values[0] if entry._values else ''
+			seen[key] = seen.get(key, 0) + 1
+			if seen[key] > 1:
+				key = '{0}#{1}'.format(key, seen[key])
+			rows.append((key, entry))
+	return {key: hashlib.sha1(u'\x1f'.join(entry._values).encode(
+		'utf-8')).hexdigest() for key, entry in rows}
+
+def _get_section_digest(row_hashes):
+	"""Hashes a whole section from the hashes of its rows."""
+	digest = hashlib.sha1()
+	for key in sorted(row_hashes):
+		digest.update(u'{0}={1}\n'.format(key, row_hashes[key]).encode(
+			'utf-8'))
+	return digest.hexdigest()
+
+class MasterSnapshot(object):
+	"""Row hashes of the master data plus the published module hashes."""
+
+	def __init__(my, rows=None, modules=None):
+		"""Constructor.
+
+		@param rows: A dict of section names to dicts of row hashes.
+		@param modules: A dict of module titles to dicts with the keys
+			"text" (the text's hash) and "sources" (a dict of section names
+			to section hashes at the time the text was made).
+		"""
+
+		my.rows = rows or {}
+		my.modules = modules or {}
+		my.sections = {name: _get_section_digest(row_hashes) \
+			for name, row_hashes in my.rows.items()}
+		my.sections[CODE_SECTION] = get_code_digest(_OUTPUT_SOURCES)
+
+	@staticmethod
+	def from_master_data(master_data):
+		"""Makes a snapshot of the current master data.
+
+		No modules are marked as published in it.
+		"""
+
+		return MasterSnapshot({name: _get_row_hashes(getattr(master_data,
+			member)) for name, member in SECTIONS.items()})
+
+	@staticmethod
+	def load(filename=SNAPSHOT_FILENAME):
+		"""Loads a saved snapshot.
+
+		@returns A MasterSnapshot, or None if there is no readable file.
+		"""
+
+		if not exists(filename):
+			return None
+		try:
+			with open(filename, 'r', encoding='utf-8') as infile:
+				data = json.load(infile)
+		except (IOError, ValueError) as error:
+			print('Ignoring the unreadable snapshot {0}: {1}'.format(
+				filename, error))
+			return None
+		return MasterSnapshot(data.get('rows'), data.get('modules'))
+
+	def save(my, filename=SNAPSHOT_FILENAME):
+		"""Saves the snapshot. An interrupted save keeps the old file."""
+		makedirs(dirname(filename), exist_ok=True)
+		temp_filename = filename + '.tmp'
+		with open(temp_filename, 'w', encoding='utf-8') as outfile:
+			json.dump({'rows': my.rows, 'modules': my.modules}, outfile,
+				sort_keys=True)
+		replace(temp_filename, filename)
+
+	def get_changed_rows(my, old):
+		"""Compares the rows against an older snapshot.
+
+		@param old: A MasterSnapshot or None.
+		@returns A dict of section names to sets of row keys that were
+			added, removed or changed. Unchanged sections are left out.
+		"""
+
+		changes = {}
+		for name, row_hashes in my.rows.items():
+			old_hashes = old.rows.get(name, {}) if old else {}
+			changed = set(key for key in row_hashes \
+				if old_hashes.get(key) != row_hashes[key])
+			changed.update(key for key in old_hashes \
+				if key not in row_hashes)
+			if changed:
+				changes[name] = changed
+		return changes
+
+	def get_sources(my, sources):
+		"""Gets the current hashes of some sections.
+
+		The code pseudo-section is always included.
+		"""
+
+		sources = dict((name, my.sections[name]) for name in sources)
+		sources[CODE_SECTION] = my.sections[CODE_SECTION]
+		return sources
+
+	def is_current(my, module, sources):
+		"""Says whether a module was published from the current data.
+
+		@param module: String. The module's title.
+		@param sources: A list of section names the module is made from.
+		"""
+
+		published = my.modules.get(module)
+		return published is not None and \
+			published['sources'] == my.get_sources(sources)
+
+	def is_published(my, module, text):
+		"""Says whether this exact text was the last published text."""
+		published = my.modules.get(module)
+		return published is not None and \
+			published['text'] == get_text_digest(text)
+
+	def mark_published(my, module, text, sources):
+		"""Records that a module's text is now on the Wikia."""
+		my.modules[module] = {
+			'text': get_text_digest(text),
+			'sources': my.get_sources(sources),
+		}
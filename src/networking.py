@@ -1,15 +1,257 @@
 #!/usr/bin/env python
 # coding=utf-8
-import os, zlib, time, hashlib, random
+import os, zlib, time, hashlib, random, threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 import requests
+from requests.adapters import HTTPAdapter
 from imaging import Imaging
+from asset_cache import AssetCache, FETCH_NEW, FETCH_SAME
+from tracing import span, traced
 from parse_master import FlowerKnight, EquipmentEntry
 
 __doc__ = """Handles all downloading of assets from FKG's servers.
 
 The Networking class does NOT handle uploading to the Wikia.
+
+Downloads go through a DownloadEngine. It keeps a pool of connections open,
+runs a few downloads at once, and limits how many requests per second each
+host receives. Failed requests are retried after a growing delay.
+
+Downloaded files are kept in an AssetCache. Files that were downloaded
+before are only sent again by the server if they changed.
 """
 
+class TokenBucket(object):
+    """Limits how often something can happen.
+
+    The bucket holds up to "burst" tokens and gains "rate" tokens per second.
+    Each acquire() takes one token and waits until one is available.
+    """
+
+    def __init__(my, rate, burst=1):
+        """Constructor.
+
+        @param rate: Float. The number of tokens gained per second.
+        @param burst: Int. The most tokens that can be stored at once.
+        """
+
+        my.rate = float(rate)
+        my.burst = max(1, burst)
+        my._tokens = float(my.burst)
+        my._last = time.monotonic()
+        my._lock = threading.Lock()
+
+    def acquire(my):
+        """Takes one token. Waits until a token is available."""
+        while True:
+            with my._lock:
+                now = time.monotonic()
+                my._tokens = min(my.burst,
+                    my._tokens + (now - my._last) * my.rate)
+                my._last = now
+                if my._tokens >= 1.0:
+                    my._tokens -= 1.0
+                    return
+                wait = (1.0 - my._tokens) / my.rate
+            time.sleep(wait)
+
+class DownloadEngine(object):
+    """Downloads files concurrently with rate limiting and retries.
+
+    Usage:
+    engine = DownloadEngine()
+    futures = [engine.submit(url, path) for url, path in jobs]
+    dl_state = engine.wait(futures)
+    engine.close()
+
+    Each future's result is Networking.DL_OK or Networking.DL_FAIL.
+    """
+
+    # The number of downloads that run at the same time.
+    WORKERS = 4
+    # The number of requests per second each host may receive.
+    RATE = 1.0
+    # The number of requests each host may receive at once after idling.
+    BURST = 4
+    # The number of times to retry a failed request.
+    RETRIES = 3
+    # The delay before the first retry in seconds. It doubles every retry.
+    BACKOFF = 2.0
+    # The seconds to wait on a server before giving up on a request.
+    TIMEOUT = 30.0
+    # These HTTP statuses mean the request may work if it is tried again.
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(my, workers=WORKERS, rate=RATE, burst=BURST,
+        retries=RETRIES, backoff=BACKOFF, cache=None):
+        """Constructor.
+
+        @param cache: An AssetCache. If None, files that already exist
+            are skipped instead of being checked for changes.
+        """
+
+        my.cache = cache
+        my.workers = workers
+        my.rate = rate
+        my.burst = burst
+        my.retries = retries
+        my.backoff = backoff
+        my.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        my.session.mount('http://', adapter)
+        my.session.mount('https://', adapter)
+        my._buckets = {}
+        my._buckets_lock = threading.Lock()
+        my._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def __enter__(my):
+        return my
+
+    def __exit__(my, *exc_info):
+        my.close()
+
+    def _get_bucket(my, url):
+        """Gets the rate limiter of the URL's host."""
+        host = urlsplit(url).netloc
+        with my._buckets_lock:
+            if host not in my._buckets:
+                my._buckets[host] = TokenBucket(my.rate, my.burst)
+            return my._buckets[host]
+
+    def get(my, url, **kwargs):
+        """Requests a URL while obeying the rate limit.
+
+        Connection errors and the statuses in RETRY_STATUSES are retried.
+
+        @param url: String. The URL to request.
+        @param kwargs: Passed on to requests.Session.get.
+        @returns The final requests.Response, or None if no response
+            was ever received.
+        """
+
+        kwargs.setdefault('timeout', DownloadEngine.TIMEOUT)
+        bucket = my._get_bucket(url)
+        response = None
+        for attempt in range(my.retries + 1):
+            if attempt:
+                # Add some jitter so that retries do not line up.
+                time.sleep(my.backoff * 2 ** (attempt - 1) *
+                    (1.0 + random.random() * 0.5))
+            bucket.acquire()
+            try:
+                with span('DownloadEngine.get', url=url, attempt=attempt):
+                    response = my.session.get(url, **kwargs)
+            except requests.RequestException as ex:
+                print('Warning: Request to {0} failed: {1}'.format(url, ex))
+                continue
+            if response.status_code not in DownloadEngine.RETRY_STATUSES:
+                break
+        return response
+
+    def get_for_cache(my, url, headers={}):
+        """Does a GET in the form that AssetCache.fetch expects."""
+        response = my.get(url, headers=headers)
+        if response is None:
+            raise IOError('There was no response.')
+        return response.status_code, response.content, response.headers
+
+    @traced
+    def download(my, url, output_path, decompress=False, copy=False):
+        """Downloads a file. This runs inside of the worker threads.
+
+        @param url: String. The URL of the file.
+        @param output_path: String. Where to save the file.
+            Without a cache, nothing is downloaded if it already exists.
+        @param decompress: Bool. If True, the file is zlib decompressed.
+        @param copy: Bool. If True, the file is copied out of the cache
+            instead of being hard linked. Use it for files edited in place.
+        @returns Networking.DL_OK on success, or Networking.DL_FAIL otherwise.
+        """
+
+        if my.cache is not None:
+            result = my.cache.fetch(url, output_path,
+                zlib.decompress if decompress else None, copy,
+                my.get_for_cache)
+            if result == FETCH_NEW:
+                print("Downloaded " + output_path)
+            elif result == FETCH_SAME:
+                print(output_path + ' is unchanged. Using the cached copy.')
+            else:
+                print("Error: Unable to download " + output_path)
+                return Networking.DL_FAIL
+            return Networking.DL_OK
+
+        if os.path.exists(output_path):
+            print(output_path + ' already exists. Skipping.')
+            return Networking.DL_OK
+
+        response = my.get(url)
+        if response is None or not response.ok:
+            print("Error: Unable to download " + output_path)
+            return Networking.DL_FAIL
+        content = response.content
+        if decompress:
+            try:
+                content = zlib.decompress(content)
+            except zlib.error:
+                print("Error: Unable to decompress " + output_path)
+                return Networking.DL_FAIL
+        # Write to a temporary file first so that an interrupted download
+        # never leaves behind a partial file that would be skipped next time.
+        temp_path = output_path + '.part'
+        with open(temp_path, 'wb') as imgFile:
+            imgFile.write(content)
+        os.replace(temp_path, output_path)
+        print("Downloaded " + output_path)
+        return Networking.DL_OK
+
+    def submit(my, url, output_path, decompress=False, copy=False):
+        """Queues a download. See download() for the parameters.
+
+        @returns A concurrent.futures.Future of the download's state.
+        """
+
+        return my._executor.submit(my.download, url, output_path,
+            decompress, copy)
+
+    def run(my, func, *args):
+        """Runs any function on one of the download threads.
+
+        Use it for downloads that need more handling than download() has.
+
+        @returns A concurrent.futures.Future of the function's result.
+        """
+
+        return my._executor.submit(func, *args)
+
+    def wait(my, futures):
+        """Waits for downloads to finish.
+
+        If the user presses Ctrl+C, the remaining downloads are cancelled.
+
+        @param futures: A list of Futures from submit().
+        @returns Networking.DL_OK if every download succeeded,
+            Networking.DL_QUIT if the user stopped them,
+            or Networking.DL_FAIL otherwise.
+        """
+
+        dl_state = Networking.DL_OK
+        try:
+            for future in futures:
+                if future.result() != Networking.DL_OK:
+                    dl_state = Networking.DL_FAIL
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            return Networking.DL_QUIT
+        return dl_state
+
+    def close(my):
+        """Waits for the queued downloads and closes all connections."""
+        my._executor.shutdown(wait=True)
+        my.session.close()
+
 class Networking(object):
     DEFAULT_ASSETPATH = 'asset'
     DL_OUTPUT_FOLDER = 'dl'
@@ -37,10 +279,16 @@ class Networking(object):
     imgTypeName = { IMG_ICON:'icon_{0}.png',  IMG_STAND:'portrait_{0}.png'}
     imgType     = { IMG_ICON:'icon_l_', IMG_STAND:'stand_s_' }
 
-    def __init__(my):
+    def __init__(my, engine=None):
+        """Constructor.
+
+        @param engine: A DownloadEngine. One is made if None is given.
+        """
+
         my.imaging = Imaging()
         my.out_dir = Networking.DL_OUTPUT_FOLDER
         my._state = Networking.DL_OK
+        my.engine = engine or DownloadEngine(cache=AssetCache())
 
     def sleep(my, duration=0.0, message=True):
         """Sleeps for a random amount of time.
@@ -82,33 +330,46 @@ class Networking(object):
         @returns Networking.DL_OK on success, or Networking.DL_FAIL otherwise.
         """
 
-        dl_state = Networking.DL_OK
-        for equip in equip_list:
-            dl_state = my.downloadEquipImage(equip)
-            if dl_state != Networking.DL_OK:
-                break
-        return dl_state
+        return my.engine.wait([my.submitEquipImage(equip) \
+            for equip in equip_list])
 
     def downloadCharacterImages(my,master_data,knight,tiers=[PRE_EVO,EVO,BLOOM]):
-        inputID = int(knight.tiers['preEvo']['id'])
+        inputID = int(knight.tiers[1]['id'])
 
-        dl_state = my.DL_OK
-        
-        #Download the portrait and icon for each evolution tier.
+        #Queue the portrait and icon for each evolution tier.
+        icons = []
+        futures = []
         for tier in tiers:
-            dl_state = my.downloadCharaImage(knight,inputID,my.IMG_ICON,tier,dl_state)
-            dl_state = my.downloadCharaImage(knight,inputID,my.IMG_STAND,tier,dl_state)
-            if dl_state != my.DL_OK:
-                break
-        #Download the equipment pics.
-        for equip in master_data.get_personal_equipments(knight):
-            my.downloadEquipImage(equip)
+            for iconType in (my.IMG_ICON, my.IMG_STAND):
+                imgFileLink, outputPath = my.getCharaImagePaths(inputID,iconType,tier)
+                # Icons get framed in place, so they can't share the
+                # cached file.
+                future = my.engine.submit(imgFileLink,outputPath,True,
+                    iconType == my.IMG_ICON)
+                futures.append(future)
+                if iconType == my.IMG_ICON:
+                    icons.append((future, outputPath))
+        #Queue the equipment pics.
+        futures += [my.submitEquipImage(equip) for equip in \
+            master_data.get_personal_equipments(knight)]
+        dl_state = my.engine.wait(futures)
+        if dl_state == my.DL_QUIT:
+            return dl_state
+
+        #For icons, apply the background, frame, and typing to the image.
+        #This happens in this process once the downloads come back.
+        jobs = [(outputPath, outputPath, int(knight.rarity), int(knight.type)) \
+            for future, outputPath in icons if future.result() == my.DL_OK]
+        if not all(my.imaging.get_framed_icons(jobs, processes=1)):
+            dl_state = my.DL_FAIL
         return dl_state
     downloadImageFunction = downloadCharacterImages
 
-    def downloadCharaImage(my,knight,inputID,iconType,stage,dl_state=DL_OK):
-        # Do not allow consecutive failed downloads.
-        if dl_state != my.DL_OK: return dl_state
+    def getCharaImagePaths(my,inputID,iconType,stage):
+        """Gets the URL and output filename of a character image.
+
+        @returns A tuple of (URL, output path).
+        """
 
         #Check the Flower Knight's evolution stage, and refactor the ID appropriately.
         if (stage == 2): inputID += 300000
@@ -126,9 +387,17 @@ class Networking(object):
         if not os.path.exists(my.out_dir):
             os.makedirs(my.out_dir)
         outputPath = os.path.join(my.out_dir, imgFileName)
-        
+        return imgFileLink, outputPath
+
+    def downloadCharaImage(my,knight,inputID,iconType,stage,dl_state=DL_OK):
+        # Do not allow consecutive failed downloads.
+        if dl_state != my.DL_OK: return dl_state
+
+        imgFileLink, outputPath = my.getCharaImagePaths(inputID,iconType,stage)
+
         #Download the image.
-        dl_state = my.downloadImage(imgFileLink,outputPath,True)
+        dl_state = my.downloadImage(imgFileLink,outputPath,True,
+            iconType == my.IMG_ICON)
         if dl_state == my.DL_OK and iconType == my.IMG_ICON:
             #For icons, apply the background, frame, and typing to the image.
             #Note: For this function, downloadCharaImage, it'd be better put it
@@ -138,6 +407,16 @@ class Networking(object):
         return dl_state
 
     def downloadEquipImage(my, equip_id_or_csv):
+        """Downloads an equipment image and waits for it to finish."""
+        return my.engine.wait([my.submitEquipImage(equip_id_or_csv)])
+
+    def submitEquipImage(my, equip_id_or_csv):
+        """Queues the download of an equipment image.
+
+        @param equip_id_or_csv: An EquipmentEntry, integer, or string.
+        @returns A Future of the download's state.
+        """
+
         #### This was the old way to call this function.
         #### It was called from downloadCharaImage().
         # try:
@@ -161,26 +440,15 @@ class Networking(object):
             os.makedirs(my.out_dir)
         outputPath = os.path.join(my.out_dir, imgFileName)
 
-        # Download the image.
-        return my.downloadImage(imgFileLink,outputPath,False)
+        # Queue the image.
+        return my.engine.submit(imgFileLink,outputPath,False)
 
-    def downloadImage(my,inputLink,outputImageName,decompress):
-        dl_state = my.DL_FAIL
+    @traced
+    def downloadImage(my,inputLink,outputImageName,decompress,copy=False):
+        """Downloads one file and waits for it to finish.
 
-        if os.path.exists(outputImageName):
-            print(outputImageName + ' already exists. Skipping.')
-            return my.DL_OK
+        The engine's rate limit replaces the old sleep after each download.
+        """
 
-        response = requests.get(inputLink)
-        if response.ok:
-            content = response.content
-            if decompress:
-                content = zlib.decompress(content)
-            with open(outputImageName,'wb') as imgFile:
-                imgFile.write(content)
-            print("Downloaded " + outputImageName)
-            dl_state = my.DL_OK
-            my.sleep()
-        else:
-            print("Error: Unable to download " + outputImageName)
-        return dl_state
+        return my.engine.wait([my.engine.submit(
+            inputLink,outputImageName,decompress,copy)])
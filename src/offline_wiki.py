@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+# coding: utf-8
+import os
+from urllib.parse import quote, unquote
+from os.path import exists, join as path_join
+from getmaster_loader import OUTPUT_FOLDER
+
+try:
+	from pywikibot.exceptions import NoPageError, MaxlagTimeoutError
+except ImportError:
+	class NoPageError(Exception):
+		pass
+
+	class MaxlagTimeoutError(Exception):
+		pass
+
+__doc__ = """Stand-ins for a pywikibot Site and Page that never go online.
+
+The bots only use a few parts of pywikibot's pages and sites, so these
+classes only copy those parts. Use them to try a bot's changes without
+logging into or editing the Wikia.
+
+Page texts are kept in memory. If the site has a folder, each page is read
+from and saved to a file in it. The filename is the page's title with
+URL quoting, so "Module:Skin/Data" is "Module%3ASkin%2FData.txt".
+"""
+
+OFFLINE_FOLDER = path_join(OUTPUT_FOLDER, 'offline_wiki')
+
+class OfflineSite(object):
+	"""Holds the texts of the pages of a pretend wiki."""
+
+	def __init__(my, folder=None, texts=None, lagged_saves=0):
+		"""Constructor.
+
+		@param folder: String. A folder of page files, or None.
+		@param texts: A dict of page titles to texts to start with.
+		@param lagged_saves: Integer. This many saves fail with a
+			MaxlagTimeoutError before any save works, like on a busy wiki.
+		"""
+
+		my.folder = folder
+		my.texts = dict(texts or {})
+		my.lagged_saves = lagged_saves
+		# The number of bulk page requests that a real wiki would get.
+		my.requests = 0
+		# A list of (title, summary) tuples of every saved edit.
+		my.edits = []
+		if folder and exists(folder):
+			for filename in os.listdir(folder):
+				if filename.endswith('.txt'):
+					with open(path_join(folder, filename), 'r',
+						encoding='utf-8') as infile:
+						my.texts[unquote(filename[:-4])] = infile.read()
+
+	def __repr__(my):
+		return 'OfflineSite({0} pages)'.format(len(my.texts))
+
+	def login(my, *args, **kwargs):
+		pass
+
+	def preloadpages(my, pages, groupsize=50):
+		"""Yields the pages after loading their texts in groups.
+
+		@param pages: A list of OfflinePage instances.
+		@param groupsize: Integer. How many pages each request holds.
+		"""
+
+		pages = list(pages)
+		my.requests += (len(pages) + groupsize - 1) // groupsize
+		for page in pages:
+			yield page
+
+	def save_page(my, title, text, summary=None):
+		"""Stores a page's new text. OfflinePage.save() calls this."""
+		if my.lagged_saves > 0:
+			my.lagged_saves -= 1
+			raise MaxlagTimeoutError('Maximum retries attempted due to '
+				'maxlag without success.')
+		my.texts[title] = text
+		my.edits.append((title, summary))
+		if my.folder:
+			os.makedirs(my.folder, exist_ok=True)
+			filename = path_join(my.folder, quote(title, safe='') + '.txt')
+			with open(filename, 'w', encoding='utf-8') as outfile:
+				outfile.write(text)
+
+class OfflinePage(object):
+	"""A page of an OfflineSite. It is made like pywikibot.Page."""
+
+	def __init__(my, site, title):
+		my.site = site
+		my._title = title
+		my._text = None
+
+	def __repr__(my):
+		return 'OfflinePage({0!r})'.format(my._title)
+
+	def title(my, asLink=False):
+		return '[[{0}]]'.format(my._title) if asLink else my._title
+
+	def exists(my):
+		return my._title in my.site.texts
+
+	def get(my):
+		"""Gets the saved text. Missing pages raise NoPageError."""
+		if not my.exists():
+			raise NoPageError(my)
+		return my.site.texts[my._title]
+
+	@property
+	def text(my):
+		"""The text to save. It starts as the saved text or ''."""
+		if my._text is None:
+			return my.site.texts.get(my._title, '')
+		return my._text
+
+	@text.setter
+	def text(my, value):
+		my._text = value
+
+	def save(my, summary=None, minor=True, botflag=True, **kwargs):
+		my.site.save_page(my._title, my.text, summary)
+		my._text = None
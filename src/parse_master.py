@@ -9,6 +9,12 @@ from common import *
 from entry import *
 from flowerknight import *
 from getmaster_outputter import MasterDataOutputter
+from column_table import ColumnTable
+from master_cache import MasterDataCache
+from lazy_entries import *
+from functools import partial
+from tracing import traced
+from operator import getitem
 
 if sys.version_info.major >= 3:
 	# The script is being run under Python 3.
@@ -27,13 +33,40 @@ parse_master is for interpreting and organizing the data.
 getmaster_outputter is for outputting the organized data for the Wikia.
 '''
 
+def _make_knight(characters, char_ids):
+	"""Makes a FlowerKnight from the IDs of its CharacterEntries.
+
+	MasterData.knights uses this to make each knight on first use.
+	"""
+
+	return FlowerKnight([characters[char_id] for char_id in char_ids])
+
 class MasterData(object):
 	"""Handles various info from the master data."""
 	# Debugging variables.
 	# When True, only store flower knights.
 	remove_characters = False
+	# These members are not stored in the parsed data cache.
+	_UNCACHED_MEMBERS = ('outputter', 'tables')
+	# Maps table names for get_table() to the members they are made from.
+	_TABLE_SOURCES = {
+		'equipment': 'equipment',
+		'skins': 'skins',
+		'characters': 'characters',
+		'skills': 'skills',
+		'flower_memories': 'flower_memories',
+	}
+
+	@traced
+	def __init__(my, use_cache=True):
+		"""Constructor.
+
+		@param use_cache: Boolean. When True, the parsed data is loaded from
+			the on-disk cache if the getMaster files did not change.
+			Otherwise, or if there is no valid cache, getMaster is parsed
+			and the cache is rewritten.
+		"""
 
-	def __init__(my):
 		my.masterTexts = {}
 		my.characters = {}
 		my.knights = {}
@@ -50,75 +83,160 @@ class MasterData(object):
 		my.flower_memories = []
 		my.memory_abilities = {}
 		my.bless_oath = {}
+		# Column-wise copies of the above. See get_table().
+		my.tables = {}
+		# Lookup tables for the above. Use the add_* methods to keep them
+		# in sync when adding entries. They hold keys instead of entries so
+		# that they can be made without making every entry.
+		# Any stringly-typed character ID -> list of knight names.
+		my.knights_by_id = {}
+		# fullName -> list of character IDs.
+		my.characters_by_name = {}
+		# Integer owner ID (charID2) -> list of indices into equipment.
+		my.equipment_by_owner = {}
+		# Stringly-typed libraryID -> list of indices into skins.
+		my.skins_by_library_id = {}
 
 		# This is the new way to access the master data.
 		my.entries = {}
 		my.entry_ids = {}
-		my.load_getMaster()
+		if not use_cache:
+			my.load_getMaster()
+		else:
+			cache = MasterDataCache()
+			state = cache.load()
+			if state is not None:
+				vars(my).update(state)
+			else:
+				my.load_getMaster()
+				cache.save({key:val for key, val in vars(my).items() \
+					if key not in my._UNCACHED_MEMBERS})
 
 		my.outputter = MasterDataOutputter(my)
 
-	def _extract_section(my, section, rawdata):
-		"""Gets all text from one section of the master data."""
-		# Find the section header
-		full_str_pos = 0
-		section_idx = 0
-		found_section = None
-		while full_str_pos < len(rawdata) and found_section != section:
-			section_idx = rawdata.find(section, full_str_pos)
-			if section_idx < 0:
-				print('Could not find the section called ' + section)
-				return ''
-			newline_idx = max(0, rawdata.find('\n', section_idx))
-			found_section = rawdata[section_idx:newline_idx].strip()
-			full_str_pos = section_idx + 1
-		# We found the header, so take all text after it
-		str_beyond_section = rawdata[section_idx + len(section):].lstrip()
-		str_until_next_section = str_beyond_section.partition('master')[0]
-		str_until_next_section = str_until_next_section.strip()
-		data_lines = str_until_next_section.split('\n')
-		return data_lines
+	def get_table(my, name):
+		"""Gets a section of the master data as a ColumnTable.
+
+		The table is made on first use. Rows keep the order of the list
+		they come from. Dicts of entries are read in their iteration order.
+
+		@param name: A key of _TABLE_SOURCES, such as 'equipment'.
+		@returns A ColumnTable.
+		"""
+
+		if name not in my.tables:
+			entries = getattr(my, my._TABLE_SOURCES[name])
+			if isinstance(entries, (dict, LazyDict)):
+				entries = entries.values()
+			my.tables[name] = ColumnTable(entries)
+		return my.tables[name]
+
+	def _extract_section(my, section, text_index):
+		"""Gets all text from one section of the master data.
 
+		@param section: String. The section's name, such as masterCharacter.
+		@param text_index: A MasterTextIndex of the plain text master data.
+		@returns A list of CSV lines, or '' if there is no such section.
+		"""
+
+		if section not in text_index:
+			print('Could not find the section called ' + section)
+			return ''
+		return text_index.get_lines(section)
+
+	@traced
 	def _parse_character_entries(my, api_data=[]):
-		"""Creates a list of character entries from masterCharacter."""
+		"""Creates a list of character entries from masterCharacter.
+
+		The entries and flower knights are only made when first used.
+		"""
+
 		if not len(api_data):
 			print('There are no character entries. Parsing bug?')
-		# Start by parsing the CSV.
-		# Store the CSV into understandable variable names.
-		character_entries = [CharacterEntry(entry) for entry in api_data]
 		# Store CSV entries in a dict such that their ID is their key.
-		my.characters = {c.id0:c for c in character_entries}
+		my.characters = LazyEntryDict(CharacterEntry, api_data, 'id0')
+		my.characters_by_name = {}
 		# Compile a list of all flower knights from the CSVs.
-		my.knights = {}
-		# Dereference the dict for faster access.
-		knights = my.knights
-		unique_characters = my.unique_characters
-		for char in character_entries:
-			name = remove_quotes(char.fullName)
-			if char.isFlowerKnight1 != '1':
-				# This is not a flower knight. Remove its ability.
-				if char.ability1ID in my.abilities and char.ability1ID != '1':
-					my.abilities.pop(char.ability1ID)
-				unique_characters[name] = char
-			elif name not in knights:
-				knights[name] = FlowerKnight(char)
-			else:
-				knights[name].add_entry(char)
+		my.knights = LazyDict(partial(_make_knight, my.characters))
+		my.knights_by_id = {}
+		my.unique_characters = LazyDict(partial(getitem, my.characters))
+		# Only read the values needed for the lookups.
+		indices = [CharacterEntry._CSV_NAMES.index(name) for name in \
+			['id0', 'fullName', 'isFlowerKnight1', 'ability1ID']]
+		names = {}
+		for line in api_data:
+			char_id, fullName, isFlowerKnight1, ability1ID = \
+				get_csv_values(line, indices)
+			my._index_character(char_id, fullName, isFlowerKnight1,
+				ability1ID, names.get(char_id))
+			names[char_id] = fullName
+
+	def add_character(my, char):
+		"""Stores a CharacterEntry and updates the knights and lookups.
+
+		@param char: A CharacterEntry instance. If there is already an entry
+			with the same ID, it is replaced.
+		"""
+
+		old_char = my.characters.get(char.id0)
+		my.characters[char.id0] = char
+		my._index_character(char.id0, char.fullName, char.isFlowerKnight1,
+			char.ability1ID, old_char.fullName if old_char else None)
 
+	def _index_character(my, char_id, fullName, isFlowerKnight1, ability1ID,
+		old_name=None):
+		"""Updates the knights and lookups for one character's values.
+
+		The character must already be in my.characters.
+
+		@param old_name: String or None. The fullName of the character that
+			had this ID before, if any.
+		"""
+
+		if old_name is not None and old_name != fullName:
+			my.characters_by_name[old_name].remove(char_id)
+		same_name = my.characters_by_name.setdefault(fullName, [])
+		if char_id not in same_name:
+			same_name.append(char_id)
+
+		# Compile a list of all flower knights from the CSVs.
+		name = remove_quotes(fullName)
+		if isFlowerKnight1 != '1':
+			# This is not a flower knight. Remove its ability.
+			if ability1ID in my.abilities and ability1ID != '1':
+				del my.abilities[ability1ID]
+			my.unique_characters.set_source(name, char_id)
+			return
+		if name not in my.knights:
+			my.knights.set_source(name, [char_id])
+		else:
+			char_ids = my.knights.sources[name]
+			if char_id not in char_ids:
+				char_ids.append(char_id)
+			if my.knights.is_made(name):
+				my.knights[name].add_entry(my.characters[char_id])
+		# Index the knight by the ID. IDs that the knight ignores, like
+		# those of alternate skins, are indexed too. Lookups must double
+		# check with has_id().
+		same_id = my.knights_by_id.setdefault(char_id, [])
+		if name not in same_id:
+			same_id.append(name)
+
+	@traced
 	def _parse_skill_entries(my, api_data=[]):
 		"""Creates a list of skill entries from masterCharacterSkill."""
 		if not len(api_data):
 			print('There are no skill entries. Parsing bug?')
-		skill_entries = [SkillEntry(entry) for entry in api_data]
-		my.skills = {s.uniqueID:s for s in skill_entries}
+		my.skills = LazyEntryDict(SkillEntry, api_data, 'uniqueID')
 
+	@traced
 	def _parse_ability_entries(my, api_data=[]):
 		"""Creates a list of ability entries from masterCharacterLeaderSkill."""
 		if not len(api_data):
 			print('There are no ability entries. Parsing bug?')
-		ability_entries = [AbilityEntry(entry) for entry in api_data]
-		my.abilities = {a.uniqueID:a for a in ability_entries}
+		my.abilities = LazyEntryDict(AbilityEntry, api_data, 'uniqueID')
 
+	@traced
 	def _parse_ability_desc_entries(my, api_data=[]):
 		"""Creates a list of ability description entries from the master data.
 
@@ -126,23 +244,75 @@ class MasterData(object):
 		"""
 		if not len(api_data):
 			print('There are no ability description entries. Parsing bug?')
-		ability_desc_entries = [AbilityDescEntry(entry) for entry in api_data]
-		my.ability_descs = {a.id0:a for a in ability_desc_entries}
+		my.ability_descs = LazyEntryDict(AbilityDescEntry, api_data, 'id0')
 
+	@traced
 	def _parse_equipment_entries(my, api_data=[]):
 		"""Creates a list of equipment entries from masterCharacterEquipment."""
 		if not len(api_data):
 			print('There are no equipment entries. Parsing bug?')
 		my.equipment_entries = [entry.split(',')[:-1] for entry in api_data]
-		my.equipment = [EquipmentEntry(entry) for entry in api_data]
+		my.equipment = LazyEntryList(EquipmentEntry, api_data)
+		my.equipment_by_owner = {}
+		owners_index = EquipmentEntry._CSV_NAMES.index('owners')
+		for index, entry in enumerate(my.equipment_entries):
+			owners = remove_quotes(entry[owners_index]) \
+				if owners_index < len(entry) else ''
+			my._index_equipment(index, owners)
+
+	def add_equipment(my, equip):
+		"""Stores an EquipmentEntry and indexes it by its owners.
+
+		equipment_entries is not updated. It only holds the raw CSV.
+		"""
+
+		my.equipment.append(equip)
+		my._index_equipment(len(my.equipment) - 1, equip.owners)
+
+	def _index_equipment(my, index, owners):
+		"""Indexes the equipment at an index by its owners value."""
+		if not owners:
+			return
+		# An equipment can only be listed once per owner.
+		for owner_id in set(int(id) for id in owners.split(u'|')):
+			my.equipment_by_owner.setdefault(owner_id, []).append(index)
 
+	@traced
 	def _parse_skin_entries(my, api_data=[]):
 		"""Creates a list of skin entries from masterCharacterSkin."""
 		if not len(api_data):
 			print('There are no skin entries. Parsing bug?')
 		my.skin_entries = [entry.split(',')[:-1] for entry in api_data]
-		my.skins = [SkinEntry(entry) for entry in api_data]
+		my.skins = LazyEntryList(SkinEntry, api_data)
+		my.skins_by_library_id = {}
+		library_id_index = SkinEntry._CSV_NAMES.index('libraryID')
+		for index, entry in enumerate(my.skin_entries):
+			library_id = remove_quotes(entry[library_id_index]) \
+				if library_id_index < len(entry) else ''
+			my.skins_by_library_id.setdefault(library_id, []).append(index)
+
+	def add_skin(my, skin):
+		"""Stores a SkinEntry and indexes it by its libraryID.
+
+		skin_entries is not updated. It only holds the raw CSV.
+		"""
+
+		my.skins.append(skin)
+		my.skins_by_library_id.setdefault(skin.libraryID, []).append(
+			len(my.skins) - 1)
+
+	def get_skins(my, library_id):
+		"""Gets all SkinEntries of one character.
+
+		@param library_id: The libraryID of a character or FlowerKnight.
+			It is shared by all of the character's variants and skins.
+		@returns A list of SkinEntries. May be empty.
+		"""
 
+		return [my.skins[index] for index in \
+			my.skins_by_library_id.get(str(library_id), [])]
+
+	@traced
 	def _parse_family_entries(my, api_data=[]):
 		if not len(api_data):
 			print('There are no flower family entries. Parsing bug?')
@@ -152,6 +322,7 @@ class MasterData(object):
 		my.family_entries = [entry.split(',')[:-1] for entry in api_data]
 		my.flower_family = {f[0]:f for a in my.family_entries}
 
+	@traced
 	def _parse_data_entries(my, api_data=[]):
 		"""Creates a list of skin entries from masterCharacterSkin."""
 		if not len(api_data):
@@ -159,6 +330,7 @@ class MasterData(object):
 		my.data_entries = [entry.split(',')[:-1] for entry in api_data]
 		my.data_book = {d[2]:d for d in my.data_entries}
 
+	@traced
 	def _parse_flower_memories(my, api_data=[], api_data2=[]):
 		"""Creates a list of flower memories from masterFlowerMemory."""
 		
@@ -167,7 +339,9 @@ class MasterData(object):
 		   entry[2] is Limit Break level
 		   entry[3] is ability ID."""
 		
-		ability_lookup_entries = [entry.split(',')[:-1] for entry in api_data2 if entry.split(',')[2] in ('0','4')]
+		ability_lookup_entries = [fields[:-1] for fields in \
+			(entry.split(',') for entry in api_data2) \
+			if fields[2] in ('0','4')]
 		ability_lookup_lv0_list = {a[1]:[] for a in ability_lookup_entries}
 		ability_lookup_lv4_list = {a[1]:[] for a in ability_lookup_entries}
 		
@@ -178,27 +352,53 @@ class MasterData(object):
 			elif entry[2] == '4':
 				ability_lookup_lv4_list[entry[1]].append(entry[3])
 		
+		lines = []
 		for entry in api_data:
-			mID = entry.split(',')[0]
+			mID = entry.split(',', 1)[0]
 			entry += "{{{0}}}".format("|".join(ability_lookup_lv0_list[mID])) + ','
 			entry += "{{{0}}}".format("|".join(ability_lookup_lv4_list[mID])
                         or "|".join(ability_lookup_lv0_list[mID]))
 			
 			#my.flower_memories[mID] = FlowerMemoryEntry(entry)
-			my.flower_memories.append(FlowerMemoryEntry(entry))
+			lines.append(entry)
+		my.flower_memories = LazyEntryList(FlowerMemoryEntry, lines)
 			
+	@traced
 	def _parse_memory_abilities(my, api_data=[]):
 		"""Creates a list of abilities used by flower memories as listed from masterAbility."""
 		if not len(api_data):
 			print('There are no ability entries. Parsing bug?')
 		
-		my.memory_ability_entries = [FlowerMemoryAbilityEntry(entry) for entry in api_data]
-		my.memory_abilities = {a.id:a for a in my.memory_ability_entries}
+		my.memory_abilities = LazyEntryDict(FlowerMemoryAbilityEntry, api_data, 'id')
 		
+	def make_all_entries(my):
+		"""Makes every entry and flower knight that was not made yet.
+
+		Call it before forking worker processes. Then the workers inherit
+		the made entries instead of each making the ones that it uses.
+		"""
+
+		containers = list(vars(my).values())
+		for container in containers:
+			if isinstance(container, (LazyEntryDict, LazyEntryList)):
+				container.make_all()
+		# Flower knights are made from the characters, so they are last.
+		for container in containers:
+			if type(container) is LazyDict:
+				for key in container:
+					container[key]
+
+	@property
+	def memory_ability_entries(my):
+		"""The list of abilities used by flower memories."""
+		return list(my.memory_abilities.values())
+
+	@traced
 	def _parse_blessed_oath_flag(my, api_data=[]):
 		"""Returns a list of Flower Knights that can perform Blessed Eternal Oath."""
-		my.bless_oath = [BlessedOathLookup(entry) for entry in api_data if entry.split(',')[2] == '1']
+		my.bless_oath = LazyEntryList(BlessedOathLookup, [entry for entry in api_data if entry.split(',')[2] == '1'])
 
+	@traced
 	def load_getMaster(my):
 		"""Loads and parses getMaster.
 
@@ -217,7 +417,7 @@ class MasterData(object):
 
 		if loader.master_text:
 			# Parse data from the old format as a massive CSV string
-			mt = loader.master_text
+			mt = loader.master_text_index
 			
 			data_skill = my.masterTexts['masterSkill'] = my._extract_section('masterCharacterSkill', mt)
 			data_abil = my.masterTexts['masterAbility'] = my._extract_section('masterCharacterLeaderSkill', mt)
@@ -340,27 +540,23 @@ class MasterData(object):
 
 			If the set doesn't exist in the dict, it is initialized.
 			If the flower knight is already in the dict, nothing happens.
-
-			Returns the set with the knight added.
+			The set is changed in place.
 			"""
 
 			if val not in knight_dict:
 				knight_dict[val] = set()
-			return knight_dict[val].union([knight])
+			knight_dict[val].add(knight)
 
 		knights_by_date = {}
 		for knight in my.knights.values():
-			date = knight.tiers[1]['date0']; knights_by_date[date] = add_to_set(knights_by_date, knight, date)
-			date = knight.tiers[1]['date1']; knights_by_date[date] = add_to_set(knights_by_date, knight, date)
+			add_to_set(knights_by_date, knight, knight.tiers[1]['date0'])
 			try:
-				date = knight.tiers[2]['date0']; knights_by_date[date] = add_to_set(knights_by_date, knight, date)
-				date = knight.tiers[2]['date1']; knights_by_date[date] = add_to_set(knights_by_date, knight, date)
+				add_to_set(knights_by_date, knight, knight.tiers[2]['date0'])
 			except KeyError:
 				# This must be a skin-only flower knight. They do not evolve.
 				pass
 			if knight.bloomability != FlowerKnight.NO_BLOOM:
-				date = knight.tiers[3]['date0']; knights_by_date[date] = add_to_set(knights_by_date, knight, date)
-				date = knight.tiers[3]['date1']; knights_by_date[date] = add_to_set(knights_by_date, knight, date)
+				add_to_set(knights_by_date, knight, knight.tiers[3]['date0'])
 
 		return knights_by_date
 
@@ -377,7 +573,8 @@ class MasterData(object):
 			knight_id = int(knight.charID2)
 		else:
 			knight_id = int(knight)
-		return [equip for equip in my.equipment if knight_id in equip.get_owner_ids()]
+		return [my.equipment[index] for index in \
+			my.equipment_by_owner.get(knight_id, [])]
 
 	def choose_knights_by_date(my):
 		"""Gets a list of FlowerKnight instances based on their date.
@@ -527,9 +724,8 @@ class MasterData(object):
 		# Either we found the full name based on the ID or it was passed in.
 		fullName = fullName or str(char_name_or_id)
 		# Search for all evolution tiers for the character.
-		def same_name(entry):
-			return entry.fullName == fullName
-		entries = list(filter(same_name, my.characters.values()))
+		entries = [my.characters[char_id] for char_id in \
+			my.characters_by_name.get(fullName, [])]
 		if len(entries) < 2 or len(entries) > 3:
 			print('Warning: No character by that name has 2~3 evolution stages.')
 			return []
@@ -548,8 +744,9 @@ class MasterData(object):
 		elif type(name_or_id) is int or name_or_id.isdigit():
 			# char_name_or_id was the character's ID.
 			# Find the one entry for this character.
-			matching_knights = [k for k in my.knights.values() \
-				if k.has_id(name_or_id)]
+			matching_knights = [my.knights[name] for name in \
+				my.knights_by_id.get(str(name_or_id), []) \
+				if my.knights[name].has_id(name_or_id)]
 			if len(matching_knights) == 1:
 				return matching_knights[0]
 			elif not len(matching_knights):
@@ -1,5 +1,7 @@
 #!/usr/bin/python
 # coding=utf-8
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
 from common import *
 
 __doc__ = """Parses the mastershyncData which holds FMs and maybe more.
@@ -9,6 +11,11 @@ Stores collective data for individual flower memories (FMs).
 FM data is stored in a section of the masterData called masterSyncData.
 Unlike other masterData sections, this section is layered like JSON.
 It's not valid JSON though; they use single quotes instead of double quotes.
+
+SyncDataStore reads the section once and splits it into one SyncTable per
+tableName. Each table is indexed by id. Rows are only turned into typed
+SyncTable.Row instances, and tables are only indexed by itemId or other
+keys, when they are first used.
 """
 
 # This is an example of the decoded masterSyncData after prettifying as JSON.
@@ -210,6 +217,151 @@ sample_pretty_input = """
 ]
 """.strip()
 
+class SyncTable(object):
+    """The rows of one table of masterSyncData, looked up by id.
+
+    Each row is a namedtuple whose fields are the table's keys, e.g.
+    store['master_flower_memorys'][1].itemId. Keys that are not valid
+    field names, like 'class', are renamed to _1, _2, etc. by their
+    position. Iterating a table gives its
+    rows in order, unlike a dict which would give its keys.
+    Rows that share an id are merged. Later values replace earlier ones.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # The raw dict of each row, keyed by id.
+        self.raw = OrderedDict()
+        self.Row = None
+        # The original key of each field of Row.
+        self._keys = []
+        self._rows = {}
+        self._indexes = {}
+
+    def __repr__(self):
+        return 'SyncTable({0!r}, {1} rows)'.format(self.name, len(self.raw))
+
+    def add_rows(self, rows):
+        """Adds or merges a list of row dicts from masterSyncData."""
+        for row in rows:
+            old = self.raw.get(row['id'])
+            if old is None:
+                self.raw[row['id']] = dict(row)
+            else:
+                old.update(row)
+                self._rows.pop(row['id'], None)
+        # The fields and indexes may have changed.
+        self.Row = None
+        self._indexes = {}
+
+    def _get_row_type(self):
+        if self.Row is None:
+            fields = OrderedDict()
+            for row in self.raw.values():
+                for key in row:
+                    fields[key] = True
+            self._keys = list(fields)
+            self.Row = namedtuple('Row', self._keys, rename=True)
+            self._rows = {}
+        return self.Row
+
+    def __getitem__(self, row_id):
+        try:
+            return self._rows[row_id]
+        except KeyError:
+            pass
+        Row = self._get_row_type()
+        raw = self.raw[row_id]
+        row = self._rows[row_id] = Row(*[raw.get(key) for key in self._keys])
+        return row
+
+    def __iter__(self):
+        for row_id in self.raw:
+            yield self[row_id]
+
+    def __len__(self):
+        return len(self.raw)
+
+    def keys(self):
+        return self.raw.keys()
+
+    def items(self):
+        return [(row_id, self[row_id]) for row_id in self.raw]
+
+    def values(self):
+        return list(self)
+
+    def __contains__(self, row_id):
+        return row_id in self.raw
+
+    def get(self, row_id, default=None):
+        return self[row_id] if row_id in self.raw else default
+
+    def get_index(self, key):
+        """Groups the rows by one of their keys.
+
+        @param key: String. A key of the rows, like 'itemId'.
+        @returns A dict of values of the key to lists of rows.
+        """
+
+        if key not in self._indexes:
+            index = {}
+            for row_id, row in self.raw.items():
+                index.setdefault(row.get(key), []).append(row_id)
+            self._indexes[key] = index
+        return {value: [self[row_id] for row_id in row_ids] \
+            for value, row_ids in self._indexes[key].items()}
+
+    def find(self, key, value):
+        """Gets the list of rows whose key has a value."""
+        if key not in self._indexes:
+            self.get_index(key)
+        return [self[row_id] for row_id in self._indexes[key].get(value, [])]
+
+    def get_by_item_id(self, item_id):
+        """Gets the row of an itemId, or None."""
+        rows = self.find('itemId', int(item_id))
+        return rows[-1] if rows else None
+
+class SyncDataStore(Mapping):
+    """A dict of the tables of masterSyncData, keyed by tableName."""
+
+    def __init__(self, list_of_dicts=[]):
+        """Constructor.
+
+        @param list_of_dicts: The decoded masterSyncData section.
+        """
+
+        self.tables = OrderedDict()
+        for table in list_of_dicts:
+            # The section has empty entries between the tables.
+            if not table:
+                continue
+            name = table['tableName']
+            if name not in self.tables:
+                self.tables[name] = SyncTable(name)
+            self.tables[name].add_rows(table.get('data', []))
+
+    def __repr__(self):
+        return 'SyncDataStore({0})'.format(', '.join(self.tables))
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def get_table(self, name):
+        """Gets a table. A missing table is an empty SyncTable."""
+        return self.tables.get(name) or SyncTable(name)
+
+    @property
+    def flower_memories(self):
+        return self.get_table('master_flower_memorys')
+
 class SyncDataParser(object):
     def __init__(self, list_of_dicts=[]):
         self.synced = self.parse(list_of_dicts)
@@ -222,42 +374,9 @@ class SyncDataParser(object):
         print(to_say)
 
     def parse(self, list_of_dicts):
-        out_all_tables = {}
-        """Parses the masterSyncData and saves the result as a class var."""
-        # self._debug_explain(list_of_dicts, 'list_of_dicts')
-        for in_inner_dict in list_of_dicts:
-            # Note: We only expect a table named "master_flower_memorys"
-            in_table_name = in_inner_dict['tableName']
-            out_this_table = {}
-            if in_table_name in out_all_tables:
-                out_this_table = out_all_tables[in_table_name]
-            else:
-                out_all_tables[in_table_name] = out_this_table 
-
-            # self._debug_explain(in_inner_dict, 'in_inner_dict #' + str(idx))
-            # Although there may be multiple keys, we only care about "data"
-            # self._debug_explain(in_inner_dict['data'][0],
-            #     'in_inner_dict[\'data\'][0] is ' + \
-            #     str(in_inner_dict['data'][0]))
-            in_deepest_list_of_dicts = in_inner_dict['data']
-            # There should be a ton of list entries here. All are dicts
-            for in_data_dict in in_deepest_list_of_dicts:
-                # self._debug_explain(in_data_dict, 'in_data_dict is ' + \
-                #     str(in_data_dict))
-                # These are the data entries we need to save
-
-                # Chances are, this is the ID of an FM
-                in_item_id = in_data_dict['id']
-
-                # Init this table if necessary
-                # It might be like out_all_tables['master_flower_memorys']['3']
-                out_id_to_data = {}
-                if in_item_id in out_this_table:
-                    out_id_to_data = out_this_table[in_item_id]
-                else:
-                    out_this_table[in_item_id] = out_id_to_data
-
-                # in_data_dict is an example of a DEEPEST internal entry
-                for key, val in in_data_dict.items():
-                    out_id_to_data[key] = val
-        return out_all_tables
+        """Parses the masterSyncData into dicts of table names to dicts of
+        row ids to row dicts.
+        """
+
+        store = SyncDataStore(list_of_dicts)
+        return {name: table.raw for name, table in store.items()}
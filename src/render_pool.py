@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+# coding: utf-8
+import os
+import time
+import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import tracing
+from tracing import span
+
+__doc__ = """Renders many module pages of the master data at the same time.
+
+Every page is made from the master data alone, so pages can be made by
+separate processes. Where processes can be forked, every entry and flower
+knight is made in the parent first, and the workers inherit them. Elsewhere,
+the MasterData is pickled once and each worker unpickles it when it starts.
+Pickles only keep the CSV lines of the entries, so these workers make each
+entry that they use again. Either way, the getMaster files are not read
+again.
+
+When tracing is on, each worker sends its spans back with its pages. They
+are added under the "Render pages" span of the main process.
+
+A worker makes its pages one after another from the same MasterData. With
+one worker or one page, they are made from the caller's own MasterData.
+Making a page does not change the values of the entries, so a page is the
+same whichever pages were made before it.
+
+The pages are handed to the workers in the order they are given. Put the
+slowest pages first so that they do not start last and hold up the rest.
+Then the total time approaches the time of the slowest page.
+
+Usage:
+pool = RenderPool(master_data)
+texts = pool.render({'skills': ('get_skill_list_page', ()),
+	'nation1': ('get_master_char_data_nation_page', ('1',))})
+"""
+
+# The MasterData of a worker process.
+_master_data = None
+# Whether this is a worker process, which sends its spans back.
+_is_worker = False
+
+def _init_worker(snapshot=None):
+	"""Sets up a worker process.
+
+	@param snapshot: Bytes. The pickled MasterData, or None if the worker
+		was forked and already has it.
+	"""
+
+	global _master_data, _is_worker
+	_is_worker = True
+	# Forked workers start with a copy of the parent's spans. Drop them.
+	tracing.take_events()
+	if snapshot is not None:
+		_master_data = pickle.loads(snapshot)
+
+def _render(page, args, filename=None):
+	"""Makes a page in a worker process.
+
+	@param page: String. The name of a MasterDataOutputter page method.
+	@param args: A tuple of the method's arguments.
+	@param filename: String. If given, the page is written to this file
+		piece by piece and is not returned.
+	@returns A tuple of (the page's text or None, seconds taken, the spans
+		of a worker process from tracing.take_events() or None).
+	"""
+
+	start = time.time()
+	with span('Render page', page=page):
+		if filename:
+			with open(filename, 'w', encoding='utf-8') as outfile:
+				_master_data.outputter.write_page(outfile, page, *args)
+			text = None
+		else:
+			text = getattr(_master_data.outputter, page)(*args)
+	return text, time.time() - start, \
+		tracing.take_events() if _is_worker else None
+
+class RenderPool(object):
+	"""Renders pages of one MasterData with a pool of worker processes."""
+
+	def __init__(my, master_data, workers=None):
+		"""Constructor.
+
+		@param master_data: The loaded MasterData to make pages from.
+		@param workers: Integer. The most worker processes to use.
+			Defaults to the number of CPUs. With 1, pages are made in
+			this process one after another.
+		"""
+
+		my.master_data = master_data
+		my.workers = workers or os.cpu_count() or 1
+		# The seconds that each page took, by key, from the last call.
+		my.times = {}
+
+	def _get_context(my):
+		"""Gets the multiprocessing context and the worker's arguments."""
+		if 'fork' in multiprocessing.get_all_start_methods():
+			global _master_data
+			# Forked workers see this without it being copied. Make every
+			# entry now, or each worker makes its own.
+			my.master_data.make_all_entries()
+			_master_data = my.master_data
+			return multiprocessing.get_context('fork'), (None,)
+		return multiprocessing.get_context(), (pickle.dumps(my.master_data,
+			pickle.HIGHEST_PROTOCOL),)
+
+	def iter_results(my, pages, folder=None):
+		"""Makes pages and yields each one as soon as it is done.
+
+		@param pages: A dict of keys to (page method name, args tuple).
+			The keys are anything that names the page for the caller.
+		@param folder: String. If given, each page is written to the file
+			"<key>.txt" in it instead of being returned.
+		@returns A generator of tuples of (key, text, error). The text is
+			None if the page was written to a file or it failed. The error
+			is the exception of a failed page, or None.
+		"""
+
+		my.times = {}
+		if folder:
+			os.makedirs(folder, exist_ok=True)
+
+		def get_filename(key):
+			return os.path.join(folder, '{0}.txt'.format(key)) if folder \
+				else None
+
+		global _master_data
+		if my.workers == 1 or len(pages) < 2:
+			_master_data = my.master_data
+			with span('Render pages', workers=1):
+				for key, (page, args) in pages.items():
+					try:
+						text, my.times[key], events = _render(page, args,
+							get_filename(key))
+					except Exception as error:
+						yield key, None, error
+					else:
+						yield key, text, None
+			return
+
+		workers = min(my.workers, len(pages))
+		with span('Render pages', workers=workers):
+			context, initargs = my._get_context()
+			with ProcessPoolExecutor(workers, context, _init_worker,
+				initargs) as pool:
+				futures = {pool.submit(_render, page, args,
+					get_filename(key)):key for key, (page, args) in pages.items()}
+				for future in as_completed(futures):
+					key = futures[future]
+					try:
+						text, my.times[key], events = future.result()
+					except Exception as error:
+						yield key, None, error
+					else:
+						if events:
+							tracing.add_events(*events)
+						yield key, text, None
+
+	def render(my, pages):
+		"""Makes pages and collects their texts.
+
+		@param pages: See iter_results().
+		@returns A dict of the keys to texts, in the order of pages.
+		@raises The exception of the first page that failed.
+		"""
+
+		texts = {}
+		for key, text, error in my.iter_results(pages):
+			if error:
+				raise error
+			texts[key] = text
+		return {key:texts[key] for key in pages}
@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 # coding: utf-8
-import os, sys, re, requests
+import os, sys, re
+from http_cache import http_cache
 
 mainurl = "http://フラワーナイトガール.攻略wiki.com/index.php?"
 output_dir = "outputs"
@@ -37,7 +38,7 @@ class GenerateSeasonalQuote(object):
 		]
 		
 	def initModuleTextList(my):
-		module = requests.get(charaModule).text
+		module = http_cache.get_text(charaModule)
 		if my.manualFlag:
 			my.charaList = manualCharaList
 		else:
@@ -60,11 +61,9 @@ class GenerateSeasonalQuote(object):
 	
 	def downloadText(my, charaName):
 		notice = "Processing " + charaName
-		dltext = requests.get(mainurl + charaName).text
+		dltext, redirect = http_cache.get_jp_wiki_page(mainurl, charaName)
 
-		if dltext.find('<div class="ie5">') == -1 :
-			redirect = charaName.replace("(","（").replace(")","）")
-			dltext  = requests.get(mainurl + redirect).text
+		if redirect:
 			notice  += ".redirected -> " + redirect
 		
 		textdata = (dltext.replace('\r','').replace('\n','')
@@ -0,0 +1,246 @@
+#!/usr/bin/python3
+# coding: utf-8
+import os
+import json
+import atexit
+import threading
+import multiprocessing
+from time import perf_counter_ns
+from itertools import count
+from functools import wraps
+
+__doc__ = """Times the slow parts of a run and saves them as a trace.
+
+Tracing is off unless the FKG_TRACE environment variable is set. Set it to
+1 to save the trace to outputs/trace.json, or to the filename to save to.
+For example: FKG_TRACE=1 python main.py -l
+
+When tracing is off, traced() returns functions as they are and span()
+returns a shared context manager that does nothing.
+
+When tracing is on, each span records its start, end and thread.
+The trace is saved when the script exits. Open the .json file in Chrome's
+chrome://tracing or in https://ui.perfetto.dev to see a timeline.
+The .txt file next to it sums up the time of each span by name. It also
+lists the critical path: the spans that ran one after another on the main
+thread, each followed by its longest child span, and so on down.
+
+Worker processes record their own spans. RenderPool sends them back to the
+main process with each page. add_events() puts them under the span that was
+waiting on the workers, so the pages show up in the critical path.
+
+Usage:
+@traced
+def parse_something(): ...
+
+with span('Download', url=url):
+	...
+"""
+
+DEFAULT_TRACE_FILENAME = os.path.join('outputs', 'trace.json')
+
+_setting = os.environ.get('FKG_TRACE', '')
+ENABLED = _setting not in ('', '0')
+TRACE_FILENAME = DEFAULT_TRACE_FILENAME if _setting in ('', '0', '1') \
+	else _setting
+
+# Finished spans as tuples of
+# (id, parent id, name, process id, thread id, start ns, end ns, args dict).
+_events = []
+# The names of threads, keyed by (process id, thread id).
+_thread_names = {}
+_ids = count(1)
+_local = threading.local()
+
+class _NullSpan(object):
+	"""The span that is used when tracing is off."""
+
+	def __enter__(my):
+		return my
+
+	def __exit__(my, *exc_info):
+		return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span(object):
+	__slots__ = ('name', 'args', 'id', 'parent', 'start')
+
+	def __init__(my, name, args):
+		my.name = name
+		my.args = args
+
+	def __enter__(my):
+		stack = getattr(_local, 'stack', None)
+		if stack is None:
+			stack = _local.stack = []
+		my.parent = stack[-1] if stack else 0
+		my.id = next(_ids)
+		stack.append(my.id)
+		my.start = perf_counter_ns()
+		return my
+
+	def __exit__(my, *exc_info):
+		end = perf_counter_ns()
+		_local.stack.pop()
+		thread = threading.current_thread()
+		pid = os.getpid()
+		_thread_names[(pid, thread.ident)] = thread.name
+		_events.append((my.id, my.parent, my.name, pid, thread.ident,
+			my.start, end, my.args))
+		return False
+
+def span(name, **args):
+	"""Times a block of code.
+
+	@param name: String. What the block does. Spans are summed by name.
+	@param args: Extra values to show with the span in the timeline.
+	@returns A context manager.
+	"""
+
+	if not ENABLED:
+		return _NULL_SPAN
+	return _Span(name, args)
+
+def traced(func_or_name=None):
+	"""Decorates a function so that each call is a span.
+
+	It can be used as @traced or as @traced('Span name').
+	The span's name defaults to the function's qualified name.
+	"""
+
+	def decorate(func, name=None):
+		if not ENABLED:
+			return func
+		name = name or func.__qualname__
+
+		@wraps(func)
+		def traced_func(*args, **kwargs):
+			with _Span(name, {}):
+				return func(*args, **kwargs)
+		return traced_func
+
+	if callable(func_or_name):
+		return decorate(func_or_name)
+	return lambda func: decorate(func, func_or_name)
+
+def take_events():
+	"""Removes the spans recorded so far and returns them.
+
+	Worker processes send these to the main process for add_events().
+
+	@returns A tuple of (list of spans, dict of thread names).
+	"""
+
+	global _events, _thread_names
+	events, thread_names = _events, _thread_names
+	_events, _thread_names = [], {}
+	return events, thread_names
+
+def add_events(events, thread_names):
+	"""Adds the spans of another process.
+
+	The spans get new IDs. Its top-level spans go under the span that is
+	open in this thread, if any.
+
+	@param events: The spans from take_events().
+	@param thread_names: The thread names from take_events().
+	"""
+
+	if not events:
+		return
+	stack = getattr(_local, 'stack', None)
+	ids = {0: stack[-1] if stack else 0}
+	for event in events:
+		ids[event[0]] = next(_ids)
+	for span_id, parent, name, pid, tid, start, end, args in events:
+		_events.append((ids[span_id], ids.get(parent, ids[0]), name, pid, tid,
+			start, end, args))
+	_thread_names.update(thread_names)
+
+def get_trace_events():
+	"""Converts the recorded spans to Chrome trace events.
+
+	@returns A list of dicts. Times are in microseconds.
+	"""
+
+	origin = min(event[5] for event in _events) if _events else 0
+	trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+		'args': {'name': name}} for (pid, tid), name in _thread_names.items()]
+	for span_id, parent, name, pid, tid, start, end, args in _events:
+		trace.append({'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+			'ts': (start - origin) / 1000.0, 'dur': (end - start) / 1000.0,
+			'args': {key: str(value) for key, value in args.items()}})
+	return trace
+
+def get_summary():
+	"""Sums up the recorded spans as text.
+
+	@returns A string with a table of the spans by name and the critical
+		path.
+	"""
+
+	children = {}
+	for event in _events:
+		children.setdefault(event[1], []).append(event)
+	totals = {}
+	for event in _events:
+		duration = event[6] - event[5]
+		# Children in other threads or processes ran alongside it.
+		child_time = sum(child[6] - child[5] \
+			for child in children.get(event[0], []) \
+			if child[3:5] == event[3:5])
+		calls, total, self_time, longest = totals.get(event[2], (0, 0, 0, 0))
+		totals[event[2]] = (calls + 1, total + duration,
+			self_time + duration - child_time, max(longest, duration))
+
+	lines = ['{0:>8} {1:>12} {2:>12} {3:>12}  {4}'.format('Calls',
+		'Total ms', 'Self ms', 'Longest ms', 'Span')]
+	for name, (calls, total, self_time, longest) in sorted(totals.items(),
+		key=lambda item: -item[1][1]):
+		lines.append('{0:>8} {1:>12.1f} {2:>12.1f} {3:>12.1f}  {4}'.format(
+			calls, total / 1e6, self_time / 1e6, longest / 1e6, name))
+
+	# The main thread's top-level spans run one after another, so together
+	# they are the critical path. Under each, follow its longest child.
+	lines += ['', 'Critical path:']
+	main_thread = (os.getpid(), threading.main_thread().ident)
+	for root in sorted((event for event in children.get(0, []) \
+		if event[3:5] == main_thread), key=lambda event: event[5]):
+		event = root
+		depth = 0
+		while event:
+			lines.append('{0}{1} ({2:.1f} ms)'.format('  ' * depth, event[2],
+				(event[6] - event[5]) / 1e6))
+			level = children.get(event[0])
+			event = level and max(level, key=lambda event: event[6] - event[5])
+			depth += 1
+	return '\n'.join(lines) + '\n'
+
+def save(filename=None):
+	"""Saves the trace and its summary.
+
+	@param filename: String. The trace's filename. The summary goes in the
+		same place with a .txt extension. Defaults to TRACE_FILENAME.
+	"""
+
+	filename = filename or TRACE_FILENAME
+	folder = os.path.dirname(filename)
+	if folder:
+		os.makedirs(folder, exist_ok=True)
+	with open(filename, 'w', encoding='utf-8') as outfile:
+		json.dump({'traceEvents': get_trace_events(),
+			'displayTimeUnit': 'ms'}, outfile)
+	summary_filename = os.path.splitext(filename)[0] + '.txt'
+	with open(summary_filename, 'w', encoding='utf-8') as outfile:
+		outfile.write(get_summary())
+	print('Saved the trace to {0} and {1}'.format(filename, summary_filename))
+
+def _save_at_exit():
+	# Worker processes have their own spans. Only the main process saves,
+	# so that the workers do not overwrite its trace.
+	if _events and multiprocessing.parent_process() is None:
+		save()
+
+if ENABLED:
+	atexit.register(_save_at_exit)
@@ -2,7 +2,7 @@
 # coding: utf-8
 import codecs
 import sys
-import requests
+from http_cache import http_cache
 try:
 	from bs4 import BeautifulSoup
 except ImportError:
@@ -442,8 +442,7 @@ def get_sheets_page(url=SRC_URL, infilename=u'', outfilename=None, quiet=True):
 		# We are given a source URL. Download the web page as input.
 		if not quiet:
 			print('Retrieving the webpage content.')
-		response = requests.get(url)
-		full_text = response.content
+		full_text = http_cache.get(url).content
 	if not quiet:
 		print('Parsing the data.')
 	soup = BeautifulSoup(full_text, 'html.parser')
@@ -2,6 +2,7 @@
 # -*- coding: utf-8  -*-
 import os
 import json
+import time
 import pywikibot
 from pywikibot import i18n
 from pywikibot.bot import SingleSiteBot
@@ -9,35 +10,140 @@ from pathlib import Path
 from common import nationList
 import parse_master
 import update_flower_meaning
+from master_snapshot import MasterSnapshot
+from offline_wiki import OfflineSite, OfflinePage, OFFLINE_FOLDER
+from render_pool import RenderPool
 import sys
 
 json_data = {}
 
+EQUIPMENT_NAMES_MODULE = u'Module:Equipment/Names'
+
+class SaveQueue(object):
+    """Saves accepted edits one at a time at a steady rate.
+
+    Each save waits until `interval` seconds passed since the last one.
+    The wiki is asked to refuse edits while its database lag is over
+    `maxlag` seconds. pywikibot waits and retries these edits by itself.
+    If it gives up, the edit goes to the back of the queue so the other
+    edits are tried first.
+    """
+
+    # The seconds between saves. It matches pywikibot's put_throttle.
+    INTERVAL = 10.0
+    # The database lag in seconds at which the wiki refuses edits.
+    MAXLAG = 5
+    # The number of times an edit is put back after a maxlag timeout.
+    RETRIES = 3
+
+    def __init__(my, interval=INTERVAL, maxlag=MAXLAG, retries=RETRIES):
+        my.interval = interval
+        my.maxlag = maxlag
+        my.retries = retries
+        my.edits = []
+        my._last_save = None
+
+    def put(my, page, text, comment, minorEdit=True, botflag=True):
+        """Queues an edit. Nothing is saved until run() is called."""
+        my.edits.append((page, text, comment, minorEdit, botflag, 0))
+
+    def _wait(my):
+        if my._last_save is not None:
+            delay = my._last_save + my.interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        my._last_save = time.monotonic()
+
+    def run(my):
+        """Saves every queued edit.
+
+        @returns A list of the pages that were saved.
+        """
+
+        pywikibot.config.maxlag = my.maxlag
+        saved = []
+        while my.edits:
+            page, text, comment, minorEdit, botflag, tries = my.edits.pop(0)
+            my._wait()
+            try:
+                page.text = text
+                page.save(summary=comment, minor=minorEdit, botflag=botflag)
+            except pywikibot.exceptions.MaxlagTimeoutError:
+                if tries < my.retries:
+                    pywikibot.output(u'The wiki is lagging. Retrying %s later.'
+                                     % page.title())
+                    my.edits.append((page, text, comment, minorEdit,
+                                     botflag, tries + 1))
+                else:
+                    pywikibot.output(u'Skipping %s because the wiki kept lagging.'
+                                     % page.title())
+            except pywikibot.exceptions.LockedPageError:
+                pywikibot.output(u"Page %s is locked; skipping."
+                                 % page.title(asLink=True))
+            except pywikibot.exceptions.EditConflictError:
+                pywikibot.output(
+                    u'Skipping %s because of edit conflict'
+                    % (page.title()))
+            except pywikibot.exceptions.SpamblacklistError as error:
+                pywikibot.output(
+                    u'Cannot change %s because of spam blacklist entry %s'
+                    % (page.title(), error.url))
+            else:
+                saved.append(page)
+        return saved
+
 class ListUpdaterBot(object):
-    def __init__(my):
+    # The number of pages fetched by each bulk request in batch mode.
+    GROUP_SIZE = 50
+
+    def __init__(my, site=None):
+        """Constructor.
+
+        @param site: A pywikibot Site or an OfflineSite.
+            If None, the bot logs into the Wikia.
+        """
+
         my.master_data = parse_master.MasterData()
-        my.site = pywikibot.Site('en','fkg')
-        my.site.login(False, 'NazunaBot')
+        if site is None:
+            site = pywikibot.Site('en','fkg')
+            site.login(False, 'NazunaBot')
+        my.site = site
         my.comment = u'Automatic update by bot.'
-        my.externalBot = True
+        # Offline sites are edited directly instead of through the JSON file.
+        my.externalBot = not isinstance(site, OfflineSite)
         my.dry = False
         my.verbose = True
         my.json_dir = Path(r'X:\AHPP Exteria\fleur\research\api\FKGProcessing-master\voice\jsnode\editlist.json')
+        # When True, every module is made and compared with the Wikia.
+        my.force = False
+        # The most worker processes that make modules at once.
+        # None uses every CPU.
+        my.workers = None
+        # Each module maps to the MasterDataOutputter method that makes its
+        # text and the master data sections that the text is made from.
+        # Modules are only made when they are needed. The slowest modules
+        # are first so that they are started first.
         my.moduleList = {
-            'Module:MasterCharacterData':my.master_data.get_master_char_data_page(),
-            'Module:KnightIdAndName/Data':my.master_data.outputter.get_char_list_page(),
-            'Module:SkillList':my.master_data.get_skill_list_page(),
-            'Module:BundledAbilityList':my.master_data.get_bundled_ability_list_page(),
-            'Module:BlessedOathList':my.master_data.outputter.get_eternal_oath_page(),
-            'Module:Skin/Data':my.master_data.outputter.get_skin_info_page(),
-            'Module:FlowerMemories/Data':my.master_data.get_flower_memories_list_page(),
-            'Module:FlowerMemories/AbilityData':my.master_data.get_flower_memories_abilities_page(),
-            'Module:Equipment/Data':my.master_data.get_equipment_list_page(),
-            'Module:Equipment/StatsData':my.master_data.get_equipment_stats_list_page(),
-            'Module:Equipment/OwnerData':my.master_data.get_user_equip_list_page(),
-            'Module:Equipment/LookupData':my.master_data.get_personal_equip_list_page(),
+            'Module:MasterCharacterData':('get_master_char_data_page', ['characters']),
+            'Module:KnightIdAndName/Data':('get_char_list_page', ['characters']),
+            'Module:SkillList':('get_skill_list_page', ['skills']),
+            'Module:BundledAbilityList':('get_bundled_ability_list_page', ['abilities']),
+            'Module:BlessedOathList':('get_eternal_oath_page', ['bless_oath']),
+            'Module:Skin/Data':('get_skin_info_page', ['skins']),
+            'Module:FlowerMemories/Data':('get_flower_memories_list_page', ['flower_memories']),
+            'Module:FlowerMemories/AbilityData':('get_flower_memories_abilities_page', ['memory_abilities']),
+            'Module:Equipment/Data':('get_equipment_list_page', ['equipment']),
+            'Module:Equipment/StatsData':('get_equipment_stats_list_page', ['equipment']),
+            'Module:Equipment/OwnerData':('get_user_equip_list_page', ['equipment']),
+            'Module:Equipment/LookupData':('get_personal_equip_list_page', ['equipment']),
         }
 
+    def get_page(my, title):
+        """Makes the Page of a title on the bot's site."""
+        if isinstance(my.site, OfflineSite):
+            return OfflinePage(my.site, title)
+        return pywikibot.Page(my.site, title)
+
     def checkPage(my, page):
         """Check if the page exists and returns ."""
         try:
@@ -46,51 +152,72 @@ class ListUpdaterBot(object):
             print("\nArticle {0} is empty, generating new page".format(page.title()))
             return ""
 
+    def enable_force(my):
+        my.force = True
+
     def save(my, text, page, comment=None, minorEdit=True,
              botflag=True):
-        """Update the given page with new text."""
+        """Update the given page with new text.
+
+        Returns True if the page was saved or already had the text.
+        Edits that are only written to the JSON file return False. They
+        count as saved once a later run finds the text on the Wikia.
+        """
         hasPage = my.checkPage(page)
         # only save if something was changed
-        if text != hasPage:
-            # Show the title of the page we're working on.
-            # Highlight the title in purple.
-            pywikibot.output(u"\n\n>>> <<lightpurple>>%s<<default>> <<<"
-                             % page.title())
-            # show what was changed if verbose mode is enabled.
-            if my.verbose : pywikibot.showDiff(hasPage, text)
-            pywikibot.output(u'Comment: %s' % comment)
-            if not my.dry:
-                if pywikibot.input_yn(
-                        u'Do you want to accept these changes?',
-                        default=False, automatic_quit=False):
-                    try:
-                        if my.externalBot:
-                            json_data[page.title()] = {
-                                "name":page.title(),
-                                "content":text,
-                                "dryrun":0,
-                                "liverun":0
-                            }
-                            my.output_json()
-                        else:
-                            page.text = text
-                            # Save the page
-                            page.save(summary=comment or my.comment,
-                            minor=minorEdit, botflag=botflag)
-                    except pywikibot.exceptions.LockedPageError:
-                        pywikibot.output(u"Page %s is locked; skipping."
-                                         % page.title(asLink=True))
-                    except pywikibot.exceptions.EditConflictError:
-                        pywikibot.output(
-                            u'Skipping %s because of edit conflict'
-                            % (page.title()))
-                    except pywikibot.exceptions.SpamblacklistError as error:
-                        pywikibot.output(
-                            u'Cannot change %s because of spam blacklist entry %s'
-                            % (page.title(), error.url))
+        if text == hasPage:
+            return True
+        else:
+            if my.review(page, hasPage, text, comment):
+                try:
+                    if my.externalBot:
+                        my.add_json(page, text)
+                        my.output_json()
+                        return False
                     else:
-                        return True
+                        page.text = text
+                        # Save the page
+                        page.save(summary=comment or my.comment,
+                        minor=minorEdit, botflag=botflag)
+                except pywikibot.exceptions.LockedPageError:
+                    pywikibot.output(u"Page %s is locked; skipping."
+                                     % page.title(asLink=True))
+                except pywikibot.exceptions.EditConflictError:
+                    pywikibot.output(
+                        u'Skipping %s because of edit conflict'
+                        % (page.title()))
+                except pywikibot.exceptions.SpamblacklistError as error:
+                    pywikibot.output(
+                        u'Cannot change %s because of spam blacklist entry %s'
+                        % (page.title(), error.url))
+                else:
+                    return True
         return
+
+    def review(my, page, old_text, text, comment=None):
+        """Shows what an edit changes and asks whether to make it.
+
+        @returns True if the edit was accepted. Dry runs never accept.
+        """
+
+        # Show the title of the page we're working on.
+        # Highlight the title in purple.
+        pywikibot.output(u"\n\n>>> <<lightpurple>>%s<<default>> <<<"
+                         % page.title())
+        # show what was changed if verbose mode is enabled.
+        if my.verbose : pywikibot.showDiff(old_text, text)
+        pywikibot.output(u'Comment: %s' % comment)
+        return not my.dry and pywikibot.input_yn(
+            u'Do you want to accept these changes?',
+            default=False, automatic_quit=False)
+
+    def add_json(my, page, text):
+        json_data[page.title()] = {
+            "name":page.title(),
+            "content":text,
+            "dryrun":0,
+            "liverun":0
+        }
 		
     def enable_json(my):
         my.externalBot = True
@@ -101,41 +228,173 @@ class ListUpdaterBot(object):
             data.write(json.dumps(json_data, indent=4, sort_keys=True))
 
     def update_equipment_names(my):
-        page = pywikibot.Page(my.site, u'Module:Equipment/Names')
+        page = my.get_page(EQUIPMENT_NAMES_MODULE)
         text = my.master_data.get_new_equipment_names_page(page)
         my.save(text, page)
 
     def update_ingame_char_data_module(my):
         title = u'Module:MasterCharacterData/{0}'
         for n in nationList:
-            page = pywikibot.Page(my.site, title.format(nationList[n]))
+            page = my.get_page(title.format(nationList[n]))
             text = my.master_data.get_master_char_data_nation_page(n)
             my.save(text, page)
 
-    def update(my):
+    def load_snapshot(my):
+        """Makes a snapshot of the master data that knows what was published."""
+        old_snapshot = MasterSnapshot.load()
+        snapshot = MasterSnapshot.from_master_data(my.master_data)
+        if old_snapshot:
+            snapshot.modules = dict(old_snapshot.modules)
+        changes = snapshot.get_changed_rows(old_snapshot)
+        for section in sorted(changes):
+            print('{0} rows changed in {1}.'.format(len(changes[section]), section))
+        return snapshot
+
+    def render_modules(my, snapshot):
+        """Makes the text of every module that may need an update.
+
+        The modules are made at the same time by a RenderPool.
+
+        @returns A dict of module titles to texts, in moduleList's order.
+        """
+
+        modules = []
         for module in my.moduleList:
-            my.save(my.moduleList[module], pywikibot.Page(my.site, module))
+            # Skip modules whose sections are the same as when
+            # they were last published.
+            if not my.force and snapshot.is_current(module,
+                                                    my.moduleList[module][1]):
+                print('{0} is unchanged. Skipping.'.format(module))
+            else:
+                modules.append(module)
+        rendered = my.render(modules)
+
+        texts = {}
+        for module in modules:
+            text = rendered[module]
+            # The data changed, but not in a way that shows up in the
+            # module. The Wikia already has this text.
+            if not my.force and snapshot.is_published(module, text):
+                snapshot.mark_published(module, text, my.moduleList[module][1])
+                print('{0} has the same text. Skipping.'.format(module))
+                continue
+            texts[module] = text
+        return texts
+
+    def render(my, modules):
+        """Makes the texts of some modules at the same time.
+
+        @param modules: A list of titles in moduleList.
+        @returns A dict of the titles to texts.
+        """
+
+        return RenderPool(my.master_data, my.workers).render(
+            {module:(my.moduleList[module][0], ()) for module in modules})
+
+    def update(my):
+        snapshot = my.load_snapshot()
+        try:
+            texts = my.render_modules(snapshot)
+            for module in texts:
+                if my.save(texts[module], my.get_page(module)):
+                    snapshot.mark_published(module, texts[module],
+                                            my.moduleList[module][1])
+        finally:
+            snapshot.save()
         
         my.update_equipment_names()
         #my.update_ingame_char_data_module()
 
+    def update_batch(my, save_queue=None):
+        """Updates the modules like update(), but with bulk requests.
+
+        Every page is fetched in a few bulk requests. Then every diff is
+        shown and confirmed before anything is saved. The accepted edits
+        are saved through a SaveQueue, or written to the JSON file together.
+        Only the modules that were saved or already had their text are
+        marked as published.
+
+        @param save_queue: A SaveQueue. If None, a default one is used.
+        """
+
+        snapshot = my.load_snapshot()
+        try:
+            texts = my.render_modules(snapshot)
+            titles = list(texts) + [EQUIPMENT_NAMES_MODULE]
+            page_list = [my.get_page(title) for title in titles]
+            # The texts are loaded into these Page objects. They are kept
+            # by our titles, since pywikibot may spell titles differently
+            # and skips pages that it cannot load. Those load on first use.
+            for page in my.site.preloadpages(
+                    page_list, groupsize=ListUpdaterBot.GROUP_SIZE):
+                pass
+            pages = dict(zip(titles, page_list))
+            texts[EQUIPMENT_NAMES_MODULE] = \
+                my.master_data.get_new_equipment_names_page(
+                    pages[EQUIPMENT_NAMES_MODULE])
+
+            edits = []
+            for title in titles:
+                page = pages[title]
+                old_text = page.text if page.exists() else u''
+                if texts[title] == old_text:
+                    if title in my.moduleList:
+                        snapshot.mark_published(title, old_text,
+                                                my.moduleList[title][1])
+                elif my.review(page, old_text, texts[title], my.comment):
+                    edits.append(title)
+            if not edits:
+                return
+
+            if my.externalBot:
+                for title in edits:
+                    my.add_json(pages[title], texts[title])
+                my.output_json()
+                # The external bot makes these edits later. They are marked
+                # as published once a later run finds them on the Wikia.
+                saved = []
+            else:
+                save_queue = save_queue or SaveQueue()
+                for title in edits:
+                    save_queue.put(pages[title], texts[title], my.comment)
+                saved = save_queue.run()
+            saved = set(id(page) for page in saved)
+            for title in edits:
+                if id(pages[title]) in saved and title in my.moduleList:
+                    snapshot.mark_published(title, texts[title],
+                                            my.moduleList[title][1])
+        finally:
+            snapshot.save()
+
     def print_update(my):
+        texts = my.render(list(my.moduleList))
         for module in my.moduleList:
-            print(my.moduleList[module] + "\n\n")
+            print(texts[module] + "\n\n")
 
-        print(my.master_data.get_new_equipment_names_page(pywikibot.Page(my.site, u'Module:Equipment/Names')) + "\n\n")
+        print(my.master_data.get_new_equipment_names_page(my.get_page(EQUIPMENT_NAMES_MODULE)) + "\n\n")
 
 def run(argv=[]):
-    bot = ListUpdaterBot()
+    site = None
+    if '-o' in argv or '--offline' in argv:
+        site = OfflineSite(OFFLINE_FOLDER)
+    bot = ListUpdaterBot(site)
     if '-j' in argv or '--json' in argv:
         bot.enable_json()
+    if '-f' in argv or '--force' in argv:
+        bot.enable_force()
     if '-h' in argv or '--help' in argv:
         print('Updates the Wikia with these scripts and logging into a bot.')
         print('-h / --help: Prints this message.')
         print('-j / --json: Prints editlist.json for NodeJS bot.')
         print('-p / --image: Prints the updated modules.')
+        print('-f / --force: Updates every module, even unchanged ones.')
+        print('-b / --batch: Fetches every page at once and confirms every')
+        print('    change before saving them at a steady rate.')
+        print('-o / --offline: Edits the page files in {0} instead of the Wikia.'.format(OFFLINE_FOLDER))
     elif '-p' in argv or '--print' in argv:
         bot.print_update()
+    elif '-b' in argv or '--batch' in argv:
+        bot.update_batch()
     else:
         bot.update()
 
@@ -3,9 +3,13 @@
 import pywikibot
 import parse_master
 import requests
+import threading
 from pywikibot import i18n
 from update_lists import ListUpdaterBot
+from itertools import chain
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http_cache import http_cache
 #import os, sys, re, requests
 
 json_data = {}
@@ -13,6 +17,42 @@ json_data = {}
 #Retrieve the source text from japanese wiki
 wikiLink = "http://フラワーナイトガール.攻略wiki.com/index.php?"
 masterData = "outputs/getMaster.txt"
+# The number of knights whose quotes are made at the same time.
+WORKERS = 8
+# The number of English wiki pages fetched by each bulk request.
+GROUP_SIZE = 50
+# The messages of the knight that a worker thread is making.
+_worker = threading.local()
+
+def say(text):
+	"""Prints a message, or keeps it for later in a worker thread.
+
+	Workers must not print while the main thread shows a diff or asks
+	whether to save. Their messages are printed by the main thread along
+	with their edits.
+	"""
+
+	messages = getattr(_worker, 'messages', None)
+	if messages is None:
+		print(text)
+	else:
+		messages.append(text)
+
+def keepMessages(function, *args):
+	"""Calls a function in a worker thread and keeps what it says.
+
+	@returns A tuple of (the function's result, a list of messages).
+		If the function raises an error, the error gets the messages.
+	"""
+
+	_worker.messages = []
+	try:
+		return function(*args), _worker.messages
+	except Exception as error:
+		error.messages = _worker.messages
+		raise
+	finally:
+		_worker.messages = None
 
 class GenerateQuote(object):
 	def __init__(my):
@@ -137,17 +177,14 @@ class GenerateQuote(object):
 		retry = 5
 		for r in range(retry + 1):
 			try:
-				dltext = requests.get(wikiLink + charaName).text
+				dltext = http_cache.get_jp_wiki_page(wikiLink, charaName)[0]
 			except requests.RequestException as error:
 				if r < retry:
-					print(f"loading {charaName} attempt failed, retrying...")
+					say(f"loading {charaName} attempt failed, retrying...")
 				else:
-					print(f"Unable to load {charaName}")
-					print(type(error).__name__)
+					say(f"Unable to load {charaName}")
+					say(type(error).__name__)
 			else:
-				if dltext.find('<div class="ie5">') == -1 :
-					redirect = charaName.replace("(","（").replace(")","）")
-					dltext  = requests.get(wikiLink + redirect).text
 				return dltext.replace(' class="spacer" /','').replace(' class="style_td"','').replace('"','\\"')
 
 	def translateLink(my, inputText):
@@ -175,7 +212,7 @@ class GenerateQuote(object):
 		try:
 			return mylist[key]
 		except KeyError:
-			print(str(key) + " doesn't have text entry.")
+			say(str(key) + " doesn't have text entry.")
 			return ""
 
 	def addExceptions(my, inputText, CharaName):
@@ -327,17 +364,57 @@ def output_template(text, outfilename):
 def main():
 	ListUpdater = ListUpdaterBot()
 	site = pywikibot.Site()
-	flowerKnightList = list(pywikibot.Category(site, 'Category:6-Star').articles()) \
-	+ list(pywikibot.Category(site, 'Category:5-Star').articles()) \
-	+ list(pywikibot.Category(site, 'Category:4-Star').articles())
-	editorlist = []
+	# The categories are listed lazily so that pages load while they are read.
+	flowerKnightList = chain(pywikibot.Category(site, 'Category:6-Star').articles(),
+	pywikibot.Category(site, 'Category:5-Star').articles(),
+	pywikibot.Category(site, 'Category:4-Star').articles())
 
-	for page in flowerKnightList:
-		editorlist.append(verifyKnightQuote(page))
-	
-	for page in editorlist:
+	for page in iterKnightQuotes(site, flowerKnightList):
 		ListUpdater.save(page["text"], page["name"], page["comment"])
 
+def iterKnightQuotes(site, pages, workers=WORKERS):
+	"""Makes the quote edits of many knights at the same time.
+
+	The English wiki pages are fetched in bulk requests. Each page is passed
+	to a worker thread as soon as it arrives. The workers download the
+	Japanese wiki pages and make the new texts. The edits are yielded in
+	the order they finish, so they can be saved while others are still made.
+
+	@param site: The pywikibot Site of the pages.
+	@param pages: An iterable of pywikibot Pages of knights.
+	@param workers: Integer. The number of knights made at the same time.
+	@returns A generator of edit dicts. See verifyKnightQuote().
+	"""
+
+	# Load the master data before the workers all try to load it at once.
+	if not GenerateQuote.api_data: GenerateQuote.parseMasterData()
+
+	def getResult(future):
+		# This runs in the main thread between edits, so the workers'
+		# messages never interrupt a diff or a prompt.
+		try:
+			result, messages = future.result()
+		except Exception as error:
+			for message in getattr(error, 'messages', []): print(message)
+			print("Skipping {0}: {1}: {2}".format(futures[future].title(),
+				type(error).__name__, error))
+			return None
+		for message in messages: print(message)
+		return result
+
+	futures = {}
+	with ThreadPoolExecutor(max_workers=workers) as executor:
+		for page in site.preloadpages(pages, groupsize=GROUP_SIZE):
+			futures[executor.submit(keepMessages, verifyKnightQuote, page)] = page
+			# Pass on the edits that finished while the pages loaded.
+			for future in [future for future in futures if future.done()]:
+				result = getResult(future)
+				del futures[future]
+				if result: yield result
+		for future in as_completed(list(futures)):
+			result = getResult(future)
+			if result: yield result
+
 def verifyKnightQuote(page):
 	wikiText = page.get()
 	flowerKnightName = wikiText.partition("|JP = ")[2].partition("\n")[0].replace(' ','').replace('10thAnniversary','10th Anniversary')
@@ -365,7 +442,7 @@ def verifyKnightQuote(page):
 
 	appendChange = ''
 	if wikiText != text : appendChange = ' to be edited...'
-	print("{0} {1}{2}".format(flowerKnightName, page.title(),appendChange))
+	say("{0} {1}{2}".format(flowerKnightName, page.title(),appendChange))
 	return {"text": text, "name": page, "comment": comment}
 	#ListUpdater.save(text, page, comment)
 